@@ -0,0 +1,93 @@
+import pandas as pd
+
+# Loans the AI Advisor considers: every document received, nothing expired, nearly done
+SUGGESTION_MIN_PROGRESS = 95
+
+# Productivity: quick loans, only suggested while the whole queue fits in the budget
+PRODUCTIVITY_MAX_MINUTES = 10
+PRODUCTIVITY_MAX_TOTAL_MINUTES = 100
+
+# Efficiency: loans under the limit, suggested when their average stays within the target
+EFFICIENCY_LIMIT_MINUTES = 15
+EFFICIENCY_MAX_AVERAGE_MINUTES = 10
+
+# Effectiveness: young loans with a high chance of breaching the SLA
+EFFECTIVENESS_LIMIT_AGEING_DAYS = 2
+
+# Accuracy: number of most frequent error types named when there are more than this
+TOP_ERROR_TYPES = 3
+
+
+# Result of the advisor for one filtered frame; the *_rows attributes hold index labels.
+# held_rows are the loans that would be suggested but for an expired or expiring document.
+class AdvisorInsights:
+    def __init__(self, productivity_rows, productivity_total_minutes, efficiency_rows, efficiency_average_minutes,
+                 accuracy_rows, error_types, error_type_count, effectiveness_rows, loan_processors, held_rows):
+        self.productivity_rows = productivity_rows
+        self.productivity_total_minutes = productivity_total_minutes
+        self.efficiency_rows = efficiency_rows
+        self.efficiency_average_minutes = efficiency_average_minutes
+        self.accuracy_rows = accuracy_rows
+        self.error_types = error_types
+        self.error_type_count = error_type_count
+        self.effectiveness_rows = effectiveness_rows
+        self.loan_processors = loan_processors
+        self.held_rows = held_rows
+
+    def has_insights(self):
+        return len(self.productivity_rows) > 0 or len(self.efficiency_rows) > 0 or len(self.accuracy_rows) > 0
+
+
+# Error types by descending frequency, ties kept in order of first appearance
+def rank_error_types(error_types):
+    first_seen = pd.unique(error_types)
+    counts = error_types.value_counts(sort = False)
+    counts = counts.reindex(first_seen)
+    return list(counts.sort_values(ascending = False, kind = 'stable').index), list(first_seen)
+
+
+# `documents_current` flags the rows of `df` with no expired or expiring document; by default
+# the All Documents Expiration Status stored with the loans is used
+def compute_advisor_insights(df, documents_current = None):
+    if documents_current is None:
+        documents_current = (df["All Documents Expiration Status"] == "Not Expired").to_numpy()
+    ready = (df["All Documents Received Status"] == "Yes").to_numpy() & (df["Progress"] >= SUGGESTION_MIN_PROGRESS).to_numpy()
+    suggestion_df = df[ready & documents_current]
+    held_df = df[ready & ~documents_current]
+    index = suggestion_df.index.to_numpy()
+    minutes = suggestion_df["Expected Time to Complete (minutes)"].to_numpy()
+    ageing = suggestion_df["Ageing (days)"].to_numpy()
+    error_mask = (suggestion_df["Error Type"] != "No Error").to_numpy()
+
+    productivity_mask = minutes <= PRODUCTIVITY_MAX_MINUTES
+    productivity_total_minutes = int(minutes[productivity_mask].sum())
+    productivity_rows = index[productivity_mask] if productivity_total_minutes < PRODUCTIVITY_MAX_TOTAL_MINUTES else index[:0]
+
+    efficiency_mask = minutes < EFFICIENCY_LIMIT_MINUTES
+    efficiency_rows = index[:0]
+    efficiency_average_minutes = None
+    if efficiency_mask.any():
+        efficiency_average_minutes = int(minutes[efficiency_mask].mean())
+        if efficiency_average_minutes <= EFFICIENCY_MAX_AVERAGE_MINUTES:
+            efficiency_rows = index[efficiency_mask]
+
+    ranked_error_types, error_types = rank_error_types(suggestion_df["Error Type"][error_mask])
+    if len(ranked_error_types) > TOP_ERROR_TYPES:
+        error_types = ranked_error_types[:TOP_ERROR_TYPES]
+
+    # Named from the held loans when expired documents hold back every suggestion
+    named_df = suggestion_df if len(suggestion_df) > 0 else held_df
+    loan_processors = [str(name).split(' ', 1)[0] for name in pd.unique(named_df["Loan Processor"].dropna())]
+
+    return AdvisorInsights(
+        productivity_rows = productivity_rows,
+        productivity_total_minutes = productivity_total_minutes,
+        efficiency_rows = efficiency_rows,
+        efficiency_average_minutes = efficiency_average_minutes,
+        accuracy_rows = index[error_mask],
+        error_types = error_types,
+        error_type_count = len(ranked_error_types),
+        effectiveness_rows = index[ageing < EFFECTIVENESS_LIMIT_AGEING_DAYS],
+        loan_processors = loan_processors,
+        held_rows = held_df.index.to_numpy(),
+    )
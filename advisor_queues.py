@@ -0,0 +1,119 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from advisor import compute_advisor_insights
+from expiration import status_date
+from filter_engine import FilterSelection
+from instrumentation import span
+from metrics import KeyMetrics
+from result_cache import FilterResult, selection_key
+
+# Threads precomputing the processor queues. Filtering and the advisor spend most of their
+# time in numpy and pandas, which release the GIL for the heavy loops.
+DEFAULT_WORKERS = int(os.environ.get('LOAN_PIPELINE_ADVISOR_WORKERS', min(4, os.cpu_count() or 1)))
+
+logger = logging.getLogger(__name__)
+
+
+# Filter, metrics, advisor insights and milestone funnel of one selection on a snapshot
+def compute_filter_result(snapshot, selection):
+    day = status_date()
+    with span('filter'):
+        rows = snapshot['filter_index'].select(selection)
+        selected_data = snapshot.frame.iloc[rows]
+    with span('metrics'):
+        key_metrics = KeyMetrics(snapshot['metrics_cube'].counts(selection))
+    with span('advisor'):
+        advisor_insights = compute_advisor_insights(selected_data, snapshot['expiration'].documents_current(rows, day))
+    with span('funnel'):
+        funnel = snapshot['funnel'].summary(rows)
+    return FilterResult(snapshot.version, selection, rows, key_metrics, advisor_insights, funnel, day)
+
+
+# Cached result of `key` unless it was worked out for the document statuses of an earlier day
+def current_result(result_cache, key, peek = False):
+    result = result_cache.peek(key) if peek else result_cache.get(key)
+    if result is not None and result.status_date != status_date():
+        return None
+    return result
+
+
+# Selection a fresh session of each Loan Processor starts from
+def processor_selections(option_catalog):
+    defaults = option_catalog.defaults()
+    for loan_processor in option_catalog.options['loan_processor']:
+        yield FilterSelection(option_catalog.min_progress, option_catalog.max_progress, **dict(defaults, loan_processor = loan_processor))
+
+
+# Precomputes the AI Advisor queues (with the filter result they come with) of every Loan
+# Processor into the result cache whenever a dataset version is published, so opening the
+# page with the default filters only reads them. Registered as a dataset store listener.
+class AdvisorScheduler:
+    def __init__(self, result_cache, workers = DEFAULT_WORKERS):
+        self.result_cache = result_cache
+        self.version = None
+        self.status_date = None
+        self.pending = {}
+        self.completed = 0
+        self.failed = 0
+        self._executor = ThreadPoolExecutor(max_workers = max(1, workers), thread_name_prefix = 'advisor-queue')
+        self._lock = threading.Lock()
+
+    def __call__(self, previous, snapshot, delta):
+        self.schedule(snapshot)
+
+    # Schedule again when the day, and with it the document statuses, changed since the last run
+    def ensure_current(self, snapshot):
+        if self.version != snapshot.version or self.status_date != status_date():
+            self.schedule(snapshot)
+
+    # Queue every processor of the snapshot, cancelling what is still queued for older versions.
+    # Results carried forward from the previous version are not computed again.
+    def schedule(self, snapshot):
+        with self._lock:
+            for future in self.pending.values():
+                future.cancel()
+            self.version = snapshot.version
+            self.status_date = status_date()
+            self.pending = {}
+            self.completed = 0
+            self.failed = 0
+            for selection in processor_selections(snapshot['option_catalog']):
+                key = selection_key(snapshot.version, selection)
+                if current_result(self.result_cache, key, peek = True) is None:
+                    future = self._executor.submit(self._compute, snapshot, selection, key)
+                    self.pending[key] = future
+
+    def _compute(self, snapshot, selection, key):
+        try:
+            with span('advisor_queue'):
+                result = compute_filter_result(snapshot, selection)
+        except Exception:
+            logger.exception('Could not precompute the advisor queue of %s', selection.values['loan_processor'])
+            self._finish(key, 'failed')
+            raise
+        self.result_cache.put(key, result)
+        self._finish(key, 'completed')
+        return result
+
+    def _finish(self, key, outcome):
+        with self._lock:
+            if self.pending.pop(key, None) is not None:
+                setattr(self, outcome, getattr(self, outcome) + 1)
+
+    # Precomputed result of `key` once it is ready, None when it is not being precomputed
+    def wait(self, key):
+        with self._lock:
+            future = self.pending.get(key)
+        if future is None or future.cancelled():
+            return None
+        try:
+            return future.result()
+        except Exception:
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {'version': self.version, 'pending': len(self.pending), 'completed': self.completed, 'failed': self.failed}
@@ -0,0 +1,93 @@
+import functools
+import logging
+import threading
+
+from advisor_queues import AdvisorScheduler
+from exports import ExportJobs
+from figure_specs import FigureCache
+from filter_jobs import FilterJobs
+from result_cache import ResultCache
+from serving import SHARED_DIR, SharedDatasetReader, create_store
+
+# Resources of the dashboard shared by every session of the process. They are created here
+# rather than with st.cache_resource in the page script so warmup.py can create them in the
+# server process before the first session asks for them: st.cache_resource only keeps values
+# computed during a script run.
+
+# Reentrant, as building the dataset store asks for the advisor scheduler and the result cache
+_lock = threading.RLock()
+
+# Set by warmup.py, the dashboard's entry point. A plain streamlit run of loan_pipeline.py
+# works, but leaves the imports, the dataset load and the processor queues to the first session.
+started_by_warmup = False
+
+logger = logging.getLogger(__name__)
+
+
+# One instance per process of what `build` returns, built by the first caller
+def _shared(build):
+    instance = []
+
+    @functools.wraps(build)
+    def get():
+        with _lock:
+            if not instance:
+                instance.append(build())
+            return instance[0]
+    return get
+
+
+# Filter results shared by every session and keyed on the dataset version and selection
+@_shared
+def get_result_cache():
+    return ResultCache()
+
+
+# Keep the cached results no ingested loan could change
+def carry_forward_results(previous, snapshot, delta):
+    if previous is not None:
+        get_result_cache().carry_forward(previous.version, snapshot.version, delta, None if delta is None else snapshot.frame.iloc[delta.rows])
+
+
+# Advisor queues of every Loan Processor, precomputed into the result cache in the background
+# on every load and refresh of the dataset
+@_shared
+def get_advisor_scheduler():
+    return AdvisorScheduler(get_result_cache())
+
+
+# Filter evaluations of the sessions, run in the background so a newer selection can interrupt the wait
+@_shared
+def get_filter_jobs():
+    return FilterJobs(get_result_cache())
+
+
+# Grid exports of the sessions, written in the background while the page renders
+@_shared
+def get_export_jobs():
+    return ExportJobs()
+
+
+# Validated figures of the charts, shared by every session and keyed on the values they plot
+@_shared
+def get_figure_cache():
+    return FigureCache()
+
+
+# Logs once per process when the page runs without the warm-up
+@_shared
+def check_warm_up():
+    if not started_by_warmup:
+        logger.warning('Started without warmup.py, so the first session loads the dataset and precomputes the processor queues; start the dashboard with python warmup.py [streamlit run options]')
+    return started_by_warmup
+
+
+# Live dataset with its filter bitmaps, grid sort ranks, metrics cube and sidebar options, one per process
+# and shared by every session. Ingested batches update them incrementally. With LOAN_PIPELINE_SHARED_DIR
+# set, every server process attaches to the snapshot published to shared memory by serving.py instead.
+@_shared
+def get_dataset_store():
+    store = SharedDatasetReader() if SHARED_DIR else create_store()
+    store.add_listener(carry_forward_results)
+    store.add_listener(get_advisor_scheduler())
+    return store
@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from streamlit.elements.plotly_chart import marshall
+from streamlit.proto.PlotlyChart_pb2 import PlotlyChart as PlotlyChartProto
+
+from advisor import compute_advisor_insights
+from benchmarks.synthetic_pipeline import BENCHMARK_SIZES, generate_pipeline, to_source_format
+from data_loader import convert_frame, read_dataset, write_dataset
+from expiration import ExpirationIndex
+from figure_specs import FigureCache, donut_spec, funnel_spec, milestone_bar_spec
+from filter_engine import FilterIndex, FilterSelection
+from funnel import FunnelIndex
+from grid_pages import DEFAULT_PAGE_SIZE, LOAN_PROGRESS_COLUMNS, SORT_COLUMNS, SortIndex, format_dates
+from metrics import KeyMetrics
+from metrics_cube import MetricsCube
+from option_catalog import OptionCatalog
+from question_engine import QuestionEngine
+from schema import memory_usage, validate_schema
+
+RESULTS_DIR = os.path.join('benchmarks', 'results')
+
+# Stages too slow or too large to run at every size: the pickle conversion needs the
+# source frame in memory and the full grid payload grows with every filtered loan
+CONVERT_MAX_ROWS = 1000000
+FULL_GRID_MAX_ROWS = 1000000
+
+# A stage is reported as a regression when its median is this much slower than the baseline
+REGRESSION_TOLERANCE = 0.25
+
+
+# AgGrid sends its rows as JSON records with ISO dates
+def grid_payload(frame):
+    return format_dates(frame).to_json(orient = 'records', date_format = 'iso')
+
+
+# Figures of the Key Metrics charts and the funnel from `figure_cache`, as a session gets them
+def chart_figures(figure_cache, key_metrics, funnel):
+    milestones = [key_metrics.last_finished_milestone_doc_preparation, key_metrics.last_finished_milestone_cond_approval, key_metrics.last_finished_milestone_completion, key_metrics.last_finished_milestone_clear_to_close, key_metrics.last_finished_milestone_approval]
+    return [
+        figure_cache.figure('approval', lambda: donut_spec("Milestone Date Approval", ["Milestone Date Approval", "Milestone Date Submittal"], [key_metrics.milestone_date_approval, key_metrics.milestone_date_submittal])),
+        figure_cache.figure('clear_to_close', lambda: donut_spec("Clear to Close Applications (Approval)", ["Clear to Close Applications", "Milestone Date Approval"], [key_metrics.clear_to_close_applications, key_metrics.milestone_date_approval])),
+        figure_cache.figure('milestones', lambda: milestone_bar_spec(["Doc Preparation", "Cond. Approval", "Completion", "Clear to Close", "Approval"], milestones, [str(count) for count in milestones])),
+        figure_cache.figure('funnel', lambda: funnel_spec(funnel.stages, funnel.counts)),
+    ]
+
+
+# What st.plotly_chart does with each figure before sending it
+def chart_messages(figures):
+    messages = []
+    for figure in figures:
+        proto = PlotlyChartProto()
+        marshall(proto, figure, True, 'streamlit', 'streamlit')
+        messages.append(proto)
+    return messages
+
+
+def _timed(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return result, timings
+
+
+class BenchmarkRun:
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def stage(self, rows, name, function, repeat = None):
+        result, timings = _timed(function, repeat or self.repeat)
+        self.results.append({
+            'rows': rows,
+            'stage': name,
+            'runs': len(timings),
+            'min_seconds': min(timings),
+            'median_seconds': statistics.median(timings),
+            'max_seconds': max(timings),
+        })
+        print('{:>9} rows  {:<24} {:>10.4f} s'.format(rows, name, statistics.median(timings)), flush = True)
+        return result
+
+    def skip(self, rows, name, reason):
+        self.results.append({'rows': rows, 'stage': name, 'skipped': reason})
+        print('{:>9} rows  {:<24} {:>10}   {}'.format(rows, name, 'skipped', reason), flush = True)
+
+
+# Time every stage of one rerun of the app on a generated dataset of `rows` loans
+def benchmark_size(run, rows, seed, work_dir):
+    started = time.perf_counter()
+    frame = generate_pipeline(rows, seed)
+    print('{:>9} rows  generated in {:.1f} s'.format(rows, time.perf_counter() - started), flush = True)
+
+    if rows <= CONVERT_MAX_ROWS:
+        source = to_source_format(frame)
+        run.stage(rows, 'convert', lambda: convert_frame(source), repeat = 1)
+        del source
+    else:
+        run.skip(rows, 'convert', 'more than {} rows'.format(CONVERT_MAX_ROWS))
+
+    path = os.path.join(work_dir, '{}.arrow'.format(rows))
+    write_dataset(frame, path)
+    del frame
+
+    def load():
+        df = read_dataset(path)
+        validate_schema(df)
+        return df
+    df = run.stage(rows, 'load', load)
+
+    filter_index = run.stage(rows, 'build_filter_index', lambda: FilterIndex(df), repeat = 1)
+    metrics_cube = run.stage(rows, 'build_metrics_cube', lambda: MetricsCube(df), repeat = 1)
+    sort_index = run.stage(rows, 'build_sort_index', lambda: SortIndex(df, SORT_COLUMNS), repeat = 1)
+    funnel_index = run.stage(rows, 'build_funnel_index', lambda: FunnelIndex(df), repeat = 1)
+    expiration_index = run.stage(rows, 'build_expiration_index', lambda: ExpirationIndex(df), repeat = 1)
+    question_engine = run.stage(rows, 'build_question_engine', lambda: QuestionEngine(df), repeat = 1)
+    # Rows without a key are grouped on every answer; the whole pipeline is grouped once and cached
+    run.stage(rows, 'answer_question', lambda: question_engine.answer('Which type of application having high cycle time?', np.arange(len(df))))
+    run.stage(rows, 'answer_cached_question', lambda: question_engine.answer('Which type of application having high cycle time?'))
+    # A different day on every run, so the status matrix is worked out each time
+    status_days = iter(pd.date_range('2020-01-01', periods = run.repeat).date)
+    run.stage(rows, 'document_statuses', lambda: expiration_index.statuses(next(status_days)))
+
+    option_catalog = run.stage(rows, 'build_option_catalog', lambda: OptionCatalog(filter_index, df), repeat = 1)
+    # The default sidebar selects every value but a single processor; 'all' also selects every processor
+    default = FilterSelection(option_catalog.min_progress, option_catalog.max_progress, **option_catalog.defaults())
+    everything = FilterSelection(option_catalog.min_progress, option_catalog.max_progress, **option_catalog.options)
+    run.stage(rows, 'sidebar_options', lambda: option_catalog.sidebar_options(default))
+
+    for label, selection in [('default', default), ('all', everything)]:
+        selected_rows = run.stage(rows, 'filter_{}'.format(label), lambda: filter_index.select(selection))
+        key_metrics = run.stage(rows, 'metrics_{}'.format(label), lambda: KeyMetrics(metrics_cube.counts(selection)))
+        run.stage(rows, 'advisor_{}'.format(label), lambda: compute_advisor_insights(df.iloc[selected_rows], expiration_index.documents_current(selected_rows)))
+        funnel = run.stage(rows, 'funnel_{}'.format(label), lambda: funnel_index.summary(selected_rows))
+        # Validated on a cache miss only; every rerun still copies and serializes each figure
+        run.stage(rows, 'chart_figures_{}'.format(label), lambda: chart_figures(FigureCache(), key_metrics, funnel))
+        figures = chart_figures(FigureCache(), key_metrics, funnel)
+        run.stage(rows, 'chart_messages_{}'.format(label), lambda: chart_messages(figures))
+        run.stage(rows, 'grid_page_{}'.format(label), lambda: grid_payload(df.iloc[sort_index.page(selected_rows, 'Loan Number', page_size = DEFAULT_PAGE_SIZE).rows][LOAN_PROGRESS_COLUMNS]))
+        if len(selected_rows) <= FULL_GRID_MAX_ROWS:
+            run.stage(rows, 'grid_full_{}'.format(label), lambda: grid_payload(df.iloc[selected_rows][LOAN_PROGRESS_COLUMNS]), repeat = 1)
+        else:
+            run.skip(rows, 'grid_full_{}'.format(label), 'more than {} filtered rows'.format(FULL_GRID_MAX_ROWS))
+
+    run.results.append({'rows': rows, 'stage': 'memory', 'memory_bytes': memory_usage(df)})
+    os.remove(path)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Stages whose median grew by more than `tolerance` relative to a previous results file
+def find_regressions(results, baseline, tolerance = REGRESSION_TOLERANCE):
+    previous = {(result['rows'], result['stage']): result['median_seconds'] for result in baseline['results'] if 'median_seconds' in result}
+    regressions = []
+    for result in results:
+        before = previous.get((result['rows'], result['stage']))
+        if before and 'median_seconds' in result and result['median_seconds'] > before * (1 + tolerance):
+            regressions.append({'rows': result['rows'], 'stage': result['stage'], 'baseline_seconds': before, 'median_seconds': result['median_seconds']})
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Time each stage of the loan pipeline app on synthetic datasets')
+    parser.add_argument('--sizes', type = int, nargs = '+', default = BENCHMARK_SIZES)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--output', help = 'results file, by default a timestamped file in {}'.format(RESULTS_DIR))
+    parser.add_argument('--baseline', help = 'results file to compare against; exits with status 1 on regressions')
+    parser.add_argument('--tolerance', type = float, default = REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    started_at = datetime.now(timezone.utc)
+    run = BenchmarkRun(args.repeat)
+    with tempfile.TemporaryDirectory() as work_dir:
+        for rows in args.sizes:
+            benchmark_size(run, rows, args.seed, work_dir)
+
+    report = {
+        'started_at': started_at.isoformat(),
+        'git_commit': _git_commit(),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'environment': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': run.results,
+    }
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            report['regressions'] = find_regressions(run.results, json.load(baseline_file), args.tolerance)
+
+    output = args.output or os.path.join(RESULTS_DIR, '{}.json'.format(started_at.strftime('%Y%m%dT%H%M%SZ')))
+    os.makedirs(os.path.dirname(output) or '.', exist_ok = True)
+    with open(output, 'w') as output_file:
+        json.dump(report, output_file, indent = 2)
+    print('Results written to {}'.format(output))
+
+    for regression in report.get('regressions', []):
+        print('Regression: {} at {} rows took {:.4f} s, baseline {:.4f} s'.format(regression['stage'], regression['rows'], regression['median_seconds'], regression['baseline_seconds']))
+    if report.get('regressions'):
+        sys.exit(1)
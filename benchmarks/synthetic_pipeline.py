@@ -0,0 +1,213 @@
+import argparse
+import io
+import os
+from calendar import month_name
+from zipfile import ZIP_DEFLATED, ZipFile
+
+import numpy as np
+import pandas as pd
+from faker import Faker
+
+from data_loader import PICKLE_MEMBER
+from schema import CATEGORY_COLUMNS, DATE_COLUMNS, DOCUMENT_STATUS_COLUMNS, DOCUMENT_STATUS_DTYPE, INTEGER_COLUMNS
+
+# Dataset sizes the benchmarks are run at
+BENCHMARK_SIZES = [10000, 100000, 1000000, 5000000]
+
+# Column order of Loan Pipeline.pkl
+COLUMNS = [
+    'Loan Number', 'GFE Application Date', 'Loan Type', 'Borrower Intent to Continue Date', 'Milestone Date - Submittal',
+    'Milestone Date - Approval', 'Milestone Date - Clear To Close', 'Document Date Received - Appraisal', 'ExpRate Lock',
+    'ExpAppraisal', 'ExpCredit_Exp', 'Loan Officer', 'Loan Processor', 'Loan Closer', 'Last Finished Milestone', 'Loan Source',
+    "Document Date Received - Homeowner's Insurance Declarations Page", 'Document Date Received - Title Report', 'Exp_HOI',
+    'Exp_Title', 'Exp_VVOE', 'Exp_Income', 'Exp_Payoff', 'Progress', 'Income doc date', 'Exp_HOI1',
+    'Extracted Year (GFE Application Date)', 'Extracted Month (GFE Application Date)',
+    'Extracted Year (Borrower Intent to Continue Date)', 'Extracted Month (Borrower Intent to Continue Date)',
+    'Extracted Year (Milestone Date - Approval)', 'Extracted Month (Milestone Date - Approval)',
+    'Extracted Year (Milestone Date - Submittal)', 'Extracted Month (Milestone Date - Submittal)',
+    'Extracted Year (Milestone Date - Clear To Close)', 'Extracted Month (Milestone Date - Clear To Close)',
+    'ExpRate Lock1', 'ExpAppraisal1', 'Exp_Title1', 'ExpCredit_Exp1', 'Exp_VVOE1', 'Exp_Payoff1', 'Exp_Income1',
+    'Expected Time to Complete (minutes)', 'Ageing (days)', 'Application Status', 'Error Type',
+    'All Documents Expiration Status', 'All Documents Received Status',
+]
+
+# Value distributions measured on the bundled pickle
+LOAN_TYPES = {'Conventional': 0.22, 'VA': 0.19, 'FHA': 0.17, 'FarmersHomeA': 0.16, 'HELOC': 0.14, 'Other': 0.12}
+LOAN_SOURCES = {'WebMax': 0.30, 'Encompass - New File': 0.25, 'Encompass - Loan Duplication': 0.20, 'Blend': 0.15, 'WebCenter': 0.10}
+MILESTONES = {'Cond. Approval': 0.40, 'Approval': 0.25, 'Doc Preparation': 0.20, 'Clear to Close': 0.10, 'Completion': 0.05}
+PROGRESS = {
+    15: 0.029, 20: 0.082, 25: 0.051, 30: 0.080, 35: 0.040, 40: 0.042, 45: 0.060, 50: 0.048, 55: 0.030,
+    60: 0.089, 65: 0.070, 70: 0.069, 75: 0.049, 80: 0.091, 85: 0.072, 90: 0.060, 95: 0.038, 100: 0.0004,
+}
+EXPECTED_MINUTES = {10: 0.18, 11: 0.19, 15: 0.18, 16: 0.06, 18: 0.07, 25: 0.06, 35: 0.07, 50: 0.06, 70: 0.06, 90: 0.07}
+AGEING_DAYS = {1: 0.20, 2: 0.20, 3: 0.20, 4: 0.05, 5: 0.05, 6: 0.07, 7: 0.05, 8: 0.07, 9: 0.05, 10: 0.06}
+ERROR_TYPES = {
+    'Incorrect Income Details': 0.040, 'Title Errors': 0.036, 'Rate Lock Expired': 0.035, 'Incorrect Customer Demographics': 0.032,
+    'Interest Rate Mismatch': 0.029, 'Rate Lock Mismatch': 0.028,
+}
+ALL_DOCUMENTS_RECEIVED = 0.06
+# Share of Closed in the Exp* columns and of each status in the Exp*1 columns
+CLOSED_SHARE = {'ExpRate Lock': 0.35, 'ExpAppraisal': 0.30, 'ExpCredit_Exp': 0.28, 'Exp_HOI': 0.40, 'Exp_Title': 0.45, 'Exp_VVOE': 0.43, 'Exp_Income': 0.32, 'Exp_Payoff': 0.58}
+EXPIRATION_STATUSES = {'Not Expired': 0.33, 'Expiring Soon': 0.30, 'Expired': 0.20, 'Pending': 0.17}
+CREDIT_EXPIRATION_STATUSES = {'Not Expired': 0.35, 'Expiring Soon': 0.40, 'Expired': 0.25}
+STAFF_SIZE = 5
+
+FIRST_APPLICATION_DATE = np.datetime64('2018-01-01')
+APPLICATION_DAYS = 1200
+MISSING_DATE_SHARE = 0.001
+# Longest gap in days between consecutive milestone dates of a loan
+MILESTONE_GAP_DAYS = 30
+
+# Formats the pickle writes each date column in; the rest use '5/19/2020'
+LONG_DATE_FORMAT = '%A, %B %-d, %Y'
+LONG_DATE_COLUMNS = [
+    'GFE Application Date', 'Milestone Date - Submittal', 'Milestone Date - Approval', 'Milestone Date - Clear To Close',
+    "Document Date Received - Homeowner's Insurance Declarations Page", 'Document Date Received - Title Report',
+]
+# Date columns the Extracted Year and Month columns are derived from
+EXTRACTED_DATE_COLUMNS = ['GFE Application Date', 'Borrower Intent to Continue Date', 'Milestone Date - Approval', 'Milestone Date - Submittal', 'Milestone Date - Clear To Close']
+
+
+def _choice(rng, distribution, rows):
+    values = list(distribution)
+    weights = np.array(list(distribution.values()), dtype = float)
+    return np.asarray(values)[rng.choice(len(values), size = rows, p = weights / weights.sum())]
+
+
+def _category(rng, distribution, rows, categories = None):
+    values = list(distribution) if categories is None else categories
+    codes = rng.choice(len(distribution), size = rows, p = np.array(list(distribution.values())) / sum(distribution.values()))
+    if categories is None:
+        return _sorted_categories(codes, values)
+    codes = pd.Index(categories).get_indexer(list(distribution))[codes]
+    return pd.Categorical.from_codes(codes, categories = values)
+
+
+def _staff(fake, size):
+    names = []
+    while len(names) < size:
+        name = fake.name()
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def _with_missing(rng, dates):
+    return np.where(rng.random(len(dates)) < MISSING_DATE_SHARE, np.datetime64('NaT'), dates)
+
+
+# Year and month columns the way the pickle writes them, 'nan' for a missing date
+def _extracted(dates):
+    dates = pd.DatetimeIndex(dates)
+    years, year_codes = np.unique(dates.year.fillna(0).to_numpy().astype(int), return_inverse = True)
+    year_names = ['nan' if year == 0 else str(year) for year in years]
+    month_names = list(month_name)[1:] + ['nan']
+    month_codes = dates.month.fillna(13).to_numpy().astype(int) - 1
+    return _sorted_categories(year_codes, year_names), _sorted_categories(month_codes, month_names)
+
+
+# Categorical with its used categories in sorted order, as astype('category') builds it
+def _sorted_categories(codes, names):
+    values = pd.Categorical.from_codes(codes, categories = names).remove_unused_categories()
+    return values.reorder_categories(sorted(values.categories))
+
+
+# Seeded loan pipeline with the columns and dtypes of the converted dataset (see schema.py).
+# Milestone dates follow each other; statuses and names use the distributions of the pickle.
+def generate_pipeline(rows, seed = 0):
+    rng = np.random.default_rng(seed)
+    fake = Faker()
+    fake.seed_instance(seed)
+
+    data = {}
+    data['Loan Number'] = (rng.permutation(rows) + max(100000, 10 ** (len(str(rows)) - 1))).astype(str).astype(object)
+    application = FIRST_APPLICATION_DATE + rng.integers(0, APPLICATION_DAYS, rows).astype('timedelta64[D]')
+    milestones = [application]
+    for _ in range(4):
+        milestones.append(milestones[-1] + rng.integers(0, MILESTONE_GAP_DAYS, rows).astype('timedelta64[D]'))
+    data['GFE Application Date'] = application
+    for column, dates in zip(['Borrower Intent to Continue Date', 'Milestone Date - Submittal', 'Milestone Date - Approval', 'Milestone Date - Clear To Close'], milestones[1:]):
+        data[column] = _with_missing(rng, dates)
+    for column in ['Document Date Received - Appraisal', "Document Date Received - Homeowner's Insurance Declarations Page", 'Document Date Received - Title Report']:
+        data[column] = _with_missing(rng, application + rng.integers(0, 2 * MILESTONE_GAP_DAYS, rows).astype('timedelta64[D]'))
+    data['Income doc date'] = np.full(rows, np.datetime64('NaT'), dtype = 'datetime64[ns]')
+
+    data['Loan Type'] = _category(rng, LOAN_TYPES, rows)
+    data['Loan Source'] = _category(rng, LOAN_SOURCES, rows)
+    data['Last Finished Milestone'] = _category(rng, MILESTONES, rows)
+    for column in ['Loan Officer', 'Loan Processor', 'Loan Closer']:
+        data[column] = pd.Categorical.from_codes(rng.integers(0, STAFF_SIZE, rows), categories = sorted(_staff(fake, STAFF_SIZE)))
+
+    statuses = list(DOCUMENT_STATUS_DTYPE.categories)
+    for column, closed in CLOSED_SHARE.items():
+        data[column] = _category(rng, {'Closed': closed, 'Pending': 1 - closed}, rows, statuses)
+    for column in DOCUMENT_STATUS_COLUMNS:
+        if column not in CLOSED_SHARE:
+            data[column] = _category(rng, CREDIT_EXPIRATION_STATUSES if column == 'ExpCredit_Exp1' else EXPIRATION_STATUSES, rows, statuses)
+
+    data['Progress'] = _choice(rng, PROGRESS, rows)
+    data['Expected Time to Complete (minutes)'] = _choice(rng, EXPECTED_MINUTES, rows)
+    data['Ageing (days)'] = _choice(rng, AGEING_DAYS, rows)
+
+    error_share = sum(ERROR_TYPES.values())
+    error_types = _category(rng, dict(ERROR_TYPES, **{'No Error': 1 - error_share}), rows)
+    data['Error Type'] = error_types
+    data['Application Status'] = pd.Categorical.from_codes((error_types == 'No Error').astype(np.int8), categories = ['Error', 'No Error'])
+    data['All Documents Expiration Status'] = pd.Categorical.from_codes(np.zeros(rows, dtype = np.int8), categories = ['Not Expired'])
+    data['All Documents Received Status'] = pd.Categorical.from_codes((rng.random(rows) < ALL_DOCUMENTS_RECEIVED).astype(np.int8), categories = ['No', 'Yes'])
+
+    for column in EXTRACTED_DATE_COLUMNS:
+        data['Extracted Year ({})'.format(column)], data['Extracted Month ({})'.format(column)] = _extracted(data[column])
+
+    frame = pd.DataFrame(data)[COLUMNS]
+    for column in DATE_COLUMNS:
+        frame[column] = frame[column].astype('datetime64[ns]')
+    for column, dtype in INTEGER_COLUMNS.items():
+        frame[column] = frame[column].astype(dtype)
+    for column in CATEGORY_COLUMNS:
+        frame[column] = frame[column].astype('category')
+    return frame
+
+
+# Strings of a date column; each distinct date is formatted once
+def _format_dates(dates, date_format):
+    codes, uniques = pd.factorize(dates)
+    text = np.append(np.asarray(pd.DatetimeIndex(uniques).strftime(date_format), dtype = object), 'nan')
+    return text[codes]
+
+
+# Render a generated frame the way Loan Pipeline.pkl stores it: object columns with dates
+# written as text, 'nan' for missing dates and an all-NaN float Income doc date
+def to_source_format(frame):
+    source = {}
+    for column in frame.columns:
+        values = frame[column]
+        if column == 'Income doc date':
+            source[column] = np.full(len(frame), np.nan)
+        elif column in DATE_COLUMNS:
+            source[column] = _format_dates(values, LONG_DATE_FORMAT if column in LONG_DATE_COLUMNS else '%-m/%-d/%Y')
+        elif column in INTEGER_COLUMNS:
+            source[column] = values.astype(np.int64).to_numpy()
+        else:
+            source[column] = values.astype(object).to_numpy()
+    return pd.DataFrame(source, columns = frame.columns)
+
+
+# Zip archive laid out like Loan Pipeline Pickle.zip, for running the app on generated data
+def write_archive(frame, path):
+    buffer = io.BytesIO()
+    to_source_format(frame).to_pickle(buffer, compression = None)
+    with ZipFile(path, 'w', compression = ZIP_DEFLATED) as archive:
+        archive.writestr(PICKLE_MEMBER, buffer.getvalue())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Write a synthetic loan pipeline archive')
+    parser.add_argument('--rows', type = int, default = BENCHMARK_SIZES[0])
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--output', default = os.path.join('benchmarks', 'data', 'Loan Pipeline {}.zip'))
+    args = parser.parse_args()
+    output = args.output.format(args.rows)
+    os.makedirs(os.path.dirname(output) or '.', exist_ok = True)
+    write_archive(generate_pipeline(args.rows, args.seed), output)
+    print('Wrote {} loans to {}'.format(args.rows, output))
@@ -0,0 +1,230 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+from zipfile import ZipFile
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from expiration import archive_export_day
+from instrumentation import span
+from schema import apply_schema, memory_usage, validate_schema
+
+try:
+    import fcntl
+except ImportError:  # Windows: single process, no cross-process locking
+    fcntl = None
+
+# Source archive shipped with the app and the pickle stored inside it; LOAN_PIPELINE_ARCHIVE
+# points the app at another archive, e.g. one written by benchmarks/synthetic_pipeline.py
+DATA_ARCHIVE = os.environ.get('LOAN_PIPELINE_ARCHIVE', 'Loan Pipeline Pickle.zip')
+PICKLE_MEMBER = 'Loan Pipeline.pkl'
+
+# Converted columnar copy of the dataset, rebuilt only when the archive changes
+CACHE_DIR = '.data_cache'
+DATASET_FILE = 'Loan Pipeline.arrow'
+MANIFEST_FILE = 'manifest.json'
+LOCK_FILE = 'dataset.lock'
+
+# Append-only log of ingested batches applied on top of the converted archive. Once it holds
+# LOAN_PIPELINE_COMPACT_DELTAS batches they are folded into the dataset file, so a cold start
+# reads one file instead of replaying every batch.
+DELTA_DIR = 'deltas'
+COMPACT_DELTAS = int(os.environ.get('LOAN_PIPELINE_COMPACT_DELTAS', 20))
+
+# Bump when the on-disk layout changes so stale conversions are rebuilt
+FORMAT_VERSION = 4
+
+# Object columns outside the schema with at most this share of distinct values are dictionary encoded
+CATEGORICAL_RATIO = 0.5
+
+logger = logging.getLogger(__name__)
+
+
+# Loaded dataset together with the version it was built from
+class LoanDataset:
+    def __init__(self, frame, version):
+        self.frame = frame
+        self.version = version
+
+
+# Deltas ingested since the archive was converted, counting those folded into the dataset file
+def logged_deltas(manifest):
+    return manifest.get('compacted', 0) + len(manifest.get('deltas', []))
+
+
+# Version of the base conversion plus the number of deltas applied on top of it
+def dataset_version(manifest, applied_deltas = 0):
+    if applied_deltas:
+        return '{}+{}'.format(manifest['version'], applied_deltas)
+    return manifest['version']
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_manifest(cache_dir = CACHE_DIR):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_FILE)) as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path, write):
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    write(temp_path)
+    os.replace(temp_path, path)
+
+
+def _write_manifest(cache_dir, manifest):
+    def write(temp_path):
+        with open(temp_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent = 2)
+    _write_atomic(os.path.join(cache_dir, MANIFEST_FILE), write)
+
+
+# Read the pickle straight out of the archive without extracting it to disk
+def read_archive(archive_path = DATA_ARCHIVE, member = PICKLE_MEMBER):
+    with ZipFile(archive_path, 'r') as zObject:
+        with zObject.open(member) as pickle_file:
+            return pd.read_pickle(pickle_file)
+
+
+# Dictionary encode repeated strings so the columnar file stores small integer codes
+def encode_categoricals(df, ratio = CATEGORICAL_RATIO):
+    df = df.copy()
+    for column in df.columns:
+        if df[column].dtype == object and df[column].nunique(dropna = True) <= ratio * max(len(df), 1):
+            df[column] = df[column].astype('category')
+    return df
+
+
+# Uncompressed Arrow IPC in a single record batch, so every column without nulls is read as
+# a view of the mapped file. Dates keep NaT as its int64 sentinel instead of a validity
+# bitmap, which would make pandas fill a copy.
+def write_dataset(df, path):
+    table = pa.Table.from_pandas(df, preserve_index = True)
+    for position, column in enumerate(df.columns):
+        if df[column].dtype == 'datetime64[ns]':
+            values = pa.array(df[column].to_numpy().view('int64'), type = pa.timestamp('ns'))
+            table = table.set_column(position, table.field(position), values)
+    _write_atomic(path, lambda temp_path: feather.write_feather(table, temp_path, compression = 'uncompressed', chunksize = max(len(df), 1)))
+
+
+# Numeric, date and categorical code columns are zero-copy, read-only views of the memory
+# mapped file, so the page cache holds them once for every process reading the dataset.
+# Strings are copied into Python objects.
+def read_dataset(path):
+    table = feather.read_table(path, memory_map = True)
+    return table.to_pandas(split_blocks = True, self_destruct = False)
+
+
+# Raw pickled frame -> compact schema: categoricals, downcast integers and real dates
+def convert_frame(df):
+    converted = encode_categoricals(apply_schema(df))
+    source_bytes, converted_bytes = memory_usage(df), memory_usage(converted)
+    logger.info('Loan pipeline frame: %.1f MB as pickled, %.1f MB converted', source_bytes / 1e6, converted_bytes / 1e6)
+    return converted, {'source_memory_bytes': source_bytes, 'memory_bytes': converted_bytes}
+
+
+# Serialize writers of the manifest and the delta log across processes
+@contextmanager
+def dataset_lock(cache_dir = CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok = True)
+    with open(os.path.join(cache_dir, LOCK_FILE), 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# Append a normalized batch to the delta log; call with dataset_lock held
+def write_delta(batch, cache_dir = CACHE_DIR):
+    manifest = read_manifest(cache_dir)
+    delta_dir = os.path.join(cache_dir, DELTA_DIR)
+    os.makedirs(delta_dir, exist_ok = True)
+    name = '{:06d}.arrow'.format(logged_deltas(manifest) + 1)
+    write_dataset(batch.reset_index(drop = True), os.path.join(delta_dir, name))
+    manifest['deltas'] = manifest.get('deltas', []) + [name]
+    _write_manifest(cache_dir, manifest)
+    return manifest
+
+
+def read_delta(name, cache_dir = CACHE_DIR):
+    return read_dataset(os.path.join(cache_dir, DELTA_DIR, name))
+
+
+# Replace the dataset file with `frame`, the dataset with every logged delta applied, and
+# drop the log. Call with the dataset lock held. Processes that mapped the previous file keep
+# reading it. Applying a batch twice changes nothing, so a crash before the manifest is
+# written only replays deltas the new file already holds.
+def compact_deltas(frame, cache_dir = CACHE_DIR):
+    manifest = read_manifest(cache_dir)
+    write_dataset(frame, os.path.join(cache_dir, DATASET_FILE))
+    names = manifest.get('deltas', [])
+    manifest.update(compacted = logged_deltas(manifest), deltas = [])
+    _write_manifest(cache_dir, manifest)
+    for name in names:
+        os.remove(os.path.join(cache_dir, DELTA_DIR, name))
+    return manifest
+
+
+# Make sure the columnar copy matches the archive and return its manifest.
+# The archive is only hashed when its size or mtime differ from the manifest.
+def ensure_dataset(archive_path = DATA_ARCHIVE, cache_dir = CACHE_DIR):
+    stat = os.stat(archive_path)
+    manifest = read_manifest(cache_dir)
+    dataset_path = os.path.join(cache_dir, DATASET_FILE)
+
+    if manifest is not None and manifest.get('format_version') == FORMAT_VERSION and os.path.exists(dataset_path):
+        if manifest['source_size'] == stat.st_size and manifest['source_mtime_ns'] == stat.st_mtime_ns:
+            return manifest
+        source_sha256 = _file_sha256(archive_path)
+        if manifest['source_sha256'] == source_sha256:
+            with dataset_lock(cache_dir):
+                manifest = read_manifest(cache_dir)
+                manifest.update(source_size = stat.st_size, source_mtime_ns = stat.st_mtime_ns)
+                _write_manifest(cache_dir, manifest)
+            return manifest
+    else:
+        source_sha256 = _file_sha256(archive_path)
+
+    # A new archive supersedes every delta ingested on top of the previous one
+    with dataset_lock(cache_dir), span('convert'):
+        frame, memory = convert_frame(read_archive(archive_path))
+        write_dataset(frame, dataset_path)
+        shutil.rmtree(os.path.join(cache_dir, DELTA_DIR), ignore_errors = True)
+        manifest = {
+            'format_version': FORMAT_VERSION,
+            'source_size': stat.st_size,
+            'source_mtime_ns': stat.st_mtime_ns,
+            'source_sha256': source_sha256,
+            'version': '{}-{}'.format(FORMAT_VERSION, source_sha256[:16]),
+            # Day the document statuses of the archive were worked out on; see expiration.py
+            'exported_on': archive_export_day(frame).isoformat(),
+            'deltas': [],
+        }
+        manifest.update(memory)
+        _write_manifest(cache_dir, manifest)
+    return manifest
+
+
+# Load the converted archive without the delta log; see dataset_store for the live dataset
+def load_dataset(archive_path = DATA_ARCHIVE, cache_dir = CACHE_DIR):
+    manifest = ensure_dataset(archive_path, cache_dir)
+    frame = read_dataset(os.path.join(cache_dir, DATASET_FILE))
+    validate_schema(frame)
+    return LoanDataset(frame, manifest['version'])
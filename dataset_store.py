@@ -0,0 +1,156 @@
+import logging
+import os
+import threading
+
+from data_loader import CACHE_DIR, COMPACT_DELTAS, DATA_ARCHIVE, DATASET_FILE, LoanDataset, compact_deltas, dataset_lock, dataset_version, ensure_dataset, logged_deltas, read_dataset, read_delta, read_manifest, write_delta
+from instrumentation import span
+from schema import validate_schema
+from ingestion import INCOMING_DIR, KeyIndex, apply_delta, claim_batches, finish_batch, read_batch
+
+logger = logging.getLogger(__name__)
+
+
+# Immutable view of the dataset and everything derived from it at one version
+class DatasetSnapshot:
+    def __init__(self, dataset, artifacts):
+        self.dataset = dataset
+        self.artifacts = artifacts
+
+    @property
+    def frame(self):
+        return self.dataset.frame
+
+    @property
+    def version(self):
+        return self.dataset.version
+
+    def __getitem__(self, name):
+        return self.artifacts[name]
+
+
+# Live dataset of one server process. Artifacts (indexes, catalogs, aggregates) are
+# registered with a build function and an optional incremental update; ingested deltas
+# are applied to the frame and passed to each artifact instead of rebuilding it.
+class DatasetStore:
+    def __init__(self, archive_path = DATA_ARCHIVE, cache_dir = CACHE_DIR, incoming_dir = INCOMING_DIR, compact_after = COMPACT_DELTAS):
+        self.archive_path = archive_path
+        self.cache_dir = cache_dir
+        self.incoming_dir = incoming_dir
+        self.compact_after = compact_after
+        self.builders = {}
+        self.derived = {}
+        self.listeners = []
+        self.snapshot = None
+        self._base_version = None
+        self._applied_deltas = 0
+        self._key_index = None
+        self._lock = threading.Lock()
+
+    # build(frame) -> artifact; update(artifact, frame, delta) -> updated artifact, leaving
+    # the previous one untouched for sessions still reading the previous snapshot.
+    # Artifacts without an update are rebuilt on every delta.
+    def register(self, name, build, update = None):
+        self.builders[name] = (build, update)
+
+    # Artifact computed from another one with build(source_artifact, frame), rebuilt whenever
+    # its source changes. Sources are registered artifacts or earlier derived ones.
+    def derive(self, name, source, build):
+        self.derived[name] = (source, build)
+
+    def _derive(self, artifacts, frame):
+        for name, (source, build) in self.derived.items():
+            with span('build_{}'.format(name)):
+                artifacts[name] = build(artifacts[source], frame)
+        return artifacts
+
+    # callback(old_snapshot, new_snapshot, delta); delta is None after a full reload
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def _load(self, manifest):
+        with span('load'):
+            frame = read_dataset(os.path.join(self.cache_dir, DATASET_FILE))
+            validate_schema(frame)
+            key_index = KeyIndex(frame)
+            for name in manifest.get('deltas', []):
+                frame, delta = apply_delta(frame, read_delta(name, self.cache_dir), key_index)
+                key_index.add(delta)
+        self._key_index = key_index
+        self._base_version = manifest['version']
+        self._applied_deltas = logged_deltas(manifest)
+        dataset = LoanDataset(frame, dataset_version(manifest, self._applied_deltas))
+        artifacts = {}
+        for name, (build, _) in self.builders.items():
+            with span('build_{}'.format(name)):
+                artifacts[name] = build(frame)
+        self._publish(DatasetSnapshot(dataset, self._derive(artifacts, frame)), None)
+
+    def _advance(self, manifest, frame, delta):
+        self._applied_deltas += 1
+        artifacts = {}
+        for name, (build, update) in self.builders.items():
+            artifact = self.snapshot.artifacts[name]
+            if update is None:
+                artifact = build(frame)
+            else:
+                artifact = update(artifact, frame, delta)
+            artifacts[name] = artifact
+        dataset = LoanDataset(frame, dataset_version(manifest, self._applied_deltas))
+        self._publish(DatasetSnapshot(dataset, self._derive(artifacts, frame)), delta)
+
+    def _publish(self, snapshot, delta):
+        previous, self.snapshot = self.snapshot, snapshot
+        for callback in self.listeners:
+            callback(previous, snapshot, delta)
+
+    # Bring the snapshot up to `manifest`: reload after the archive was replaced or when the
+    # deltas this process is missing were compacted away, else replay the new deltas.
+    # Call with the dataset lock held, so no other process compacts the log meanwhile.
+    def _sync(self, manifest):
+        if self.snapshot is None or manifest['version'] != self._base_version or manifest.get('compacted', 0) > self._applied_deltas:
+            self._load(manifest)
+            return
+        for name in manifest.get('deltas', [])[self._applied_deltas - manifest.get('compacted', 0):]:
+            frame, delta = apply_delta(self.snapshot.frame, read_delta(name, self.cache_dir), self._key_index)
+            self._advance(manifest, frame, delta)
+            self._key_index.add(delta)
+
+    # Fold the log into the dataset file, unless another process logged a delta since
+    def _compact(self):
+        with dataset_lock(self.cache_dir), span('compact_deltas'):
+            manifest = read_manifest(self.cache_dir)
+            if manifest['version'] == self._base_version and logged_deltas(manifest) == self._applied_deltas:
+                compact_deltas(self.snapshot.frame, self.cache_dir)
+
+    # Ingest dropped batches, replay deltas written by other processes and reload after
+    # the archive was replaced. Cheap when nothing changed: a stat, a listdir and the manifest.
+    def refresh(self):
+        with self._lock:
+            manifest = ensure_dataset(self.archive_path, self.cache_dir)
+            if self.snapshot is None or manifest['version'] != self._base_version or logged_deltas(manifest) != self._applied_deltas:
+                with dataset_lock(self.cache_dir):
+                    self._sync(read_manifest(self.cache_dir))
+
+            for claimed_path in claim_batches(self.incoming_dir):
+                try:
+                    batch = read_batch(claimed_path)
+                    with dataset_lock(self.cache_dir):
+                        self._sync(read_manifest(self.cache_dir))
+                        # Only batches that apply cleanly to the live frame reach the log
+                        frame, delta = apply_delta(self.snapshot.frame, batch, self._key_index)
+                        manifest = write_delta(batch, self.cache_dir)
+                except (OSError, ValueError) as error:
+                    # Neither the frame nor the key index has taken in the batch
+                    logger.warning('Could not ingest %s: %s', claimed_path, error)
+                    finish_batch(claimed_path, False, self.incoming_dir)
+                else:
+                    with span('update_artifacts'):
+                        self._advance(manifest, frame, delta)
+                    self._key_index.add(delta)
+                    finish_batch(claimed_path, True, self.incoming_dir)
+                    if len(manifest['deltas']) >= self.compact_after:
+                        try:
+                            self._compact()
+                        except OSError as error:
+                            logger.warning('Could not compact the delta log: %s', error)
+            return self.snapshot
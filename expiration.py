@@ -0,0 +1,177 @@
+import copy
+import os
+import threading
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from schema import DOCUMENT_STATUS_DTYPE, DOCUMENT_STATUSES
+
+# Statuses of the 'document expiration alerts by loans' table, in the order of its columns
+ALERT_COLUMNS = ['ExpRate Lock1', 'ExpAppraisal1', 'Exp_Title1', 'ExpCredit_Exp1', 'Exp_HOI1', 'Exp_VVOE1', 'Exp_Income1', 'Exp_Payoff1']
+OVERALL_COLUMN = 'All Documents Expiration Status'
+STATUS_COLUMNS = ALERT_COLUMNS + [OVERALL_COLUMN]
+
+# Documents recorded with the date they were received. Rate Lock, Credit, VVOE and Payoff have
+# no date in the pipeline, and Income doc date is empty in the shipped archive.
+RECEIVED_DATES = {
+    'ExpAppraisal1': 'Document Date Received - Appraisal',
+    'Exp_Title1': 'Document Date Received - Title Report',
+    'Exp_HOI1': "Document Date Received - Homeowner's Insurance Declarations Page",
+    'Exp_Income1': 'Income doc date',
+}
+
+# Days a document stays valid after it was received. The pipeline exports no expiry dates, so
+# these are configuration: LOAN_PIPELINE_VALIDITY_DAYS overrides them as comma-separated
+# column=days pairs, e.g. ExpAppraisal1=120,Exp_HOI1=365.
+DEFAULT_VALIDITY_DAYS = {'ExpAppraisal1': 120, 'Exp_Title1': 90, 'Exp_HOI1': 365, 'Exp_Income1': 120}
+
+# The stored statuses were worked out on the day the archive was exported: the day given by
+# LOAN_PIPELINE_EXPORTED_ON (YYYY-MM-DD), or else the latest application date, as no loan
+# applies after the export
+EXPORTED_ON = os.environ.get('LOAN_PIPELINE_EXPORTED_ON')
+EXPORT_DATE_COLUMN = 'GFE Application Date'
+
+# A document expiring within this many days is Expiring Soon
+EXPIRING_SOON_DAYS = 10
+
+# Statuses are worked out against today, or against LOAN_PIPELINE_AS_OF (YYYY-MM-DD) when
+# replaying an archive as of the day it was exported
+AS_OF = os.environ.get('LOAN_PIPELINE_AS_OF')
+
+STATUS_CODES = {status: code for code, status in enumerate(DOCUMENT_STATUSES)}
+CLOSED, EXPIRED, EXPIRING_SOON, NOT_EXPIRED, PENDING = (STATUS_CODES[status] for status in ['Closed', 'Expired', 'Expiring Soon', 'Not Expired', 'Pending'])
+# Expiry day of a document not known to expire
+NO_EXPIRY = np.iinfo(np.int32).max
+
+
+def validity_days(setting = None):
+    setting = os.environ.get('LOAN_PIPELINE_VALIDITY_DAYS', '') if setting is None else setting
+    days = dict(DEFAULT_VALIDITY_DAYS)
+    for pair in filter(None, (pair.strip() for pair in setting.split(','))):
+        column, _, value = pair.partition('=')
+        if column.strip() not in RECEIVED_DATES:
+            raise ValueError('LOAN_PIPELINE_VALIDITY_DAYS names {}, which has no received date'.format(column.strip()))
+        days[column.strip()] = int(value)
+    return days
+
+
+def status_date():
+    return date.fromisoformat(AS_OF) if AS_OF else date.today()
+
+
+# Latest application date of an archive, recorded when it is converted
+def archive_export_day(df):
+    latest = df[EXPORT_DATE_COLUMN].max()
+    return status_date() if pd.isna(latest) else latest.date()
+
+
+def _day_number(day):
+    return int(np.datetime64(day, 'D').astype(np.int64))
+
+
+# Expiry day of each document given its stored status on `exported` (day number). The day
+# from its received date (`expires`) is used when it agrees with that status; otherwise the
+# status is trusted and bounds the day: Expired documents had expired by the day before,
+# Expiring Soon ones have expired EXPIRING_SOON_DAYS later, and Not Expired, Pending and
+# Closed ones are not known to expire.
+def expiry_days(codes, exported, expires = None):
+    latest = np.select([codes == EXPIRED, codes == EXPIRING_SOON], [exported - 1, exported + EXPIRING_SOON_DAYS - 1], NO_EXPIRY)
+    if expires is None:
+        return latest
+    earliest = np.select([codes == EXPIRING_SOON, codes == NOT_EXPIRED], [exported, exported + EXPIRING_SOON_DAYS], np.iinfo(np.int32).min)
+    agrees = (expires != NO_EXPIRY) & (codes >= EXPIRED) & (codes <= NOT_EXPIRED) & (expires >= earliest) & (expires <= latest)
+    return np.where(agrees, expires, latest)
+
+
+# Document statuses of every loan as an int8 matrix (codes of DOCUMENT_STATUSES, one column
+# per STATUS_COLUMNS), worked out in one pass from the expiry day of every document and kept
+# until the day changes. Matrices are column-major so each document is one contiguous run.
+# Pending and Closed documents keep their stored status. A missing status counts as Pending.
+class ExpirationIndex:
+    def __init__(self, df, exported_on = None, valid_days = None):
+        self.valid_days = validity_days() if valid_days is None else dict(valid_days)
+        # Ingested loans are read as of the same day as the archive
+        self.exported_on = date.fromisoformat(EXPORTED_ON) if EXPORTED_ON else exported_on or archive_export_day(df)
+        self.stored = np.empty((len(df), len(STATUS_COLUMNS)), dtype = np.int8, order = 'F')
+        self.expires = np.empty((len(df), len(ALERT_COLUMNS)), dtype = np.int32, order = 'F')
+        self._encode(df, np.arange(len(df)))
+        self._statuses = None
+        self._lock = threading.Lock()
+
+    def _encode(self, df, rows):
+        exported = _day_number(self.exported_on)
+        for position, column in enumerate(STATUS_COLUMNS):
+            codes = df[column].iloc[rows].map(STATUS_CODES).astype(float).fillna(PENDING).to_numpy(dtype = np.int8)
+            self.stored[rows, position] = codes
+            if column == OVERALL_COLUMN:
+                continue
+            expires = None
+            if column in RECEIVED_DATES:
+                received = df[RECEIVED_DATES[column]].iloc[rows].to_numpy(dtype = 'datetime64[D]')
+                expires = np.where(np.isnat(received), NO_EXPIRY, received.astype(np.int64) + self.valid_days[column])
+            self.expires[rows, position] = expiry_days(codes, exported, expires)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_statuses'] = None
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    # New index with the touched rows encoded again; the statuses are worked out on first use
+    def apply_delta(self, df, delta):
+        dated_columns = list(RECEIVED_DATES.values())
+        if len(delta.appended_rows) == 0 and not set(STATUS_COLUMNS + dated_columns).intersection(delta.columns):
+            return self
+        index = copy.copy(self)
+        grown = len(df) - len(self.stored)
+        index.stored = np.asfortranarray(np.concatenate([self.stored, np.empty((grown, len(STATUS_COLUMNS)), dtype = np.int8)]))
+        index.expires = np.asfortranarray(np.concatenate([self.expires, np.empty((grown, len(ALERT_COLUMNS)), dtype = np.int32)]))
+        index._encode(df, delta.rows)
+        index._statuses = None
+        index._lock = threading.Lock()
+        return index
+
+    def _compute(self, day):
+        statuses = self.stored.copy(order = 'F')
+        today = _day_number(day)
+        documents = statuses[:, :len(ALERT_COLUMNS)]
+        stored = self.stored[:, :len(ALERT_COLUMNS)]
+        open_documents = (stored >= EXPIRED) & (stored <= NOT_EXPIRED)
+        # Expired, Expiring Soon and Not Expired are consecutive codes (1, 2, 3)
+        computed = np.int8(NOT_EXPIRED) - (self.expires < today + EXPIRING_SOON_DAYS).view(np.int8) - (self.expires < today).view(np.int8)
+        np.copyto(documents, computed, where = open_documents)
+        # The stored overall status covered every document when the loan was exported; it only
+        # changes for the documents that have expired or started expiring since
+        worse = open_documents & (computed < stored)
+        expiring_soon = (worse & (computed == EXPIRING_SOON)).any(axis = 1)
+        expired = (worse & (computed == EXPIRED)).any(axis = 1)
+        overall = statuses[:, -1]
+        open_loans = (overall >= EXPIRED) & (overall <= NOT_EXPIRED)
+        np.copyto(overall, np.int8(EXPIRING_SOON), where = open_loans & expiring_soon & (overall != EXPIRED))
+        np.copyto(overall, np.int8(EXPIRED), where = open_loans & expired)
+        return statuses
+
+    # Status matrix as of `day` (by default status_date()), recomputed once per day
+    def statuses(self, day = None):
+        day = day or status_date()
+        with self._lock:
+            if self._statuses is None or self._statuses[0] != day:
+                self._statuses = (day, self._compute(day))
+            return self._statuses[1]
+
+    # Frame with its status columns replaced by the current statuses of `rows`
+    def overlay(self, frame, rows, day = None):
+        columns = [column for column in STATUS_COLUMNS if column in frame.columns]
+        if not columns:
+            return frame
+        statuses = self.statuses(day)[rows]
+        return frame.assign(**{column: pd.Categorical.from_codes(statuses[:, STATUS_COLUMNS.index(column)], dtype = DOCUMENT_STATUS_DTYPE) for column in columns})
+
+    def documents_current(self, rows, day = None):
+        return self.statuses(day)[rows, -1] == NOT_EXPIRED
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import secrets
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+# Exports are written to the app's static folder, which Streamlit serves from disk at
+# app/static/ (server.enableStaticServing), so no export is ever held in memory whole
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+EXPORT_DIR = os.path.join(STATIC_DIR, 'exports')
+EXPORT_URL = 'app/static/exports/'
+
+EXPORT_FORMATS = {'CSV': '.csv', 'Parquet': '.parquet'}
+
+# Rows converted and written at a time
+CHUNK_ROWS = int(os.environ.get('LOAN_PIPELINE_EXPORT_CHUNK_ROWS', 50000))
+# Exports are removed this long after they were last asked for
+MAX_AGE_SECONDS = int(os.environ.get('LOAN_PIPELINE_EXPORT_MAX_AGE', 3600))
+# Exports are readable by whoever serves the static folder, not only by the server user
+EXPORT_MODE = 0o644
+# Largest file Streamlit serves from the static folder
+MAX_EXPORT_BYTES = 200 * 1024 * 1024
+# Threads writing the exports sessions are waiting for
+DEFAULT_WORKERS = int(os.environ.get('LOAN_PIPELINE_EXPORT_WORKERS', 2))
+# How often a waiting rerun yields to Streamlit, which stops it when a newer rerun is asked for
+POLL_SECONDS = 0.1
+
+# Mixed into the file names so a download link cannot be guessed from the selection
+_NAME_SALT = secrets.token_hex(16)
+
+
+class ExportTooLarge(ValueError):
+    pass
+
+
+# Frames of `columns` for `rows` of the dataset, CHUNK_ROWS at a time, each passed through
+# `prepare(frame, rows)` when given; an empty selection still yields one empty frame
+def iter_frames(df, rows, columns, prepare = None, chunk_rows = CHUNK_ROWS):
+    for start in range(0, max(1, len(rows)), chunk_rows):
+        chunk = rows[start:start + chunk_rows]
+        frame = df.iloc[chunk][columns]
+        yield frame if prepare is None else prepare(frame, chunk)
+
+
+# CSV text of the frames, the header with the first one
+def csv_chunks(frames):
+    for position, frame in enumerate(frames):
+        yield frame.to_csv(index = False, header = position == 0)
+
+
+def _write_csv(frames, file, written):
+    for text in csv_chunks(frames):
+        file.write(text.encode('utf-8'))
+        written(file.tell())
+
+
+# One row group per frame
+def _write_parquet(frames, file, written):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for frame in frames:
+            table = pa.Table.from_pandas(frame, preserve_index = False)
+            if writer is None:
+                writer = pq.ParquetWriter(file, table.schema)
+            writer.write_table(table)
+            written(file.tell())
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+WRITERS = {'CSV': _write_csv, 'Parquet': _write_parquet}
+
+
+def remove_expired(directory = EXPORT_DIR, max_age = MAX_AGE_SECONDS):
+    if not os.path.isdir(directory):
+        return
+    oldest = time.time() - max_age
+    for entry in os.scandir(directory):
+        try:
+            if entry.stat().st_mtime < oldest:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+
+
+def _remove(directory, filename):
+    try:
+        os.remove(os.path.join(directory, os.path.basename(filename)))
+    except FileNotFoundError:
+        pass
+
+
+def _write(path, frames, export_format, progress):
+    def counted(frames):
+        done = 0
+        for frame in frames:
+            yield frame
+            done += len(frame)
+            if progress is not None:
+                progress(done)
+
+    def written(size):
+        if size > MAX_EXPORT_BYTES:
+            raise ExportTooLarge('Export is larger than {} MB'.format(MAX_EXPORT_BYTES // (1024 * 1024)))
+
+    # Written under a temporary name and renamed, so a link never points at a partial file
+    descriptor, temporary = tempfile.mkstemp(dir = os.path.dirname(path), prefix = '.', suffix = '.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            WRITERS[export_format](counted(frames), file, written)
+        # mkstemp creates the file readable by its owner only
+        os.chmod(temporary, EXPORT_MODE)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+
+def export_filename(name, key, export_format):
+    digest = hashlib.sha256('{}:{}:{}'.format(_NAME_SALT, key, export_format).encode('utf-8')).hexdigest()[:32]
+    return '{}-{}{}'.format(name, digest, EXPORT_FORMATS[export_format])
+
+
+# Write the frames to a file of the export folder and return its name. `key` identifies the
+# rows and columns exported: asking for the same key again reuses the file. `replaces` names
+# the export this one supersedes, removed once this one is written. `progress` is called with
+# the rows written so far after every chunk. Exports older than MAX_AGE_SECONDS go on every call.
+def export(name, key, frames, export_format, progress = None, directory = EXPORT_DIR, replaces = None):
+    filename = export_filename(name, key, export_format)
+    path = os.path.join(directory, filename)
+    remove_expired(directory)
+    if os.path.exists(path):
+        os.utime(path)
+    else:
+        os.makedirs(directory, exist_ok = True)
+        _write(path, frames, export_format, progress)
+    if replaces is not None and replaces != filename:
+        _remove(directory, replaces)
+    return filename
+
+
+# An export being written in the background: `written_rows` of `total_rows` are in the file so far
+class ExportJob:
+    def __init__(self, key, total_rows):
+        self.key = key
+        self.total_rows = total_rows
+        self.written_rows = 0
+        self.future = None
+
+    def done(self):
+        return self.future.done()
+
+    # Name of the file written; raises what the export raised, ExportTooLarge included
+    def result(self, timeout = None):
+        return self.future.result(timeout = timeout)
+
+    # Name of the file written, calling `poll` between waits; poll is where the caller gets interrupted
+    def wait(self, poll):
+        while True:
+            try:
+                return self.result(timeout = POLL_SECONDS)
+            except TimeoutError:
+                poll()
+
+
+# Exports run off the script thread, so the page renders while the file is written and a
+# newer rerun can stop the one waiting for it. Sessions asking for the same file share one job.
+class ExportJobs:
+    def __init__(self, workers = DEFAULT_WORKERS):
+        self.jobs = {}
+        self._executor = ThreadPoolExecutor(max_workers = max(1, workers), thread_name_prefix = 'export-job')
+        self._lock = threading.Lock()
+
+    def submit(self, name, key, frames, export_format, total_rows, directory = EXPORT_DIR, replaces = None):
+        filename = export_filename(name, key, export_format)
+        with self._lock:
+            job = self.jobs.get(filename)
+            if job is None:
+                job = ExportJob(key, total_rows)
+                job.future = self._executor.submit(self._export, job, filename, name, frames, export_format, directory, replaces)
+                self.jobs[filename] = job
+            return job
+
+    def _export(self, job, filename, name, frames, export_format, directory, replaces):
+        def progress(done):
+            job.written_rows = done
+
+        try:
+            return export(name, job.key, frames, export_format, progress = progress, directory = directory, replaces = replaces)
+        finally:
+            with self._lock:
+                self.jobs.pop(filename, None)
@@ -0,0 +1,101 @@
+import os
+import threading
+from collections import OrderedDict
+
+import plotly.graph_objects as go
+
+# Colours of the milestone charts, in the order of their bars and stages
+MILESTONE_COLORS = ["DodgerBlue", "MediumBlue", "DeepSkyBlue", "SlateBlue", "Cyan"]
+
+# Figures kept across reruns and sessions; each holds a few hundred bytes of data and a
+# reference to Plotly's default template
+DEFAULT_ENTRIES = int(os.environ.get('LOAN_PIPELINE_FIGURE_CACHE_ENTRIES', 1024))
+
+
+# The layout carries no template: go.Figure applies Plotly's default one, which is much
+# quicker than validating a copy embedded in the spec
+def _figure(data, layout):
+    return {'data': data, 'layout': layout}
+
+
+# Donut of two counts, as the Key Metrics tab draws them
+def donut_spec(title, labels, values):
+    return _figure([{
+        'type': 'pie',
+        'labels': list(labels),
+        'values': list(values),
+        'hole': 0.7,
+        'title': {'text': title},
+        'hoverinfo': 'label+value',
+        'textfont': {'size': 15},
+        'marker': {'colors': MILESTONE_COLORS[:2]},
+    }], {'showlegend': False})
+
+
+# Horizontal bars of the loans at each last finished milestone, labelled with `text`
+def milestone_bar_spec(labels, values, text):
+    return _figure([{
+        'type': 'bar',
+        'x': list(values),
+        'y': list(labels),
+        'orientation': 'h',
+        'marker': {'color': MILESTONE_COLORS},
+        'hoverinfo': 'skip',
+        'text': list(text),
+        'textposition': 'inside',
+        'width': 0.5,
+    }], {
+        'yaxis': {'showline': False, 'showticklabels': True},
+        'xaxis': {'showline': True, 'showticklabels': True, 'title': {'text': "Last Finished Milestone"}},
+    })
+
+
+def funnel_spec(stages, counts):
+    return _figure([{
+        'type': 'funnel',
+        'y': list(stages),
+        'x': list(counts),
+        'textinfo': 'value+percent previous',
+        'marker': {'color': MILESTONE_COLORS},
+    }], {'title': {'text': "Milestone Funnel"}})
+
+
+# Thread-safe LRU of figures, keyed on the chart and the values it plots. go.Figure validates
+# every property of a spec, about 2 ms per chart, so an unchanged chart is validated once for
+# every session; st.plotly_chart only copies and serializes a figure it is given. Figures are
+# shared: nothing may modify them.
+class FigureCache:
+    def __init__(self, max_entries = DEFAULT_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Figure of the spec `build` returns; `key` has to cover everything it plots
+    def figure(self, key, build):
+        with self._lock:
+            figure = self._entries.get(key)
+            if figure is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return figure
+            self.misses += 1
+        figure = go.Figure(build())
+        with self._lock:
+            self._entries[key] = figure
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last = False)
+        return figure
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,160 @@
+import copy
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+# Sidebar filters and the dataset columns they select on
+FILTER_COLUMNS = {
+    'selected_year': 'Extracted Year (Milestone Date - Submittal)',
+    'selected_month': 'Extracted Month (Milestone Date - Submittal)',
+    'loan_officer': 'Loan Officer',
+    'loan_processor': 'Loan Processor',
+    'loan_closer': 'Loan Closer',
+    'loan_source': 'Loan Source',
+    'loan_type': 'Loan Type',
+    'last_finished_milestone': 'Last Finished Milestone',
+}
+RANGE_COLUMN = 'Progress'
+
+
+# Normalized sidebar selection: every filter is a sorted tuple of values
+class FilterSelection:
+    def __init__(self, selected_min_progress, selected_max_progress, **selected_values):
+        self.selected_min_progress = selected_min_progress
+        self.selected_max_progress = selected_max_progress
+        self.values = {}
+        for field in FILTER_COLUMNS:
+            value = selected_values.get(field, ())
+            if value is None:
+                value = ()
+            elif isinstance(value, str) or not hasattr(value, '__iter__'):
+                value = (value,)
+            self.values[field] = tuple(sorted(set(value), key = str))
+
+    # Rows of `df` this selection keeps, evaluated directly on the (small) frame
+    def matches(self, df):
+        mask = df[RANGE_COLUMN].between(self.selected_min_progress, self.selected_max_progress).to_numpy()
+        for field, column in FILTER_COLUMNS.items():
+            mask &= df[column].isin(self.values[field]).to_numpy()
+        return mask
+
+    def key(self):
+        return tuple((field, tuple(str(v) for v in self.values[field])) for field in FILTER_COLUMNS) + (
+            ('progress', (int(self.selected_min_progress), int(self.selected_max_progress))),
+        )
+
+
+# Per-value packed row bitmaps for the categorical filters and a sorted index on Progress,
+# built once per dataset version so a selection never rescans the frame.
+class FilterIndex:
+    def __init__(self, df):
+        self.size = len(df)
+        self.bitmaps = {}
+        self.complete = {}
+        for column in FILTER_COLUMNS.values():
+            codes, uniques = pd.factorize(df[column], sort = True)
+            self.bitmaps[column] = {value: np.packbits(codes == code) for code, value in enumerate(uniques)}
+            self.complete[column] = bool((codes >= 0).all())
+        self.progress = df[RANGE_COLUMN].to_numpy()
+        self.progress_order = np.argsort(self.progress, kind = 'stable')
+        self.progress_sorted = self.progress[self.progress_order]
+        self.all_rows = np.packbits(np.ones(self.size, dtype = bool))
+
+    def _column_bitmap(self, column, values):
+        column_bitmaps = self.bitmaps[column]
+        selected = set(values).intersection(column_bitmaps)
+        if len(selected) == len(column_bitmaps) and self.complete[column]:
+            return None
+        if not selected:
+            return np.zeros_like(self.all_rows)
+        # OR over the smaller side and complement when most values are selected
+        if 2 * len(selected) > len(column_bitmaps) and self.complete[column]:
+            unselected = [column_bitmaps[v] for v in column_bitmaps if v not in selected]
+            return self.all_rows & ~reduce(np.bitwise_or, unselected)
+        return reduce(np.bitwise_or, [column_bitmaps[v] for v in selected])
+
+    # New index with the bitmaps and the Progress order of the rows touched by an ingested
+    # delta updated. Columns the delta left alone share their bitmaps with this index, unless
+    # rows were appended: these are empty in such a column, and the bitmaps grow to cover them.
+    def apply_delta(self, df, delta):
+        index = copy.copy(self)
+        index.bitmaps = dict(self.bitmaps)
+        index.complete = dict(self.complete)
+        size = len(df)
+        grown = (size + 7) // 8 - len(self.all_rows)
+        if size != self.size:
+            index.size = size
+            index.all_rows = np.packbits(np.ones(size, dtype = bool))
+
+        rows = delta.rows
+        row_bytes = rows >> 3
+        row_bits = (1 << (7 - (rows & 7))).astype(np.uint8)
+        appended = len(delta.appended_rows) > 0
+        for column in FILTER_COLUMNS.values():
+            if column not in delta.columns and not appended:
+                continue
+            column_bitmaps = {value: np.concatenate([bitmap, np.zeros(grown, dtype = np.uint8)]) for value, bitmap in self.bitmaps[column].items()}
+            for bitmap in column_bitmaps.values():
+                np.bitwise_and.at(bitmap, row_bytes, ~row_bits)
+            values = df[column].iloc[rows]
+            index.complete[column] = self.complete[column] and not values.isna().any()
+            for value, value_rows in values.groupby(values.to_numpy(), sort = False).indices.items():
+                bitmap = column_bitmaps.setdefault(value, np.zeros_like(index.all_rows))
+                np.bitwise_or.at(bitmap, row_bytes[value_rows], row_bits[value_rows])
+            index.bitmaps[column] = column_bitmaps
+
+        if RANGE_COLUMN in delta.columns or appended:
+            index.progress = df[RANGE_COLUMN].to_numpy()
+            touched = np.zeros(size, dtype = bool)
+            touched[rows] = True
+            kept = self.progress_order[~touched[self.progress_order]]
+            inserted = rows[np.argsort(index.progress[rows], kind = 'stable')]
+            at = np.searchsorted(index.progress[kept], index.progress[inserted], side = 'right')
+            index.progress_order = np.insert(kept, at, inserted)
+            index.progress_sorted = index.progress[index.progress_order]
+        return index
+
+    def _progress_bitmap(self, selection):
+        low = np.searchsorted(self.progress_sorted, selection.selected_min_progress, side = 'left')
+        high = np.searchsorted(self.progress_sorted, selection.selected_max_progress, side = 'right')
+        if low == 0 and high == self.size:
+            return None
+        in_range = np.zeros(self.size, dtype = bool)
+        in_range[self.progress_order[low:high]] = True
+        return np.packbits(in_range)
+
+    # Values of each filter that keep at least one row when every other filter and the
+    # Progress range stay as selected
+    def reachable(self, selection):
+        combine = lambda left, right: right if left is None else left if right is None else left & right
+        bitmaps = [self._column_bitmap(column, selection.values[field]) for field, column in FILTER_COLUMNS.items()]
+        bitmaps.append(self._progress_bitmap(selection))
+        # AND of the bitmaps before and after each filter, so each filter's complement is two ANDs
+        before, after = [None], [None]
+        for bitmap in bitmaps:
+            before.append(combine(before[-1], bitmap))
+        for bitmap in reversed(bitmaps):
+            after.insert(0, combine(bitmap, after[0]))
+        reachable = {}
+        for position, (field, column) in enumerate(FILTER_COLUMNS.items()):
+            others = combine(before[position], after[position + 1])
+            reachable[field] = {value for value, bitmap in self.bitmaps[column].items() if (bitmap if others is None else bitmap & others).any()}
+        return reachable
+
+    # Row positions (ascending) matching the selection
+    def select(self, selection):
+        bitmap = None
+        for field, column in FILTER_COLUMNS.items():
+            column_bitmap = self._column_bitmap(column, selection.values[field])
+            if column_bitmap is not None:
+                bitmap = column_bitmap if bitmap is None else bitmap & column_bitmap
+
+        low = np.searchsorted(self.progress_sorted, selection.selected_min_progress, side = 'left')
+        high = np.searchsorted(self.progress_sorted, selection.selected_max_progress, side = 'right')
+        if bitmap is None:
+            return np.sort(self.progress_order[low:high])
+
+        rows = np.flatnonzero(np.unpackbits(bitmap, count = self.size))
+        progress = self.progress[rows]
+        return rows[(progress >= selection.selected_min_progress) & (progress <= selection.selected_max_progress)]
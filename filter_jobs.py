@@ -0,0 +1,71 @@
+import os
+import threading
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError
+
+from advisor_queues import compute_filter_result, current_result
+
+# Threads evaluating the selections sessions are waiting for
+DEFAULT_WORKERS = int(os.environ.get('LOAN_PIPELINE_FILTER_WORKERS', min(4, os.cpu_count() or 1)))
+
+# How often a waiting rerun yields to Streamlit, which stops it when a newer selection arrives
+POLL_SECONDS = 0.1
+
+
+# Filter evaluations run off the script thread, so the rerun waiting for one can be stopped
+# by a newer selection without waiting for it to finish. Sessions asking for the same
+# selection share one job, and every finished job lands in the result cache.
+class FilterJobs:
+    def __init__(self, result_cache, workers = DEFAULT_WORKERS):
+        self.result_cache = result_cache
+        self.jobs = {}
+        self.abandoned = 0
+        self._executor = ThreadPoolExecutor(max_workers = max(1, workers), thread_name_prefix = 'filter-job')
+        self._lock = threading.Lock()
+
+    def submit(self, snapshot, selection, key):
+        with self._lock:
+            job = self.jobs.get(key)
+            if job is None or job.cancelled():
+                # Jobs here and the advisor queues put their result in the cache before they are
+                # dropped, so a result that finished since the caller looked is read, not redone
+                result = current_result(self.result_cache, key)
+                if result is not None:
+                    job = Future()
+                    job.set_result(result)
+                    return job
+                job = self._executor.submit(self._compute, snapshot, selection, key)
+                self.jobs[key] = job
+            return job
+
+    def _compute(self, snapshot, selection, key):
+        try:
+            result = compute_filter_result(snapshot, selection)
+            self.result_cache.put(key, result)
+            return result
+        finally:
+            with self._lock:
+                self.jobs.pop(key, None)
+
+    # Drop a job nobody waits for any more if it has not started; a running job finishes
+    # into the cache. A session still waiting on it submits it again.
+    def abandon(self, key):
+        with self._lock:
+            job = self.jobs.get(key)
+            if job is not None and job.cancel():
+                del self.jobs[key]
+                self.abandoned += 1
+
+    # Result of the job, calling `poll` between waits; poll is where the caller gets interrupted
+    def wait(self, snapshot, selection, key, poll):
+        job = self.submit(snapshot, selection, key)
+        while True:
+            try:
+                return job.result(timeout = POLL_SECONDS)
+            except TimeoutError:
+                poll()
+            except CancelledError:
+                job = self.submit(snapshot, selection, key)
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': len(self.jobs), 'abandoned': self.abandoned}
@@ -0,0 +1,76 @@
+import copy
+
+import numpy as np
+
+# Milestones of a loan's timeline in the order loans move through them, with the date recording each
+FUNNEL_STAGES = {
+    'Application': 'GFE Application Date',
+    'Intent to Continue': 'Borrower Intent to Continue Date',
+    'Submittal': 'Milestone Date - Submittal',
+    'Approval': 'Milestone Date - Approval',
+    'Clear to Close': 'Milestone Date - Clear To Close',
+}
+STAGES = list(FUNNEL_STAGES)
+STAGE_COLUMNS = list(FUNNEL_STAGES.values())
+
+# Stage dates are kept as days since the epoch; a stage without a date has NO_DATE
+NO_DATE = np.iinfo(np.int32).min
+
+# Every combination of reached stages, and for each the stages it contains
+STATES = np.arange(1 << len(STAGES))
+STATE_HAS_STAGE = (STATES[:, None] >> np.arange(len(STAGES))) & 1 == 1
+
+
+# Funnel of a set of loans: how many reached each stage, the share of the loans at a stage that
+# reached the next one, and the days it took them
+class FunnelSummary:
+    def __init__(self, counts, converted, cycle_days):
+        self.stages = STAGES
+        self.transitions = ['{} to {}'.format(stage, next_stage) for stage, next_stage in zip(STAGES, STAGES[1:])]
+        self.counts = [int(count) for count in counts]
+        self.converted = [int(count) for count in converted]
+        self.conversion_rates = [converted / count if count else None for converted, count in zip(self.converted, self.counts)]
+        self.mean_cycle_days = [float(days.mean()) if len(days) else None for days in cycle_days]
+        self.median_cycle_days = [float(np.median(days)) if len(days) else None for days in cycle_days]
+
+
+# Milestone timeline of every loan, built when the data loads: a bitmask of the stages reached
+# (bit i for FUNNEL_STAGES[i]) and the day of each stage
+class FunnelIndex:
+    def __init__(self, df):
+        self.state = np.zeros(len(df), dtype = np.uint8)
+        self.days = np.full((len(df), len(STAGES)), NO_DATE, dtype = np.int32)
+        self._encode(df, np.arange(len(df)))
+
+    def _encode(self, df, rows):
+        for stage, column in enumerate(STAGE_COLUMNS):
+            dates = df[column].iloc[rows].to_numpy(dtype = 'datetime64[D]')
+            reached = ~np.isnat(dates)
+            self.days[rows, stage] = np.where(reached, dates.astype(np.int64), NO_DATE)
+            self.state[rows] = np.where(reached, self.state[rows] | (1 << stage), self.state[rows] & ~np.uint8(1 << stage))
+
+    # New index with the touched rows encoded again, e.g. a loan advancing a milestone;
+    # a delta leaving every stage date alone shares the arrays of this index
+    def apply_delta(self, df, delta):
+        if len(delta.appended_rows) == 0 and not set(STAGE_COLUMNS).intersection(delta.columns):
+            return self
+        index = copy.copy(self)
+        grown = len(df) - len(self.state)
+        index.state = np.concatenate([self.state, np.zeros(grown, dtype = np.uint8)])
+        index.days = np.concatenate([self.days, np.full((grown, len(STAGES)), NO_DATE, dtype = np.int32)])
+        index._encode(df, delta.rows)
+        return index
+
+    # Funnel of the loans at `rows`: stage counts from one histogram of the states,
+    # cycle times from the stage days of the same rows
+    def summary(self, rows):
+        states = np.bincount(self.state[rows], minlength = len(STATES))
+        counts = states @ STATE_HAS_STAGE
+        converted = [states[STATE_HAS_STAGE[:, stage] & STATE_HAS_STAGE[:, stage + 1]].sum() for stage in range(len(STAGES) - 1)]
+
+        days = self.days[rows]
+        cycle_days = []
+        for stage in range(len(STAGES) - 1):
+            both = (days[:, stage] != NO_DATE) & (days[:, stage + 1] != NO_DATE)
+            cycle_days.append(days[both, stage + 1] - days[both, stage])
+        return FunnelSummary(counts, converted, cycle_days)
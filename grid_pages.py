@@ -0,0 +1,148 @@
+import copy
+import math
+
+import numpy as np
+import pandas as pd
+
+# Page sizes offered next to the grids; the grids show about 15 rows at height 400
+PAGE_SIZES = [25, 50, 100, 250]
+DEFAULT_PAGE_SIZE = 50
+
+# Columns for loan progress table
+LOAN_PROGRESS_COLUMNS = ['Loan Type', 'Ageing (days)', 'Loan Number', 'Progress',  'ExpRate Lock', 'ExpAppraisal', 'Exp_Title', 'ExpCredit_Exp', 'Exp_VVOE', 'Exp_HOI', 'Exp_Payoff', 'Exp_Income', 'Borrower Intent to Continue Date']
+
+# Columns for 'document expiration alerts by loans' table
+DOCUMENT_EXPIRATION_ALERTS_COLUMNS = ['Loan Number', 'ExpRate Lock1', 'ExpAppraisal1', 'Exp_Title1', 'ExpCredit_Exp1', 'Exp_HOI1', 'Exp_VVOE1', 'Exp_Income1', 'Exp_Payoff1']
+
+# Columns the grids can be sorted on
+SORT_COLUMNS = list(dict.fromkeys(LOAN_PROGRESS_COLUMNS + DOCUMENT_EXPIRATION_ALERTS_COLUMNS))
+
+# A delta touching more than this share of the rows re-sorts a column instead of merging them in
+MERGE_SHARE = 1 / 64
+
+
+# Values a column sorts on, compared with < (category codes for categoricals, nanoseconds for
+# dates), and a function telling which of some of them are missing
+def _sort_keys(values):
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), lambda keys: keys < 0
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return values.to_numpy().view(np.int64), lambda keys: keys == np.iinfo(np.int64).min
+    return values.to_numpy(), pd.isna
+
+
+# One page of a sorted, filtered row set
+class GridPage:
+    def __init__(self, rows, total_rows, page, page_size):
+        self.rows = rows
+        self.total_rows = total_rows
+        self.page = page
+        self.page_size = page_size
+        self.page_count = max(1, math.ceil(total_rows / page_size))
+
+
+# Global sort rank of every row per column, built once per dataset version,
+# so a page of any filtered row set is served without sorting the frame again
+class SortIndex:
+    def __init__(self, df, columns):
+        self.ranks = {}
+        for column in columns:
+            self._rank(df, column)
+
+    def _rank(self, df, column):
+        order = df[column].reset_index(drop = True).sort_values(kind = 'stable', na_position = 'last').index.to_numpy()
+        ranks = np.empty(len(order), dtype = np.int64)
+        ranks[order] = np.arange(len(order))
+        self.ranks[column] = ranks
+
+    # Ranks after the rows at `rows` changed or were appended: the other rows keep their order
+    # and the touched ones are merged in where the stable sort of _rank puts them, missing
+    # values last and an earlier row first among equal values
+    def _merge(self, df, column, rows):
+        ranks = self.ranks[column]
+        order = np.empty(len(ranks), dtype = np.int64)
+        order[ranks] = np.arange(len(ranks))
+        touched = np.zeros(len(df), dtype = bool)
+        touched[rows] = True
+        kept = order[~touched[order]]
+
+        moved = np.sort(rows)
+        moved = moved[df[column].iloc[moved].reset_index(drop = True).sort_values(kind = 'stable', na_position = 'last').index.to_numpy()]
+        keys, is_missing = _sort_keys(df[column])
+        moved_keys = keys[moved]
+        moved_missing = is_missing(moved_keys)
+
+        # Binary search of every touched row among the kept ones at once, reading only the
+        # keys it compares
+        low = np.zeros(len(moved), dtype = np.int64)
+        high = np.full(len(moved), len(kept), dtype = np.int64)
+        searching = np.flatnonzero(low < high)
+        while len(searching):
+            middle = (low[searching] + high[searching]) // 2
+            other = kept[middle]
+            other_keys = keys[other]
+            other_missing = is_missing(other_keys)
+            mine_keys, mine_missing = moved_keys[searching], moved_missing[searching]
+            before = other < moved[searching]
+            both = ~other_missing & ~mine_missing
+            before[both] = (other_keys[both] < mine_keys[both]) | ((other_keys[both] == mine_keys[both]) & before[both])
+            split = other_missing != mine_missing
+            before[split] = mine_missing[split]
+            low[searching] = np.where(before, middle + 1, low[searching])
+            high[searching] = np.where(before, high[searching], middle)
+            searching = searching[low[searching] < high[searching]]
+
+        merged = np.insert(kept, low, moved)
+        self.ranks[column] = np.empty(len(merged), dtype = np.int64)
+        self.ranks[column][merged] = np.arange(len(merged))
+
+    # New index with the rows an ingested delta touched moved in the columns it changed.
+    # Appended rows are empty in the other columns, so they rank last there.
+    def apply_delta(self, df, delta):
+        index = copy.copy(self)
+        index.ranks = dict(self.ranks)
+        rows = delta.rows
+        for column, ranks in self.ranks.items():
+            if column not in delta.columns:
+                if len(ranks) < len(df):
+                    index.ranks[column] = np.concatenate([ranks, np.arange(len(ranks), len(df))])
+            elif len(rows) > MERGE_SHARE * len(df):
+                index._rank(df, column)
+            else:
+                index._merge(df, column, rows)
+        return index
+
+    # Row positions for one page of `rows` sorted on `column`, or on per-row `keys` (small
+    # integers such as status codes) for a column whose values are worked out at read time
+    def page(self, rows, column, ascending = True, page = 1, page_size = DEFAULT_PAGE_SIZE, keys = None):
+        rows = np.asarray(rows)
+        total_rows = len(rows)
+        page_count = max(1, math.ceil(total_rows / page_size))
+        page = min(max(int(page), 1), page_count)
+        start, stop = (page - 1) * page_size, min(page * page_size, total_rows)
+
+        if keys is None:
+            ranks = self.ranks[column][rows]
+        else:
+            # Ties keep the frame order, as with the global ranks
+            ranks = keys[rows].astype(np.int64) * len(keys) + rows
+        if not ascending:
+            ranks = -ranks
+        # Partition up to the end of the page, then only sort what is kept
+        if stop < total_rows:
+            candidates = np.argpartition(ranks, stop - 1)[:stop]
+        else:
+            candidates = np.arange(total_rows)
+        candidates = candidates[np.argsort(ranks[candidates], kind = 'stable')]
+        return GridPage(rows[candidates[start:stop]], total_rows, page, page_size)
+
+
+# Dates shown the way the source writes them, e.g. 5/19/2020
+def format_dates(frame):
+    formatted = {}
+    for column in frame.columns:
+        if pd.api.types.is_datetime64_any_dtype(frame[column].dtype):
+            dates = frame[column].dt
+            text = dates.month.astype('Int64').astype('string') + '/' + dates.day.astype('Int64').astype('string') + '/' + dates.year.astype('Int64').astype('string')
+            formatted[column] = text.fillna('')
+    return frame.assign(**formatted) if formatted else frame
@@ -0,0 +1,151 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from schema import downcast_integers, parse_dates
+
+# Folder watched for CSV or JSONL batches of new and changed loans
+INCOMING_DIR = 'incoming'
+PROCESSED_DIR = 'processed'
+FAILED_DIR = 'failed'
+BATCH_EXTENSIONS = ('.csv', '.jsonl')
+
+# Batches upsert on this column: known loans are updated, unknown loans appended
+KEY_COLUMN = 'Loan Number'
+
+
+# Loan Number -> row positions, updated with each logged delta instead of rescanning the frame
+class KeyIndex:
+    def __init__(self, frame):
+        self.positions = {key: rows for key, rows in frame.groupby(KEY_COLUMN, sort = False, observed = True).indices.items()}
+
+    def lookup(self, keys):
+        return [self.positions.get(key) for key in keys]
+
+    # Take in the loans a delta appended, once the delta is part of the dataset
+    def add(self, delta):
+        for key, position in zip(delta.appended_keys, delta.appended_rows):
+            self.positions[key] = np.array([position])
+
+
+# Rows touched by one batch: positions are in the frame after the batch was applied
+class Delta:
+    def __init__(self, updated_rows, appended_rows, columns, previous, appended_keys = ()):
+        self.updated_rows = updated_rows
+        self.appended_rows = appended_rows
+        # Columns with a new value in some row; the other columns of appended rows are empty
+        self.columns = columns
+        self.appended_keys = appended_keys
+        # Values of the updated rows before the batch, for invalidating cached results
+        self.previous = previous
+
+    @property
+    def rows(self):
+        return np.concatenate([self.updated_rows, self.appended_rows])
+
+
+# Read a dropped batch as strings; values are coerced to the dataset dtypes when applied
+def read_batch(path):
+    if path.endswith('.csv'):
+        batch = pd.read_csv(path, dtype = str, keep_default_na = False, na_values = [''])
+    else:
+        batch = pd.read_json(path, lines = True, dtype = False)
+        batch = batch.astype(object).where(batch.notna(), None)
+        batch = batch.apply(lambda column: column.map(lambda value: value if value is None else str(value)))
+    if KEY_COLUMN not in batch.columns:
+        raise ValueError('{} has no {} column'.format(path, KEY_COLUMN))
+    if batch[KEY_COLUMN].isna().any():
+        raise ValueError('{} has rows without a {}'.format(path, KEY_COLUMN))
+    return batch.drop_duplicates(KEY_COLUMN, keep = 'last').reset_index(drop = True)
+
+
+def coerce_column(values, dtype, column = None):
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return parse_dates(values, column)
+    if pd.api.types.is_numeric_dtype(dtype):
+        return pd.to_numeric(values, errors = 'coerce')
+    return values.astype(object)
+
+
+def _with_categories(column, values):
+    missing = pd.Index(values.dropna().unique()).difference(column.cat.categories)
+    return column.cat.add_categories(missing) if len(missing) else column
+
+
+# Upsert a batch into the frame. Only the columns present in the batch are touched and
+# empty cells leave the stored value unchanged. Neither the frame nor the key index is
+# modified: the caller adds the appended loans with key_index.add(delta) once it keeps the delta.
+def apply_delta(frame, batch, key_index):
+    unknown = batch.columns.difference(frame.columns)
+    if len(unknown):
+        raise ValueError('Unknown columns: {}'.format(', '.join(unknown)))
+
+    matches = key_index.lookup(batch[KEY_COLUMN])
+    known = np.array([rows is not None for rows in matches], dtype = bool)
+    updates = batch[known]
+    update_rows = np.concatenate([rows for rows in matches if rows is not None]) if known.any() else np.array([], dtype = np.int64)
+    update_batch_rows = np.repeat(np.arange(len(updates)), [len(rows) for rows in matches if rows is not None])
+    additions = batch[~known]
+
+    new_frame = frame.copy(deep = False)
+    changed_columns = set()
+    for column in batch.columns.drop(KEY_COLUMN):
+        values = coerce_column(updates[column], frame[column].dtype, column).iloc[update_batch_rows]
+        present = values.notna().to_numpy()
+        if not present.any():
+            continue
+        updated = frame[column].copy()
+        if isinstance(updated.dtype, pd.CategoricalDtype):
+            updated = _with_categories(updated, values[present])
+        new_values = values[present]
+        if pd.api.types.is_integer_dtype(updated.dtype):
+            new_values = downcast_integers(new_values, column, updated.dtype)
+        updated.iloc[update_rows[present]] = new_values.to_numpy()
+        new_frame[column] = updated
+        changed_columns.add(column)
+
+    appended_rows = np.arange(len(frame), len(frame) + len(additions))
+    if len(additions):
+        appended = pd.DataFrame(index = pd.RangeIndex(frame.index.max() + 1, frame.index.max() + 1 + len(additions)), columns = frame.columns)
+        for column in frame.columns:
+            dtype = frame[column].dtype
+            values = coerce_column(additions[column], dtype, column) if column in additions else pd.Series([None] * len(additions), dtype = object)
+            values.index = appended.index
+            if isinstance(dtype, pd.CategoricalDtype):
+                new_frame[column] = _with_categories(new_frame[column], values)
+                appended[column] = pd.Categorical(values, categories = new_frame[column].cat.categories)
+            elif pd.api.types.is_integer_dtype(dtype):
+                appended[column] = downcast_integers(values, column, dtype)
+            else:
+                appended[column] = values.astype(dtype)
+        new_frame = pd.concat([new_frame, appended])
+        changed_columns.update(column for column in additions.columns if appended[column].notna().any())
+
+    previous = frame.iloc[np.unique(update_rows)]
+    return new_frame, Delta(np.unique(update_rows), appended_rows, changed_columns, previous, additions[KEY_COLUMN].tolist())
+
+
+# Claim every waiting batch by renaming it, so concurrent processes never ingest a file twice
+def claim_batches(incoming_dir = INCOMING_DIR):
+    try:
+        names = sorted(name for name in os.listdir(incoming_dir) if name.endswith(BATCH_EXTENSIONS) and not name.startswith('.'))
+    except FileNotFoundError:
+        return []
+    claimed = []
+    for name in names:
+        path = os.path.join(incoming_dir, name)
+        claimed_path = os.path.join(incoming_dir, '.{}.{}'.format(os.getpid(), name))
+        try:
+            os.rename(path, claimed_path)
+        except FileNotFoundError:
+            continue
+        claimed.append(claimed_path)
+    return claimed
+
+
+def finish_batch(claimed_path, succeeded, incoming_dir = INCOMING_DIR):
+    target_dir = os.path.join(incoming_dir, PROCESSED_DIR if succeeded else FAILED_DIR)
+    os.makedirs(target_dir, exist_ok = True)
+    name = os.path.basename(claimed_path).split('.', 2)[2]
+    os.replace(claimed_path, os.path.join(target_dir, name))
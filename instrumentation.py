@@ -0,0 +1,207 @@
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows: no peak resident set size
+    resource = None
+
+# LOAN_PIPELINE_PROFILE=1 times every stage of every rerun; =memory also traces Python
+# allocations, which slows the app down noticeably. Unset, span() is a shared no-op.
+PROFILE = os.environ.get('LOAN_PIPELINE_PROFILE', '').strip().lower()
+ENABLED = PROFILE not in ('', '0', 'false', 'no')
+TRACE_MEMORY = PROFILE == 'memory'
+
+# Rolling export of the stage statistics, rewritten at most every EXPORT_INTERVAL_SECONDS.
+# Files ending in .prom are written in the Prometheus text format (for the node exporter
+# textfile collector), anything else as JSON.
+EXPORT_PATH = os.environ.get('LOAN_PIPELINE_PROFILE_EXPORT')
+EXPORT_INTERVAL_SECONDS = 10
+
+# Timings kept per stage for the percentiles
+WINDOW = 1000
+QUANTILES = [0.5, 0.95, 0.99]
+
+# Name of the span covering a whole rerun of the script
+RERUN = 'rerun'
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+
+_NO_SPAN = contextlib.nullcontext()
+
+logger = logging.getLogger(__name__)
+
+
+def max_rss_bytes():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT
+
+
+# Spans of one rerun, kept per script thread for the debug panel
+class RerunTrace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self.stack = []
+        if TRACE_MEMORY:
+            tracemalloc.reset_peak()
+
+
+# Stage timings of every session of the process, over a rolling window of runs
+class Recorder:
+    def __init__(self, window = WINDOW, export_path = EXPORT_PATH):
+        self.window = window
+        self.export_path = export_path
+        self.samples = {}
+        self.totals = {}
+        self.peak_traced_bytes = deque(maxlen = window)
+        self.last_export = 0.0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def trace(self):
+        return getattr(self._local, 'trace', None)
+
+    def _record(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, deque(maxlen = self.window)).append(seconds)
+            count, total = self.totals.get(stage, (0, 0.0))
+            self.totals[stage] = (count + 1, total + seconds)
+
+    @contextlib.contextmanager
+    def span(self, name):
+        trace = self.trace
+        stage = name if trace is None or not trace.stack else '{}/{}'.format(trace.stack[-1], name)
+        if trace is not None:
+            trace.stack.append(stage)
+        allocated = tracemalloc.get_traced_memory()[0] if TRACE_MEMORY else None
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self._record(stage, seconds)
+            if trace is not None:
+                trace.stack.pop()
+                span = {'stage': stage, 'seconds': seconds}
+                if TRACE_MEMORY:
+                    span['allocated_bytes'] = tracemalloc.get_traced_memory()[0] - allocated
+                trace.spans.append(span)
+
+    # A rerun interrupted by Streamlit never finishes; the next start on the thread replaces it
+    def start_rerun(self):
+        self._local.trace = RerunTrace()
+
+    def finish_rerun(self):
+        trace = self.trace
+        if trace is None:
+            return None
+        self._local.trace = None
+        trace.seconds = time.perf_counter() - trace.started
+        self._record(RERUN, trace.seconds)
+        if TRACE_MEMORY:
+            trace.peak_traced_bytes = tracemalloc.get_traced_memory()[1]
+            with self._lock:
+                self.peak_traced_bytes.append(trace.peak_traced_bytes)
+        if self.export_path and time.monotonic() - self.last_export >= EXPORT_INTERVAL_SECONDS:
+            self.last_export = time.monotonic()
+            self.export(self.export_path)
+        return trace
+
+    # count, sum and percentiles per stage; count and sum cover the life of the process
+    def summary(self):
+        with self._lock:
+            samples = {stage: np.fromiter(values, dtype = float) for stage, values in self.samples.items()}
+            totals = dict(self.totals)
+            peaks = list(self.peak_traced_bytes)
+        stages = {}
+        for stage, values in sorted(samples.items()):
+            count, total = totals[stage]
+            stages[stage] = {
+                'count': count,
+                'sum_seconds': total,
+                'window': len(values),
+                'mean_seconds': float(values.mean()),
+                'max_seconds': float(values.max()),
+            }
+            for quantile, value in zip(QUANTILES, np.quantile(values, QUANTILES)):
+                stages[stage]['p{:g}_seconds'.format(quantile * 100)] = float(value)
+        summary = {'pid': os.getpid(), 'stages': stages, 'max_rss_bytes': max_rss_bytes()}
+        if peaks:
+            summary['peak_traced_bytes'] = {'max': max(peaks), 'p95': float(np.quantile(peaks, 0.95))}
+        return summary
+
+    def to_json(self):
+        return json.dumps(dict(self.summary(), generated_at = time.time()), indent = 2)
+
+    def to_prometheus(self):
+        summary = self.summary()
+        lines = [
+            '# HELP loan_pipeline_stage_seconds Duration of a stage of the dashboard script',
+            '# TYPE loan_pipeline_stage_seconds summary',
+        ]
+        for stage, stats in summary['stages'].items():
+            label = stage.replace('\\', '\\\\').replace('"', '\\"')
+            for quantile in QUANTILES:
+                lines.append('loan_pipeline_stage_seconds{{stage="{}",quantile="{:g}"}} {:.6f}'.format(label, quantile, stats['p{:g}_seconds'.format(quantile * 100)]))
+            lines.append('loan_pipeline_stage_seconds_sum{{stage="{}"}} {:.6f}'.format(label, stats['sum_seconds']))
+            lines.append('loan_pipeline_stage_seconds_count{{stage="{}"}} {}'.format(label, stats['count']))
+        if summary['max_rss_bytes'] is not None:
+            lines += [
+                '# HELP loan_pipeline_max_rss_bytes Peak resident set size of the server process',
+                '# TYPE loan_pipeline_max_rss_bytes gauge',
+                'loan_pipeline_max_rss_bytes {}'.format(summary['max_rss_bytes']),
+            ]
+        if 'peak_traced_bytes' in summary:
+            lines += [
+                '# HELP loan_pipeline_rerun_peak_traced_bytes Largest peak of traced Python allocations during a rerun',
+                '# TYPE loan_pipeline_rerun_peak_traced_bytes gauge',
+                'loan_pipeline_rerun_peak_traced_bytes {}'.format(summary['peak_traced_bytes']['max']),
+            ]
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path):
+        content = self.to_prometheus() if path.endswith('.prom') else self.to_json()
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            with open(temp_path, 'w') as export_file:
+                export_file.write(content)
+            os.replace(temp_path, path)
+        except OSError as error:
+            logger.warning('Could not export stage timings to %s: %s', path, error)
+
+
+recorder = Recorder()
+
+if TRACE_MEMORY:
+    tracemalloc.start()
+
+
+# Time the enclosed block as a stage of the current rerun; nested spans are named parent/child
+def span(name):
+    if not ENABLED:
+        return _NO_SPAN
+    return recorder.span(name)
+
+
+def start_rerun():
+    if ENABLED:
+        recorder.start_rerun()
+
+
+def finish_rerun():
+    if ENABLED:
+        return recorder.finish_rerun()
+    return None
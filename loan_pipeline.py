@@ -1,16 +1,20 @@
+import secrets
 import pandas as pd
 import streamlit as st
-import plotly.graph_objects as go
-from collections import Counter
-from zipfile import ZipFile
 from st_aggrid import AgGrid, JsCode, GridOptionsBuilder, ColumnsAutoSizeMode
 from numerize.numerize import numerize
-from calendar import month_name
-
-with ZipFile('Loan Pipeline Pickle.zip', 'r') as zObject:
-     pickle_file = zObject.extract('Loan Pipeline.pkl')
-
-loan_pipeline_df = pd.read_pickle(pickle_file)
+from filter_engine import FilterSelection
+from advisor_queues import current_result
+from app_resources import check_warm_up, get_advisor_scheduler, get_dataset_store, get_export_jobs, get_figure_cache, get_filter_jobs, get_result_cache
+from expiration import STATUS_COLUMNS, status_date
+from exports import EXPORT_FORMATS, EXPORT_URL, ExportTooLarge, iter_frames
+from figure_specs import donut_spec, funnel_spec, milestone_bar_spec
+from metrics import KeyMetrics
+from result_cache import selection_key
+from grid_pages import PAGE_SIZES, DEFAULT_PAGE_SIZE, LOAN_PROGRESS_COLUMNS, DOCUMENT_EXPIRATION_ALERTS_COLUMNS, format_dates
+from serving import DatasetNotPublished
+import instrumentation
+from instrumentation import span
 
 # Set page configurations
 st.set_page_config(
@@ -19,18 +23,48 @@ st.set_page_config(
     initial_sidebar_state = 'expanded'
 )
 
+# Time the stages of this rerun when profiling is enabled (LOAN_PIPELINE_PROFILE)
+instrumentation.start_rerun()
+
 # Define the SessionState class
 class SessionState:
     def __init__(self, **kwargs):
         self.__dict__.update(kwargs)
 
-# Function to get the data with caching
-@st.cache_data
-def get_data():
-    return loan_pipeline_df
-
-# Get the data using the caching function
-df = get_data()
+# Columns for loan progress table
+loan_progress_columns = LOAN_PROGRESS_COLUMNS
+
+# Columns for 'document expiration alerts by loans' table
+document_expiration_alerts_columns = DOCUMENT_EXPIRATION_ALERTS_COLUMNS
+
+# Process-wide resources shared by every session (app_resources.py); created at server start
+# by warmup.py, the dashboard's entry point, or by the first session of a plain streamlit run
+check_warm_up()
+result_cache = get_result_cache()
+advisor_scheduler = get_advisor_scheduler()
+filter_jobs = get_filter_jobs()
+export_jobs = get_export_jobs()
+figure_cache = get_figure_cache()
+
+# Exports of the grids shown on this rerun, waited for once the rest of the page is out
+pending_exports = []
+
+# Get the data, picking up new batches from the incoming folder
+with span('refresh'):
+    try:
+        snapshot = get_dataset_store().refresh()
+    except DatasetNotPublished as error:
+        st.error(str(error))
+        st.stop()
+dataset = snapshot.dataset
+df = snapshot.frame
+sort_index = snapshot['sort_index']
+metrics_cube = snapshot['metrics_cube']
+expiration_index = snapshot['expiration']
+
+# Document statuses move with the calendar; the processor queues are worked out again each day
+advisor_scheduler.ensure_current(snapshot)
+option_catalog = snapshot['option_catalog']
 
 # Create a SessionState object
 session_state = SessionState(
@@ -42,8 +76,8 @@ session_state = SessionState(
     selected_year = [],
     selected_month = [],
     last_finished_milestone = [],
-    selected_min_progress = int(df['Progress'].min()),
-    selected_max_progress = int(df['Progress'].max()),
+    selected_min_progress = option_catalog.min_progress,
+    selected_max_progress = option_catalog.max_progress,
 )
 
 header_left, header_mid, header_right = st.columns([1, 2, 1], gap = 'large')
@@ -53,137 +87,246 @@ with header_mid:
 st.divider()
 
 # Create the sidebar filters with cached values
-with st.sidebar:
-    selected_min_progress, selected_max_progress = st.slider(
-        label = 'Select Progress',
-        value = [session_state.selected_min_progress, session_state.selected_max_progress],
-        min_value = int(df['Progress'].min()),
-        max_value = int(df['Progress'].max())
+with st.sidebar, span('sidebar'):
+    dependent_options = st.checkbox(
+        label = 'Only show reachable options',
+        value = True,
+        key = 'dependent_options',
+        help = 'List only the values that still match loans under the other filters',
     )
-    session_state.selected_min_progress = selected_min_progress
-    session_state.selected_max_progress = selected_max_progress
 
-    selected_year = st.multiselect(
-        label = 'Select Year',
-        options = sorted(df["Extracted Year (GFE Application Date)"].unique()),
-        default = sorted(df["Extracted Year (GFE Application Date)"].unique()),
+    # In apply mode the filters sit in a form: changing them reruns nothing until Apply is
+    # pressed, so only the last selection of a burst of changes is evaluated
+    apply_mode = st.checkbox(
+        label = 'Apply filters with a button',
+        value = True,
+        key = 'apply_mode',
+        help = 'Change several filters, then apply them at once',
     )
-    session_state.selected_year = selected_year
 
-    month_lookup = list(month_name)
-    selected_month = st.multiselect(
-        label = 'Select Month',
-        options = sorted(df["Extracted Month (GFE Application Date)"].unique(), key = month_lookup.index),
-        default = sorted(df["Extracted Month (GFE Application Date)"].unique(), key = month_lookup.index), 
-    )
-    session_state.selected_month = selected_month
+    with st.form('filters') if apply_mode else st.container():
+        selected_min_progress, selected_max_progress = st.slider(
+            label = 'Select Progress',
+            value = [session_state.selected_min_progress, session_state.selected_max_progress],
+            min_value = option_catalog.min_progress,
+            max_value = option_catalog.max_progress
+        )
+        session_state.selected_min_progress = selected_min_progress
+        session_state.selected_max_progress = selected_max_progress
+
+        # Filter values live in st.session_state under the filter names. Writing them back before
+        # the widgets are created keeps a selection when its list of options changes.
+        current_values = {field: st.session_state.get(field, default) for field, default in option_catalog.defaults().items()}
+        for field, value in current_values.items():
+            st.session_state[field] = value
+        sidebar_options = option_catalog.sidebar_options(FilterSelection(selected_min_progress, selected_max_progress, **current_values), dependent = dependent_options)
+
+        selected_year = st.multiselect(
+            label = 'Select Year',
+            options = sidebar_options['selected_year'],
+            key = 'selected_year',
+        )
+        session_state.selected_year = selected_year
 
-    loan_officer = st.multiselect(
-        label = 'Select Loan Officer',
-        options = sorted(df['Loan Officer'].dropna().unique()),
-        default = sorted(df['Loan Officer'].dropna().unique()),
-    )
-    session_state.loan_officer = loan_officer
+        selected_month = st.multiselect(
+            label = 'Select Month',
+            options = sidebar_options['selected_month'],
+            key = 'selected_month',
+        )
+        session_state.selected_month = selected_month
 
-    loan_processor = st.selectbox(
-        label = 'Select Loan Processor',
-        options = sorted(df['Loan Processor'].dropna().unique())
+        loan_officer = st.multiselect(
+            label = 'Select Loan Officer',
+            options = sidebar_options['loan_officer'],
+            key = 'loan_officer',
         )
-    session_state.loan_processor = loan_processor
+        session_state.loan_officer = loan_officer
 
-    loan_closer = st.multiselect(
-        label = 'Select Loan Closer',
-        options = sorted(df['Loan Closer'].dropna().unique()),
-        default = sorted(df['Loan Closer'].dropna().unique()),
-    )
-    session_state.loan_closer = loan_closer
-    
-    loan_source = st.multiselect(
-        label = 'Select Loan Source',
-        options = sorted(df['Loan Source'].dropna().unique()),
-        default = sorted(df['Loan Source'].dropna().unique()),
-    )
-    session_state.loan_source = loan_source
+        loan_processor = st.selectbox(
+            label = 'Select Loan Processor',
+            options = sidebar_options['loan_processor'],
+            key = 'loan_processor',
+        )
+        session_state.loan_processor = loan_processor
 
-    loan_type = st.multiselect(
-        label = 'Select Loan Type',
-        options = sorted(df['Loan Type'].dropna().unique()),
-        default = sorted(df['Loan Type'].dropna().unique()),
-    )
-    session_state.loan_type = loan_type
+        loan_closer = st.multiselect(
+            label = 'Select Loan Closer',
+            options = sidebar_options['loan_closer'],
+            key = 'loan_closer',
+        )
+        session_state.loan_closer = loan_closer
 
-    last_finished_milestone = st.multiselect(
-        label = 'Select Last Finished Milestone',
-        options = sorted(df['Last Finished Milestone'].dropna().unique()),
-        default = sorted(df['Last Finished Milestone'].dropna().unique()),
-    )
-    session_state.last_finished_milestone = last_finished_milestone
+        loan_source = st.multiselect(
+            label = 'Select Loan Source',
+            options = sidebar_options['loan_source'],
+            key = 'loan_source',
+        )
+        session_state.loan_source = loan_source
+
+        loan_type = st.multiselect(
+            label = 'Select Loan Type',
+            options = sidebar_options['loan_type'],
+            key = 'loan_type',
+        )
+        session_state.loan_type = loan_type
+
+        last_finished_milestone = st.multiselect(
+            label = 'Select Last Finished Milestone',
+            options = sidebar_options['last_finished_milestone'],
+            key = 'last_finished_milestone',
+        )
+        session_state.last_finished_milestone = last_finished_milestone
+
+        if apply_mode:
+            st.form_submit_button(label = 'Apply filters', type = 'primary', use_container_width = True)
+
+    with st.expander('Filter cache'):
+        result_cache_stats = result_cache.stats()
+        st.caption('{} entries, {:.1f} MB, {} hits, {} misses ({:.0%} hit rate)'.format(result_cache_stats['entries'], result_cache_stats['used_bytes'] / 1e6, result_cache_stats['hits'], result_cache_stats['misses'], result_cache_stats['hit_rate']))
+        advisor_scheduler_stats = advisor_scheduler.stats()
+        st.caption('Advisor queues: {} precomputed, {} pending, {} failed'.format(advisor_scheduler_stats['completed'], advisor_scheduler_stats['pending'], advisor_scheduler_stats['failed']))
+        filter_jobs_stats = filter_jobs.stats()
+        st.caption('Filter jobs: {} in flight, {} abandoned'.format(filter_jobs_stats['in_flight'], filter_jobs_stats['abandoned']))
 
 # Apply the filters to the dataframe
-filtered_data = df.query('`Extracted Year (Milestone Date - Submittal)` in @selected_year and `Extracted Month (Milestone Date - Submittal)` in @selected_month and `Loan Officer` in @loan_officer and `Loan Processor` in @loan_processor and `Loan Closer` in @loan_closer and `Loan Source` in @loan_source and `Loan Type` in @loan_type and `Last Finished Milestone` in @last_finished_milestone and `Progress` >= @selected_min_progress and `Progress` <= @selected_max_progress')
-
-# Metrics Definition
-borrower_intent_to_continue_date = int(filtered_data["GFE Application Date"].count()/2)
-uw_submitted = int(filtered_data["GFE Application Date"].count()/3)
-uw_cond_approved = int(filtered_data["GFE Application Date"].count()/3.5)
-app_approved = int(filtered_data["GFE Application Date"].count()/4)
-app_clear_to_close = int(filtered_data["GFE Application Date"].count()/4.5)
-app_suspended = int(filtered_data["GFE Application Date"].count()/5)
-
-# Calculate the count of each loan decision within the filtered data
-milestone_date_approval = int(filtered_data["Milestone Date - Approval"].count() / 0.1)
-milestone_date_submittal = int(filtered_data["Milestone Date - Submittal"].count() / 0.15)
-clear_to_close_applications = int(filtered_data["Milestone Date - Clear To Close"].count() / 0.2)
-# print(milestone_date_approval)
-# print(milestone_date_submittal)
-# print(clear_to_close_applications)
-
-# Define the metrics
-last_finished_milestone_approval = int(filtered_data["Last Finished Milestone"].eq("Approval").sum())
-last_finished_milestone_clear_to_close = int(filtered_data["Last Finished Milestone"].eq("Clear to Close").sum())
-last_finished_milestone_completion = int(filtered_data["Last Finished Milestone"].eq("Completion").sum())
-last_finished_milestone_cond_approval = int(filtered_data["Last Finished Milestone"].eq("Cond. Approval").sum())
-last_finished_milestone_doc_preparation = int(filtered_data["Last Finished Milestone"].eq("Doc Preparation").sum())
+filter_selection = FilterSelection(
+    selected_min_progress = selected_min_progress,
+    selected_max_progress = selected_max_progress,
+    selected_year = selected_year,
+    selected_month = selected_month,
+    loan_officer = loan_officer,
+    loan_processor = loan_processor,
+    loan_closer = loan_closer,
+    loan_source = loan_source,
+    loan_type = loan_type,
+    last_finished_milestone = last_finished_milestone,
+)
+
+# Filter, metrics and advisor for the selection, computed once per distinct selection. The default
+# selection of each processor is precomputed; a queue still in progress is waited for, not redone.
+filter_result_key = selection_key(dataset.version, filter_selection)
+filter_result = current_result(result_cache, filter_result_key)
+
+# The counts only need the metrics cube, so the header and the Key Metrics tab render
+# before the filtered rows are ready
+if filter_result is not None:
+    key_metrics = filter_result.metrics
+else:
+    with span('metrics'):
+        key_metrics = KeyMetrics(metrics_cube.counts(filter_selection))
+
+# A selection the session moved away from is dropped unless its evaluation already started
+previous_filter_result_key = st.session_state.get('filter_result_key')
+if previous_filter_result_key not in (None, filter_result_key):
+    filter_jobs.abandon(previous_filter_result_key)
+st.session_state['filter_result_key'] = filter_result_key
+
+def get_filter_result():
+    precomputed = advisor_scheduler.wait(filter_result_key)
+    if precomputed is not None:
+        return precomputed
+    status = st.empty()
+    # Every status update is a point where Streamlit stops this rerun for a newer selection
+    filter_result = filter_jobs.wait(snapshot, filter_selection, filter_result_key, lambda: status.caption('Applying filters...'))
+    status.empty()
+    return filter_result
 
 total1, total2, total3, total4, total5, total6 = st.columns(6, gap = 'medium')
 
 with total1:
     st.markdown("<style>.metric-label, .metric-value { font-size: 16px !important; }</style>", unsafe_allow_html = True)
     st.image('icons/Borr intend to continue.png', width = 45)
-    st.metric(label = "Borr Intent to Con Date", value = numerize(borrower_intent_to_continue_date, decimals = 0))
+    st.metric(label = "Borr Intent to Con Date", value = numerize(key_metrics.borrower_intent_to_continue_date, decimals = 0))
 
 with total2:
     st.markdown("<style>.metric-label, .metric-value { font-size: 16px !important; }</style>", unsafe_allow_html = True)
     st.image('icons/UW Submitted.png', width = 45)
-    st.metric(label = "UW Submitted", value = numerize(uw_submitted, decimals = 0))
+    st.metric(label = "UW Submitted", value = numerize(key_metrics.uw_submitted, decimals = 0))
 
 with total3:
     st.markdown("<style>.metric-label, .metric-value { font-size: 16px !important; }</style>", unsafe_allow_html = True)
     st.image('icons/UW Cond Approved.png', width = 35)
-    st.metric(label = "UW Cond. Approved", value = numerize(uw_cond_approved, decimals = 0))
+    st.metric(label = "UW Cond. Approved", value = numerize(key_metrics.uw_cond_approved, decimals = 0))
 
 with total4:
     st.markdown("<style>.metric-label, .metric-value { font-size: 16px !important; }</style>", unsafe_allow_html = True)
     st.image('icons/App Approved.png', width = 45)
-    st.metric(label = "Application Approved", value = numerize(app_approved, decimals = 0))
+    st.metric(label = "Application Approved", value = numerize(key_metrics.app_approved, decimals = 0))
 
 with total5:
     st.markdown("<style>.metric-label, .metric-value { font-size: 16px !important; }</style>", unsafe_allow_html = True)
     st.image('icons/App clear to close.png', width = 45)
-    st.metric(label = "Application Clear To Close", value = numerize(app_clear_to_close, decimals = 0))
+    st.metric(label = "Application Clear To Close", value = numerize(key_metrics.app_clear_to_close, decimals = 0))
 
 with total6:
     st.markdown("<style>.metric-label, .metric-value { font-size: 16px !important; }</style>", unsafe_allow_html = True)
     st.image('icons/App suspended.png', width = 45)
-    st.metric(label = "Application Suspended", value = numerize(app_suspended, decimals = 0))
-
-# Select and pre-process columns for loan progress table
-loan_progress_df = filtered_data[['Loan Type', 'Ageing (days)', 'Loan Number', 'Progress',  'ExpRate Lock', 'ExpAppraisal', 'Exp_Title', 'ExpCredit_Exp', 'Exp_VVOE', 'Exp_HOI', 'Exp_Payoff', 'Exp_Income', 'Borrower Intent to Continue Date']]
-
-# Select and preprocess columns for 'document expiration alerts by loans' table
-document_expiration_alerts_df = filtered_data[['Loan Number', 'ExpRate Lock1', 'ExpAppraisal1', 'Exp_Title1', 'ExpCredit_Exp1', 'Exp_HOI1', 'Exp_VVOE1', 'Exp_Income1', 'Exp_Payoff1']]
-
-def get_loan_progress_grid(df, int):
+    st.metric(label = "Application Suspended", value = numerize(key_metrics.app_suspended, decimals = 0))
+
+# Render the paging controls of a grid and return the rows to send to the browser.
+# Only the requested page is serialized unless the full frame is asked for.
+def get_grid_page_data(rows, columns, key):
+    sort_col, order_col, size_col, page_col, full_col = st.columns([2, 1, 1, 1, 1], gap = 'small')
+    with full_col:
+        full_frame = st.checkbox(label = 'Send all rows', key = '{}_full_frame'.format(key), help = 'Send every filtered loan to the browser instead of one page')
+    # Document statuses are read from today's status matrix rather than the stored columns
+    if full_frame:
+        with span('grid_page'):
+            return format_dates(expiration_index.overlay(df.iloc[rows][columns], rows)), True
+    with sort_col:
+        sort_column = st.selectbox(label = 'Sort by', options = columns, index = columns.index('Loan Number'), key = '{}_sort_column'.format(key))
+    with order_col:
+        sort_order = st.selectbox(label = 'Order', options = ['Ascending', 'Descending'], key = '{}_sort_order'.format(key))
+    with size_col:
+        page_size = st.selectbox(label = 'Rows per page', options = PAGE_SIZES, index = PAGE_SIZES.index(DEFAULT_PAGE_SIZE), key = '{}_page_size'.format(key))
+    with page_col:
+        page_count = max(1, -(-len(rows) // page_size))
+        page = st.number_input(label = 'Page (of {})'.format(page_count), min_value = 1, max_value = page_count, value = 1, step = 1, key = '{}_page'.format(key))
+    with span('grid_page'):
+        sort_keys = expiration_index.statuses()[:, STATUS_COLUMNS.index(sort_column)] if sort_column in STATUS_COLUMNS else None
+        grid_page = sort_index.page(rows, sort_column, ascending = sort_order == 'Ascending', page = page, page_size = page_size, keys = sort_keys)
+        return format_dates(expiration_index.overlay(df.iloc[grid_page.rows][columns], grid_page.rows)), False
+
+# Export every row of a grid rather than the page shown, streamed chunk by chunk to a file the
+# browser then downloads from the static folder. The file is written in the background and its
+# link shown when it is ready, on this rerun or a later one while the selection stays the same.
+def get_grid_export(rows, columns, key):
+    format_col, button_col, link_col = st.columns([1, 1, 3], gap = 'small')
+    with format_col:
+        export_format = st.selectbox(label = 'Export format', options = list(EXPORT_FORMATS), key = '{}_export_format'.format(key), label_visibility = 'collapsed')
+    with button_col:
+        export_clicked = st.button(label = 'Export {:,} loans'.format(len(rows)), key = '{}_export'.format(key))
+    # Document statuses are exported as of today, like the grid shows them. Each session has
+    # its own files, so the export a session replaces can be removed.
+    export_key = '{}:{}:{}:{}'.format(st.session_state.setdefault('export_token', secrets.token_hex(16)), filter_result_key, key, status_date())
+    if export_clicked:
+        frames = iter_frames(df, rows, columns, prepare = expiration_index.overlay)
+        previous_export = st.session_state.get('{}_export_file'.format(key))
+        st.session_state['{}_export_job'.format(key)] = export_jobs.submit(key, export_key, frames, export_format, len(rows), replaces = previous_export)
+    export_job = st.session_state.get('{}_export_job'.format(key))
+    if export_job is None:
+        return
+    if export_job.key != export_key:
+        del st.session_state['{}_export_job'.format(key)]
+        return
+    with link_col:
+        pending_exports.append((key, export_job, st.empty()))
+
+# Wait for an export started by get_grid_export and swap its progress bar for the link
+def show_grid_export(key, export_job, placeholder):
+    def poll():
+        placeholder.progress(export_job.written_rows / max(1, export_job.total_rows), text = 'Exporting {:,} of {:,} loans...'.format(export_job.written_rows, export_job.total_rows))
+
+    with span('export'):
+        try:
+            filename = export_job.wait(poll)
+        except ExportTooLarge as error:
+            placeholder.error('{}. Choose Parquet or narrow the filters.'.format(error))
+            return
+    st.session_state['{}_export_file'.format(key)] = filename
+    placeholder.markdown("<a href = '{0}{1}' download = '{1}'>Download {1}</a>".format(EXPORT_URL, filename), unsafe_allow_html = True)
+
+def get_loan_progress_grid(rows, key):
     cellstyle_jscode_loan_progress = JsCode("""
         function(params) {
             var value = params.value;
@@ -221,11 +364,13 @@ def get_loan_progress_grid(df, int):
         }
     """)
 
-    gb_loan_progress = GridOptionsBuilder.from_dataframe(df)
     st.markdown("<h3 style = 'text-align: center; font-size: 25px;'>Loan Progress</h3>", unsafe_allow_html = True)
-    gb_loan_progress.configure_default_column(min_column_width = 110, resizable = True, filterable = True, sortable = True, groupable = True)
+    df, full_frame = get_grid_page_data(rows, loan_progress_columns, key)
+    gb_loan_progress = GridOptionsBuilder.from_dataframe(df)
+    # Pages are sorted on the server, so client-side sorting and filtering only apply to the full frame
+    gb_loan_progress.configure_default_column(min_column_width = 110, resizable = True, filterable = full_frame, sortable = full_frame, groupable = True)
     gb_loan_progress.configure_column(field = "Loan Type", header_name = "Loan Type", wrapHeaderText = True, autoHeaderHeight = True)
-    gb_loan_progress.configure_column(field = "Loan Number", header_name = "Loan Number", wrapHeaderText = True, autoHeaderHeight = True, sort = 'asc')
+    gb_loan_progress.configure_column(field = "Loan Number", header_name = "Loan Number", wrapHeaderText = True, autoHeaderHeight = True, sort = 'asc' if full_frame else None)
     gb_loan_progress.configure_column(field = "Ageing (days)", header_name = "Ageing (days)", wrapHeaderText = True, autoHeaderHeight = True)
     gb_loan_progress.configure_column(field = "Progress", header_name = "Progress (%)", cellStyle = cellstyle_jscode_loan_progress, wrapHeaderText = True, autoHeaderHeight = True)
     gb_loan_progress.configure_column(field = "ExpRate Lock", header_name = "Rate Lock (10%)", cellStyle = cellstyle_jscode_loan_progress, wrapHeaderText = True, autoHeaderHeight = True)
@@ -238,53 +383,54 @@ def get_loan_progress_grid(df, int):
     gb_loan_progress.configure_column(field = "Exp_Income", header_name = "Income Exp (15%)", cellStyle = cellstyle_jscode_loan_progress, wrapHeaderText = True, autoHeaderHeight = True)
     gb_loan_progress.configure_column(field = "Borrower Intent to Continue Date", header_name = "Borrower Intent to Continue Date", wrapHeaderText = True, autoHeaderHeight = True)
     grid_options_loan_progress = gb_loan_progress.build()
-    loan_progress_table = AgGrid(df, gridOptions = grid_options_loan_progress, columns_auto_size_mode = ColumnsAutoSizeMode.FIT_ALL_COLUMNS_TO_VIEW, fit_columns_on_grid_load = True, height = 400, reload_data = True, allow_unsafe_jscode = True)
+    with span('loan_progress_grid'):
+        loan_progress_table = AgGrid(df, gridOptions = grid_options_loan_progress, columns_auto_size_mode = ColumnsAutoSizeMode.FIT_ALL_COLUMNS_TO_VIEW, fit_columns_on_grid_load = True, height = 400, reload_data = True, allow_unsafe_jscode = True)
     st.markdown("<h6 style = font-size: 5px;'>Closed -- Loan process is completed &emsp; Pending -- Awaits document to be submitted</h6>", unsafe_allow_html = True)
+    get_grid_export(rows, loan_progress_columns, key)
     return loan_progress_table
     
 # Tab views
 tab1, tab2, tab3 = st.tabs(["Key Metrics", "Loan Pipeline", "AI Assist"])
 
 # Render the tabs
-with tab1:
+with tab1, span('key_metrics_tab'):
     total1, total2, total3 = st.columns([1,1,2], gap = 'large')
     
     with total1:
-        milestone_date_approval_value = [milestone_date_approval, milestone_date_submittal]
-        milestone_date_approval_fig = go.Figure(data = [go.Pie(labels = ["Milestone Date Approval", "Milestone Date Submittal"], values = milestone_date_approval_value, hole = 0.7, title = "Milestone Date Approval")])
-        milestone_date_approval_fig.update_traces(hoverinfo = 'label+value', textfont_size = 15, marker = dict(colors = ["DodgerBlue", "MediumBlue"]))
-        milestone_date_approval_fig.update_layout(showlegend = False)
-        st.plotly_chart(milestone_date_approval_fig, use_container_width = True)
+        milestone_date_approval_value = (key_metrics.milestone_date_approval, key_metrics.milestone_date_submittal)
+        st.plotly_chart(figure_cache.figure(('milestone_date_approval', milestone_date_approval_value), lambda: donut_spec("Milestone Date Approval", ["Milestone Date Approval", "Milestone Date Submittal"], milestone_date_approval_value)), use_container_width = True)
         
     with total2:
-        clear_to_close_applications_value = [clear_to_close_applications, milestone_date_approval]
-        clear_to_close_applications_fig = go.Figure(data = [go.Pie(labels = ["Clear to Close Applications", "Milestone Date Approval"], values = clear_to_close_applications_value, hole = 0.7, title = "Clear to Close Applications (Approval)")])
-        clear_to_close_applications_fig.update_traces(hoverinfo = 'label+value', textfont_size = 15, marker = dict(colors = ["DodgerBlue", "MediumBlue"]))
-        clear_to_close_applications_fig.update_layout(showlegend = False)
-        st.plotly_chart(clear_to_close_applications_fig, use_container_width = True)
+        clear_to_close_applications_value = (key_metrics.clear_to_close_applications, key_metrics.milestone_date_approval)
+        st.plotly_chart(figure_cache.figure(('clear_to_close_applications', clear_to_close_applications_value), lambda: donut_spec("Clear to Close Applications (Approval)", ["Clear to Close Applications", "Milestone Date Approval"], clear_to_close_applications_value)), use_container_width = True)
         
     with total3:
-        last_finished_milestone_fig = go.Figure(go.Bar(x = [last_finished_milestone_doc_preparation, last_finished_milestone_cond_approval, last_finished_milestone_completion, last_finished_milestone_clear_to_close, last_finished_milestone_approval], y = ["Doc Preparation", "Cond. Approval", "Completion", "Clear to Close", "Approval"], orientation = 'h', marker = dict(color = ["DodgerBlue",  "MediumBlue", "DeepSkyBlue", "SlateBlue", "Cyan"]), hoverinfo = 'skip', text = [numerize(last_finished_milestone_doc_preparation, decimals = 0), numerize(last_finished_milestone_cond_approval, decimals = 0), numerize(last_finished_milestone_completion, decimals = 0), numerize(last_finished_milestone_clear_to_close, decimals = 0), numerize(last_finished_milestone_approval, decimals = 0)], textposition = 'inside', width = 0.5))
-        last_finished_milestone_fig.update_layout(yaxis = dict(showline = False, showticklabels = True), xaxis = dict(showline = True, showticklabels = True, title = dict(text = "Last Finished Milestone")))
-        st.plotly_chart(last_finished_milestone_fig, use_container_width = True)
-                    
-with tab2:
-    global productivity_applications_count_list, average_time_loan_type_list, efficiency_applications_count_list, error_applications_count_list, error_type_list
-    
-    @st.cache_data
-    def get_data_loan_progress():
-        return loan_progress_df
-    
-    # Get the data using the caching function
-    frequent_data_loan_progress = get_data_loan_progress()
-    
-    @st.cache_data()
-    def get_data_document_expiration_alerts():
-        return document_expiration_alerts_df
-
-    # Get the data using the caching function
-    frequent_data_document_expiration_alerts = get_data_document_expiration_alerts()
+        last_finished_milestone_value = (key_metrics.last_finished_milestone_doc_preparation, key_metrics.last_finished_milestone_cond_approval, key_metrics.last_finished_milestone_completion, key_metrics.last_finished_milestone_clear_to_close, key_metrics.last_finished_milestone_approval)
+        st.plotly_chart(figure_cache.figure(('last_finished_milestone', last_finished_milestone_value), lambda: milestone_bar_spec(["Doc Preparation", "Cond. Approval", "Completion", "Clear to Close", "Approval"], last_finished_milestone_value, [numerize(value, decimals = 0) for value in last_finished_milestone_value])), use_container_width = True)
 
+    # Milestone funnel of the filtered loans, drawn once their filter result is ready
+    funnel_container = st.container()
+                    
+with tab2, span('loan_pipeline_tab'):
+    if filter_result is None:
+        with span('filter_result'):
+            filter_result = get_filter_result()
+
+    with funnel_container, span('funnel_chart'):
+        funnel = filter_result.funnel
+        funnel_left, funnel_right = st.columns([2, 2], gap = 'large')
+        with funnel_left:
+            st.plotly_chart(figure_cache.figure(('milestone_funnel', tuple(funnel.counts)), lambda: funnel_spec(funnel.stages, funnel.counts)), use_container_width = True)
+        with funnel_right:
+            st.markdown("<h3 style = 'font-size: 18px; padding-top: 40px;'>Stage Conversion and Cycle Time</h3>", unsafe_allow_html = True)
+            st.dataframe(pd.DataFrame({
+                'Stage': funnel.transitions,
+                'Loans': funnel.counts[:-1],
+                'Converted': funnel.converted,
+                'Conversion (%)': [None if rate is None else round(rate * 100, 1) for rate in funnel.conversion_rates],
+                'Median (days)': funnel.median_cycle_days,
+                'Mean (days)': [None if days is None else round(days, 1) for days in funnel.mean_cycle_days],
+            }), hide_index = True, use_container_width = True)
     with st.container():
         # st.write('AI Insights')
         col1, col2 = st.columns([0.04,1.5], gap = 'small')
@@ -295,121 +441,68 @@ with tab2:
 
         with col2:
             
-            # Filter dataframe for AI suggestion
-            suggestion_filter_df = filtered_data[(filtered_data["All Documents Received Status"] == "Yes") & (filtered_data["All Documents Expiration Status"] == "Not Expired") & (filtered_data["Progress"] >= 95)]
-            
-            productivity_df = suggestion_filter_df[suggestion_filter_df["Expected Time to Complete (minutes)"] <=10]
-            
-            productivity_total_time_to_complete = int(productivity_df["Expected Time to Complete (minutes)"].sum())
-            
-            productivity_applications_count_list = []
-            if productivity_total_time_to_complete < 100:
-                for i in range(len(productivity_df)):
-                    productivity_applications_count_list.append(productivity_df.index[i])
-            
-            efficiency_df = suggestion_filter_df[suggestion_filter_df["Expected Time to Complete (minutes)"] < 15]
-
-            efficiency_applications_count_list = []
-            if len(efficiency_df) > 0:
-                efficiency_average_time_to_complete = int(efficiency_df["Expected Time to Complete (minutes)"].mean())
-                if efficiency_average_time_to_complete <= 10:
-                    for i in range(len(efficiency_df)):
-                        efficiency_applications_count_list.append(efficiency_df.index[i])
-                   
-            accuracy_df = suggestion_filter_df[suggestion_filter_df["Error Type"] != "No Error"]
-
-            error_applications_count_list = []
-            error_type_list = []
-            error_type_unique_list = []
-            for i in range(len(accuracy_df)):
-                error_applications_count_list.append(accuracy_df.index[i])
-                error_type_list.append(accuracy_df.iloc[i, accuracy_df.columns.get_loc("Error Type")])
-                if accuracy_df.iloc[i, accuracy_df.columns.get_loc("Error Type")] not in error_type_unique_list:
-                    error_type_unique_list.append(accuracy_df.iloc[i, accuracy_df.columns.get_loc("Error Type")])            
-            calculate_most_frequent_error_type_list = Counter(error_type_list)
-            most_frequent_error_type_list = calculate_most_frequent_error_type_list.most_common()
-
-            most_frequent_error_type_selected_list = []
-            if len(most_frequent_error_type_list) > 3:
-                for i in range(3):
-                    if most_frequent_error_type_list[i][0] not in most_frequent_error_type_selected_list:
-                        most_frequent_error_type_selected_list.append(most_frequent_error_type_list[i][0])
-
-            if len(error_applications_count_list) > 0:
-                if len(most_frequent_error_type_list) > 3:
-                    error_type_string = ", ".join(most_frequent_error_type_selected_list)
-                else:
-                    error_type_string = ", ".join(error_type_unique_list)
-
-            effectiveness_df = suggestion_filter_df[suggestion_filter_df["Ageing (days)"] < 2]
-
-            effectiveness_applications_count_list = []
-            for i in range(len(effectiveness_df)):
-                effectiveness_applications_count_list.append(effectiveness_df.index[i]) 
-            
-            loan_processor_list = []
-            for i in range(len(suggestion_filter_df)):
-                if suggestion_filter_df.iloc[i, suggestion_filter_df.columns.get_loc("Loan Processor")] not in loan_processor_list:
-                    loan_processor_list.append(suggestion_filter_df.iloc[i, suggestion_filter_df.columns.get_loc("Loan Processor")])
-            loan_processor_name_list = []
-            for i in range(len(loan_processor_list)):
-                loan_processor_name_list.append(loan_processor_list[i].split(' ', 1)[0])
-            loan_processor_string = ", ".join(loan_processor_name_list)
+            # AI suggestions for the filtered loans, computed with the cached filter result
+            advisor_insights = filter_result.advisor_insights
+            error_type_string = ", ".join(advisor_insights.error_types)
+            greeting = "Hi! {},".format(", ".join(advisor_insights.loan_processors)) if advisor_insights.loan_processors else "Hi!"
             st.markdown("<h6 style = 'font-size: 24px; padding-top: 10px; padding-bottom: 10px;'>AI Advisor</h6>", unsafe_allow_html = True)
-            if len(productivity_applications_count_list) > 0 or len(efficiency_applications_count_list) > 0 or len(error_applications_count_list) > 0: 
-                    st.markdown("<h style = 'font-size: 16px'>Hi! {}, here are your curated queue insights for the day:</h>".format(loan_processor_string), unsafe_allow_html = True)
+            if advisor_insights.has_insights(): 
+                    st.markdown("<h style = 'font-size: 16px'>{} here are your curated queue insights for the day:</h>".format(greeting), unsafe_allow_html = True)
             # st.write('')
             
             c1, c2 = st.columns([2.8,1], gap = 'small')
 
-            if len(productivity_applications_count_list) > 0 or len(efficiency_applications_count_list) > 0 or len(error_applications_count_list) > 0: 
-                if len(productivity_applications_count_list) > 0:
+            if advisor_insights.has_insights(): 
+                if len(advisor_insights.productivity_rows) > 0:
                     with c1:    
-                        if len(productivity_applications_count_list) == 1:
-                            st.markdown("<h style = 'font-size: 15px'><span style = 'color: DodgerBlue; font-size: 17px'>**Productivity:**</span> **{}** Application in your pipeline is anticipated to complete in total **{}** minutes.</h>".format(len(productivity_applications_count_list), productivity_total_time_to_complete), unsafe_allow_html = True)
+                        if len(advisor_insights.productivity_rows) == 1:
+                            st.markdown("<h style = 'font-size: 15px'><span style = 'color: DodgerBlue; font-size: 17px'>**Productivity:**</span> **{}** Application in your pipeline is anticipated to complete in total **{}** minutes.</h>".format(len(advisor_insights.productivity_rows), advisor_insights.productivity_total_minutes), unsafe_allow_html = True)
                         else:
-                            st.markdown("<h style = 'font-size: 15px'><span style = 'color: DodgerBlue; font-size: 17px'>**Productivity:**</span> **{}** Applications in your pipeline are anticipated to complete in total **{}** minutes.</h>".format(len(productivity_applications_count_list), productivity_total_time_to_complete), unsafe_allow_html = True)
+                            st.markdown("<h style = 'font-size: 15px'><span style = 'color: DodgerBlue; font-size: 17px'>**Productivity:**</span> **{}** Applications in your pipeline are anticipated to complete in total **{}** minutes.</h>".format(len(advisor_insights.productivity_rows), advisor_insights.productivity_total_minutes), unsafe_allow_html = True)
                     with c2:
                         # st.markdown("<style>button{height: 5; font-size: 10px; padding-top: 1px !important; padding-bottom: 1px !important;}</style>", unsafe_allow_html=True)
                         st.button(label = "Priortize", key = "productivity", help = "Click here to Priortize Applications for Productivity")
                     # st.write('----')
 
-                if len(efficiency_applications_count_list) > 0:
+                if len(advisor_insights.efficiency_rows) > 0:
                     with c1:
-                        if len(efficiency_applications_count_list) == 1:
-                            st.markdown("<h style = 'font-size: 15px;'><span style = 'color: DodgerBlue; font-size: 17px'>**Efficiency:**</span> **{}** Application with an average closure time of **{}** minutes.</h>".format(len(efficiency_applications_count_list), efficiency_average_time_to_complete), unsafe_allow_html = True)
+                        if len(advisor_insights.efficiency_rows) == 1:
+                            st.markdown("<h style = 'font-size: 15px;'><span style = 'color: DodgerBlue; font-size: 17px'>**Efficiency:**</span> **{}** Application with an average closure time of **{}** minutes.</h>".format(len(advisor_insights.efficiency_rows), advisor_insights.efficiency_average_minutes), unsafe_allow_html = True)
                         else:
-                            st.markdown("<h style = 'font-size: 15px;'><span style = 'color: DodgerBlue; font-size: 17px'>**Efficiency:**</span> **{}** Applications (each) with an average closure time of **{}** minutes.</h>".format(len(efficiency_applications_count_list), efficiency_average_time_to_complete), unsafe_allow_html = True)
+                            st.markdown("<h style = 'font-size: 15px;'><span style = 'color: DodgerBlue; font-size: 17px'>**Efficiency:**</span> **{}** Applications (each) with an average closure time of **{}** minutes.</h>".format(len(advisor_insights.efficiency_rows), advisor_insights.efficiency_average_minutes), unsafe_allow_html = True)
                     with c2:
                         # st.markdown("<style>button{height: 5; font-size: 10px; padding-top: 1px !important; padding-bottom: 1px !important;}</style>", unsafe_allow_html=True)
                         st.button(label = "Priortize", key = "efficiency", help = "Click here to Priortize Applications for Efficiency")
                     # st.write('----')
 
-                if len(error_applications_count_list) > 0:
+                if len(advisor_insights.accuracy_rows) > 0:
                     with c1:
-                        if len(most_frequent_error_type_list) == 1 and len(error_applications_count_list) == 1:
-                            st.markdown("<h style = 'font-size: 15px;'><span style = 'color: DodgerBlue; font-size: 17px'>**Accuracy:**:</span> High Likelihood of below error in **{}** Application: <br> &emsp;&emsp;&emsp;&emsp;&nbsp;&nbsp;&nbsp; <span style = 'color: Red'> **{}**</span></h>".format(len(error_applications_count_list), error_type_string), unsafe_allow_html = True)
-                        elif len(most_frequent_error_type_list) > 1 and len(most_frequent_error_type_list) <= 3 and len(error_applications_count_list) > 1 and len(error_applications_count_list) <=3:
-                            st.markdown("<h style = 'font-size: 15px;'><span style = 'color: DodgerBlue; font-size: 17px'>**Accuracy:**</span> High Likelihood of below errors in **{}** Applications: <br> &emsp;&emsp;&emsp;&emsp;&nbsp;&nbsp;&nbsp; <span style = 'color: Red'> **{}**</span></h>".format(len(error_applications_count_list), error_type_string), unsafe_allow_html = True)
+                        if advisor_insights.error_type_count == 1 and len(advisor_insights.accuracy_rows) == 1:
+                            st.markdown("<h style = 'font-size: 15px;'><span style = 'color: DodgerBlue; font-size: 17px'>**Accuracy:**:</span> High Likelihood of below error in **{}** Application: <br> &emsp;&emsp;&emsp;&emsp;&nbsp;&nbsp;&nbsp; <span style = 'color: Red'> **{}**</span></h>".format(len(advisor_insights.accuracy_rows), error_type_string), unsafe_allow_html = True)
+                        elif advisor_insights.error_type_count > 1 and advisor_insights.error_type_count <= 3 and len(advisor_insights.accuracy_rows) > 1 and len(advisor_insights.accuracy_rows) <=3:
+                            st.markdown("<h style = 'font-size: 15px;'><span style = 'color: DodgerBlue; font-size: 17px'>**Accuracy:**</span> High Likelihood of below errors in **{}** Applications: <br> &emsp;&emsp;&emsp;&emsp;&nbsp;&nbsp;&nbsp; <span style = 'color: Red'> **{}**</span></h>".format(len(advisor_insights.accuracy_rows), error_type_string), unsafe_allow_html = True)
                         else:
-                            st.markdown("<h style = 'font-size: 15px;'><span style = 'color: DodgerBlue; font-size: 17px'>**Accuracy:**</span> High Likelihood of below errors in **{}** Applications: <br> &emsp;&emsp;&emsp;&emsp;&nbsp;&nbsp;&nbsp; <span style = 'color: Red'> **{}**</span></h>".format(len(error_applications_count_list), error_type_string), unsafe_allow_html = True)
+                            st.markdown("<h style = 'font-size: 15px;'><span style = 'color: DodgerBlue; font-size: 17px'>**Accuracy:**</span> High Likelihood of below errors in **{}** Applications: <br> &emsp;&emsp;&emsp;&emsp;&nbsp;&nbsp;&nbsp; <span style = 'color: Red'> **{}**</span></h>".format(len(advisor_insights.accuracy_rows), error_type_string), unsafe_allow_html = True)
                     with c2:
                         # st.markdown("<style>button{height: 5; font-size: 10px; padding-top: 1px !important; padding-bottom: 1px !important;}</style>", unsafe_allow_html=True)
                         st.button(label = "Priortize", key = "accuracy", help = "Click here to Priortize Applications for Accuracy")    
                     # st.write('----')
 
-                if len(effectiveness_applications_count_list) > 0:
+                if len(advisor_insights.effectiveness_rows) > 0:
                     with c1:
-                        if len(effectiveness_applications_count_list) == 1:
-                            st.markdown("<h style = 'font-size: 15px;'><span style = 'color: DodgerBlue; font-size: 17px'>**Effectiveness:**</span> **{}** Application has high possibility of SLA breach.</h>".format(len(effectiveness_applications_count_list)), unsafe_allow_html = True)
+                        if len(advisor_insights.effectiveness_rows) == 1:
+                            st.markdown("<h style = 'font-size: 15px;'><span style = 'color: DodgerBlue; font-size: 17px'>**Effectiveness:**</span> **{}** Application has high possibility of SLA breach.</h>".format(len(advisor_insights.effectiveness_rows)), unsafe_allow_html = True)
                         else:
-                            st.markdown("<h style = 'font-size: 15px;'><span style = 'color: DodgerBlue; font-size: 17px'>**Effectiveness:**</span> **{}** Applications have high possibility of SLA breach.</h>".format(len(effectiveness_applications_count_list)), unsafe_allow_html = True)             
+                            st.markdown("<h style = 'font-size: 15px;'><span style = 'color: DodgerBlue; font-size: 17px'>**Effectiveness:**</span> **{}** Applications have high possibility of SLA breach.</h>".format(len(advisor_insights.effectiveness_rows)), unsafe_allow_html = True)             
                     with c2:
                         # st.markdown("<style>button{height: 5; font-size: 10px; padding-top: 1px !important; padding-bottom: 1px !important;}</style>", unsafe_allow_html=True)
                         st.button(label = "Priortize", key = "effectiveness", help = "Click here to Priortize Applications for Effectiveness")
                     # st.write('----')            
+            elif len(advisor_insights.held_rows) > 0:
+                    # Every loan ready to close has an expired or expiring document
+                    st.markdown("<h style = 'font-size: 16px;'>{} <br><span style = 'color: Red'>**{}**</span> {} ready to close {} on expired or expiring documents. See the Document Expiration Alerts in the Loan Pipeline tab.</h>".format(greeting, len(advisor_insights.held_rows), "Application" if len(advisor_insights.held_rows) == 1 else "Applications", "is waiting" if len(advisor_insights.held_rows) == 1 else "are waiting"), unsafe_allow_html = True)
             else:
-                    st.markdown("<h style = 'font-size: 16px;'>Hi! {}, <br>You're doing great. Keep it up!</h>".format(loan_processor_string), unsafe_allow_html = True)
+                    st.markdown("<h style = 'font-size: 16px;'>{} <br>You're doing great. Keep it up!</h>".format(greeting), unsafe_allow_html = True)
                     
     st.write('----')
 
@@ -417,43 +510,40 @@ with tab2:
         if st.session_state == '':
             st.session_state = 'False'
         
-        if any(st.session_state.values()) == False:
-            filtered_data_df = loan_progress_df[loan_progress_df["Progress"].isin(loan_progress_df["Progress"].unique())]
-            get_loan_progress_grid(filtered_data_df, 400)            
+        if any(st.session_state.get(button, False) for button in ['productivity', 'efficiency', 'accuracy', 'effectiveness']) == False:
+            get_loan_progress_grid(filter_result.rows, 'loan_progress')            
         else:
             try:
                 if st.session_state['productivity']:
-                    productivity_priority_df = loan_progress_df[loan_progress_df.index.isin(productivity_applications_count_list)]
-                    get_loan_progress_grid(productivity_priority_df, 300)
+                    productivity_priority_rows = df.index.get_indexer(advisor_insights.productivity_rows)
+                    get_loan_progress_grid(productivity_priority_rows, 'productivity_priority')
             except:
                 pass
         
             try:
                 if st.session_state['efficiency'] == True:
-                    efficirncy_priority_df = loan_progress_df[loan_progress_df.index.isin(efficiency_applications_count_list)]
-                    get_loan_progress_grid(efficirncy_priority_df, 300)
+                    efficiency_priority_rows = df.index.get_indexer(advisor_insights.efficiency_rows)
+                    get_loan_progress_grid(efficiency_priority_rows, 'efficiency_priority')
             except:
                 pass
             
             try:
                 if st.session_state['accuracy'] == True:
-                    accuracy_priority_df = loan_progress_df[loan_progress_df.index.isin(error_applications_count_list)]
-                    get_loan_progress_grid(accuracy_priority_df, 300)
+                    accuracy_priority_rows = df.index.get_indexer(advisor_insights.accuracy_rows)
+                    get_loan_progress_grid(accuracy_priority_rows, 'accuracy_priority')
             except:
                 pass    
             
             try:
                 if st.session_state['effectiveness'] == True:
-                    effectiveness_priority_df = loan_progress_df[loan_progress_df.index.isin(effectiveness_applications_count_list)]
-                    get_loan_progress_grid(effectiveness_priority_df, 300)
+                    effectiveness_priority_rows = df.index.get_indexer(advisor_insights.effectiveness_rows)
+                    get_loan_progress_grid(effectiveness_priority_rows, 'effectiveness_priority')
             except:
                 pass
     
         st.write('---')
 
     with st.container():
-        gb_document_expiration_alerts = GridOptionsBuilder.from_dataframe(frequent_data_document_expiration_alerts)
-    
         cellstyle_jscode_document_expiration_alerts = JsCode("""
             function(params) {
                 var value = params.value;
@@ -486,8 +576,11 @@ with tab2:
         """)
 
         st.markdown("<h3 style='text-align: center; font-size: 25px'>Document Expiration Alerts by Loans</h3>", unsafe_allow_html = True)
-        gb_document_expiration_alerts.configure_default_column(min_column_width = 110, resizable = True, filterable = True, sortable = True, groupable = True)
-        gb_document_expiration_alerts.configure_column(field = "Loan Number", header_name = "Loan Number", wrapHeaderText = True, sort = 'asc', autoHeaderHeight = True)
+        st.caption('Statuses as of {:%m/%d/%Y}, worked out from the expiry dates of the documents and the statuses exported on {:%m/%d/%Y}'.format(status_date(), expiration_index.exported_on))
+        document_expiration_alerts_df, document_expiration_alerts_full_frame = get_grid_page_data(filter_result.rows, document_expiration_alerts_columns, 'document_expiration_alerts')
+        gb_document_expiration_alerts = GridOptionsBuilder.from_dataframe(document_expiration_alerts_df)
+        gb_document_expiration_alerts.configure_default_column(min_column_width = 110, resizable = True, filterable = document_expiration_alerts_full_frame, sortable = document_expiration_alerts_full_frame, groupable = True)
+        gb_document_expiration_alerts.configure_column(field = "Loan Number", header_name = "Loan Number", wrapHeaderText = True, sort = 'asc' if document_expiration_alerts_full_frame else None, autoHeaderHeight = True)
         gb_document_expiration_alerts.configure_column(field = "ExpRate Lock1", header_name = "Rate Lock", cellStyle = cellstyle_jscode_document_expiration_alerts, wrapHeaderText = True, autoHeaderHeight = True)
         gb_document_expiration_alerts.configure_column(field = "ExpAppraisal1", header_name = "Appraisal", cellStyle = cellstyle_jscode_document_expiration_alerts, wrapHeaderText = True, autoHeaderHeight = True)
         gb_document_expiration_alerts.configure_column(field = "Exp_Title1", header_name = "Title", cellStyle = cellstyle_jscode_document_expiration_alerts, wrapHeaderText = True, autoHeaderHeight = True)
@@ -497,26 +590,44 @@ with tab2:
         gb_document_expiration_alerts.configure_column(field = "Exp_Income1", header_name = "Income", cellStyle = cellstyle_jscode_document_expiration_alerts, wrapHeaderText = True, autoHeaderHeight = True)
         gb_document_expiration_alerts.configure_column(field = "Exp_Payoff1", header_name = "Payoff", cellStyle = cellstyle_jscode_document_expiration_alerts, wrapHeaderText = True, autoHeaderHeight = True)
         grid_options_document_expiration_alerts = gb_document_expiration_alerts.build()
-        document_expiration_alerts_table = AgGrid(frequent_data_document_expiration_alerts, gridOptions = grid_options_document_expiration_alerts, columns_auto_size_mode = ColumnsAutoSizeMode.FIT_ALL_COLUMNS_TO_VIEW, fit_columns_on_grid_load = True, height = 400, allow_unsafe_jscode = True)
+        with span('document_expiration_grid'):
+            document_expiration_alerts_table = AgGrid(document_expiration_alerts_df, gridOptions = grid_options_document_expiration_alerts, columns_auto_size_mode = ColumnsAutoSizeMode.FIT_ALL_COLUMNS_TO_VIEW, fit_columns_on_grid_load = True, height = 400, allow_unsafe_jscode = True)
         st.markdown("<h6 style = font-size: 5px;'>Expired -- Time lapsed to submit the documents</h6>", unsafe_allow_html = True)
         st.markdown("<h6 style = font-size: 5px;'>Expiring Soon -- Time lapse to submit the documents within 10 days</h6>", unsafe_allow_html = True)
         st.markdown("<h6 style = font-size: 5px;'>Not Expired -- Time lapse to submit the document is more than 10 days</h6>", unsafe_allow_html = True)
         st.markdown("<h6 style = font-size: 5px;'>Pending -- Awaits document to be submitted</h6>", unsafe_allow_html = True)
+        get_grid_export(filter_result.rows, document_expiration_alerts_columns, 'document_expiration_alerts')
 
-with tab3:
-   # Predefined list of questions and corresponding answers
-    questions = ["What is the productivity of loan processing over last 3 months?", 
-                 "Which type of application having high cycle time?"]
-    answers = ["Overall productivity for Apr'23 - 90%,  May'23 - 92%,  Jun'23 - 90%", 
-               "FHA loan types processed with 14-17 days on average."]
+with tab3, span('ai_assist_tab'):
+    # Questions are matched to an aggregate query and answered over the loans selected in the sidebar
+    question_engine = snapshot['question_engine']
 
     # Display the text input and submit button
-    user_text = st.text_input("Enter your question:")
+    user_text = st.text_input("Enter your question:", help = "e.g. What is the productivity of loan processing over last 3 months? Which type of application having high cycle time? Which error types are most common?")
     submit_button = st.button("Submit")
 
     if submit_button:
-        if user_text in questions:
-            index = questions.index(user_text)
-            st.success(answers[index])
+        with span('answer'):
+            answer = question_engine.answer(user_text, filter_result.rows, filter_result_key)
+        if answer is not None:
+            st.success(answer.text)
+            st.dataframe(answer.table, hide_index = True, use_container_width = True)
         else:
             st.error("Sorry, I don't have an answer to that question.")
+
+# Exports last, so the page is out while they are written
+for pending_export in pending_exports:
+    show_grid_export(*pending_export)
+
+# Stage timings of this rerun and percentiles over the recent reruns of every session
+if instrumentation.ENABLED:
+    with st.sidebar.expander('Performance'):
+        rerun_trace = instrumentation.recorder.trace
+        st.caption('This rerun')
+        st.dataframe(pd.DataFrame(rerun_trace.spans), hide_index = True, use_container_width = True)
+        stage_summary = instrumentation.recorder.summary()
+        st.caption('Last {} reruns'.format(stage_summary['stages'].get(instrumentation.RERUN, {}).get('window', 0)))
+        st.dataframe(pd.DataFrame.from_dict(stage_summary['stages'], orient = 'index')[['count', 'p50_seconds', 'p95_seconds', 'max_seconds']], use_container_width = True)
+        if stage_summary['max_rss_bytes'] is not None:
+            st.caption('Peak memory {:.0f} MB'.format(stage_summary['max_rss_bytes'] / 1e6))
+instrumentation.finish_rerun()
@@ -0,0 +1,39 @@
+# Last Finished Milestone values charted on the Key Metrics tab
+MILESTONES = ["Approval", "Clear to Close", "Completion", "Cond. Approval", "Doc Preparation"]
+
+
+# Raw counts behind the header metrics and the Key Metrics charts
+def count_key_metrics(df):
+    milestone_counts = df["Last Finished Milestone"].value_counts()
+    return {
+        'applications': int(df["GFE Application Date"].count()),
+        'approval_dates': int(df["Milestone Date - Approval"].count()),
+        'submittal_dates': int(df["Milestone Date - Submittal"].count()),
+        'clear_to_close_dates': int(df["Milestone Date - Clear To Close"].count()),
+        'milestones': {milestone: int(milestone_counts.get(milestone, 0)) for milestone in MILESTONES},
+    }
+
+
+# Metrics shown on the dashboard, derived from the raw counts
+class KeyMetrics:
+    def __init__(self, counts):
+        self.counts = counts
+        applications = counts['applications']
+        self.borrower_intent_to_continue_date = int(applications/2)
+        self.uw_submitted = int(applications/3)
+        self.uw_cond_approved = int(applications/3.5)
+        self.app_approved = int(applications/4)
+        self.app_clear_to_close = int(applications/4.5)
+        self.app_suspended = int(applications/5)
+
+        # Count of each loan decision within the filtered data
+        self.milestone_date_approval = int(counts['approval_dates'] / 0.1)
+        self.milestone_date_submittal = int(counts['submittal_dates'] / 0.15)
+        self.clear_to_close_applications = int(counts['clear_to_close_dates'] / 0.2)
+
+        milestones = counts['milestones']
+        self.last_finished_milestone_approval = milestones["Approval"]
+        self.last_finished_milestone_clear_to_close = milestones["Clear to Close"]
+        self.last_finished_milestone_completion = milestones["Completion"]
+        self.last_finished_milestone_cond_approval = milestones["Cond. Approval"]
+        self.last_finished_milestone_doc_preparation = milestones["Doc Preparation"]
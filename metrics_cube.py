@@ -0,0 +1,105 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+from filter_engine import FILTER_COLUMNS, RANGE_COLUMN
+from metrics import MILESTONES
+
+# Cube dimensions: every sidebar filter plus Progress. Progress is an integer percentage,
+# so it is kept at full resolution and range edges are answered exactly.
+DIMENSIONS = list(FILTER_COLUMNS.values()) + [RANGE_COLUMN]
+MILESTONE_COLUMN = FILTER_COLUMNS['last_finished_milestone']
+
+# Counted per cell: rows, then the non-null count of each date column behind the metrics
+MEASURES = {
+    'rows': None,
+    'applications': "GFE Application Date",
+    'approval_dates': "Milestone Date - Approval",
+    'submittal_dates': "Milestone Date - Submittal",
+    'clear_to_close_dates': "Milestone Date - Clear To Close",
+}
+
+
+# Counts of the header metrics grouped by every filter dimension, built when the data
+# loads. A selection is answered by summing the matching cells instead of scanning rows.
+class MetricsCube:
+    def __init__(self, df):
+        self.values = {}
+        self.lookup = {}
+        row_codes = []
+        for column in DIMENSIONS:
+            codes, uniques = pd.factorize(df[column], sort = True)
+            self.values[column] = np.asarray(uniques, dtype = object)
+            self.lookup[column] = {value: code + 1 for code, value in enumerate(uniques)}
+            # Code 0 is reserved for missing values, which no selection matches
+            row_codes.append(codes + 1)
+        self.radix = np.array([len(self.values[column]) + 1 for column in DIMENSIONS], dtype = np.int64)
+        keys = self._keys(np.column_stack(row_codes))
+        measures = self._measures(df)
+
+        self.keys, cell_of_row = np.unique(keys, return_inverse = True)
+        self.codes = self._decode(self.keys)
+        self.measures = np.zeros((len(self.keys), len(MEASURES)), dtype = np.int64)
+        np.add.at(self.measures, cell_of_row, measures)
+
+    def _keys(self, codes):
+        keys = np.zeros(len(codes), dtype = np.int64)
+        for dimension in range(len(DIMENSIONS)):
+            keys = keys * self.radix[dimension] + codes[:, dimension]
+        return keys
+
+    def _decode(self, keys):
+        codes = np.empty((len(keys), len(DIMENSIONS)), dtype = np.int32)
+        for dimension in reversed(range(len(DIMENSIONS))):
+            keys, codes[:, dimension] = np.divmod(keys, self.radix[dimension])
+        return codes
+
+    def _measures(self, df):
+        return np.column_stack([np.ones(len(df), dtype = np.int64) if column is None else df[column].notna().to_numpy().astype(np.int64) for column in MEASURES.values()])
+
+    def _row_codes(self, df):
+        codes = np.empty((len(df), len(DIMENSIONS)), dtype = np.int64)
+        for dimension, column in enumerate(DIMENSIONS):
+            lookup = self.lookup[column]
+            codes[:, dimension] = [0 if pd.isna(value) else lookup.get(value, -1) for value in df[column]]
+        return codes
+
+    # New cube with the previous values of the touched rows subtracted and their new values
+    # added. A delta bringing a dimension value the cube has never seen rebuilds it.
+    def apply_delta(self, df, delta):
+        new_codes = self._row_codes(df.iloc[delta.rows])
+        if (new_codes < 0).any():
+            return MetricsCube(df)
+        keys = np.concatenate([self._keys(self._row_codes(delta.previous)), self._keys(new_codes)])
+        measures = np.concatenate([-self._measures(delta.previous), self._measures(df.iloc[delta.rows])])
+
+        cube = copy.copy(self)
+        missing = np.setdiff1d(keys, self.keys)
+        at = np.searchsorted(self.keys, missing)
+        cube.keys = np.insert(self.keys, at, missing)
+        cube.codes = np.insert(self.codes, at, self._decode(missing), axis = 0)
+        cube.measures = np.insert(self.measures, at, 0, axis = 0)
+        np.add.at(cube.measures, np.searchsorted(cube.keys, keys), measures)
+        return cube
+
+    def _cell_mask(self, selection):
+        mask = np.ones(len(self.keys), dtype = bool)
+        for dimension, (field, column) in enumerate(FILTER_COLUMNS.items()):
+            allowed = np.zeros(len(self.values[column]) + 1, dtype = bool)
+            allowed[[self.lookup[column][value] for value in selection.values[field] if value in self.lookup[column]]] = True
+            mask &= allowed[self.codes[:, dimension]]
+        progress = self.values[RANGE_COLUMN]
+        allowed = np.concatenate([[False], (progress >= selection.selected_min_progress) & (progress <= selection.selected_max_progress)])
+        return mask & allowed[self.codes[:, len(DIMENSIONS) - 1]]
+
+    # Same counts as metrics.count_key_metrics on the filtered frame
+    def counts(self, selection):
+        mask = self._cell_mask(selection)
+        totals = self.measures[mask].sum(axis = 0)
+        milestone_dimension = DIMENSIONS.index(MILESTONE_COLUMN)
+        milestone_totals = np.bincount(self.codes[mask, milestone_dimension], weights = self.measures[mask, 0], minlength = len(self.values[MILESTONE_COLUMN]) + 1)
+        lookup = self.lookup[MILESTONE_COLUMN]
+        counts = {name: int(total) for name, total in zip(MEASURES, totals) if name != 'rows'}
+        counts['milestones'] = {milestone: int(milestone_totals[lookup[milestone]]) if milestone in lookup else 0 for milestone in MILESTONES}
+        return counts
@@ -0,0 +1,52 @@
+from calendar import month_name
+
+from filter_engine import FILTER_COLUMNS
+
+# Columns the sidebar lists its options from. Year and month are listed from the application
+# date while they select on the submittal date (FILTER_COLUMNS), as the sidebar always did.
+OPTION_COLUMNS = dict(FILTER_COLUMNS, selected_year = 'Extracted Year (GFE Application Date)', selected_month = 'Extracted Month (GFE Application Date)')
+
+# Sidebar filters shown as a single-choice select box; the others are multiselects
+SINGLE_CHOICE_FIELDS = ['loan_processor']
+
+MONTH_ORDER = {month: position for position, month in enumerate(month_name)}
+
+
+def _sort_key(field):
+    if field == 'selected_month':
+        return lambda month: MONTH_ORDER.get(month, len(MONTH_ORDER))
+    return None
+
+
+# Sidebar options of one dataset version: sorted values and row counts per filter, the
+# Progress range, and the options still reachable under the other filters, answered from
+# the filter bitmaps instead of the frame.
+class OptionCatalog:
+    def __init__(self, filter_index, df):
+        self.filter_index = filter_index
+        self.options = {}
+        self.counts = {}
+        for field, column in OPTION_COLUMNS.items():
+            counts = df[column].value_counts(sort = False)
+            counts = counts[counts > 0]
+            self.options[field] = sorted(counts.index, key = _sort_key(field))
+            self.counts[field] = {value: int(counts[value]) for value in self.options[field]}
+
+        progress = filter_index.progress_sorted
+        self.min_progress = int(progress[0]) if len(progress) else 0
+        self.max_progress = int(progress[-1]) if len(progress) else 0
+
+    # Widget values of a fresh session: every option, and the first processor
+    def defaults(self):
+        return {field: options[0] if field in SINGLE_CHOICE_FIELDS and options else list(options) for field, options in self.options.items()}
+
+    # Options of every filter, narrowed to the reachable values when `dependent`. Selected
+    # values are always kept so a widget never loses part of its selection.
+    def sidebar_options(self, selection, dependent = True):
+        reachable = self.filter_index.reachable(selection) if dependent else None
+        sidebar_options = {}
+        for field, options in self.options.items():
+            selected = set(selection.values[field])
+            kept = [value for value in options if reachable is None or value in reachable[field] or value in selected]
+            sidebar_options[field] = kept + sorted(selected.difference(options), key = _sort_key(field))
+        return sidebar_options
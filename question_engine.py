@@ -0,0 +1,499 @@
+import copy
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Aggregate queries the AI Assist tab answers: what is measured, the dimension it is broken
+# down by unless the question names another, and example phrasings the questions are matched on
+QUERIES = {
+    'productivity': {
+        'dimension': 'month',
+        'examples': [
+            'What is the productivity of loan processing over last 3 months?',
+            'productivity per month',
+            'monthly productivity of the pipeline',
+            'how productive was loan processing each month',
+            'how many loans were cleared to close each month',
+            'loans cleared per processor per month',
+            'closings against submittals',
+        ],
+    },
+    'cycle_time': {
+        'dimension': 'Loan Type',
+        'examples': [
+            'Which type of application having high cycle time?',
+            'cycle time by loan type',
+            'how many days does it take to process a loan',
+            'average processing time from submittal to clear to close',
+            'turnaround time per processor',
+            'which loans take longest to close',
+        ],
+    },
+    'volume': {
+        'dimension': 'Loan Type',
+        'examples': [
+            'how many loans are in the pipeline',
+            'number of applications by loan officer',
+            'loan count per processor',
+            'loans per closer',
+            'loans per processor',
+            'applications per officer',
+            'how many loans does each closer have',
+            'number of loans each processor handles',
+            'pipeline volume by loan source',
+            'how many loans are at each milestone',
+            'which processor has the most loans',
+        ],
+    },
+    'error_rate': {
+        'dimension': 'Loan Processor',
+        'examples': [
+            'what is the error rate by processor',
+            'which applications have the most errors',
+            'accuracy of loan processing',
+            'share of loans with errors per loan type',
+            'mistakes made per officer',
+        ],
+    },
+    'error_types': {
+        'dimension': 'Error Type',
+        'examples': [
+            'which error types are most common',
+            'most frequent errors',
+            'top error types in the pipeline',
+            'what kind of errors happen',
+        ],
+    },
+    'ageing': {
+        'dimension': 'Loan Type',
+        'examples': [
+            'what is the average ageing of loans',
+            'which loans are oldest in the pipeline',
+            'how old are the applications by processor',
+            'ageing days per loan type',
+        ],
+    },
+}
+
+# Dimensions a question can break a measure down by, and the words naming them
+DIMENSIONS = {
+    'month': ['month', 'monthly'],
+    'Loan Type': ['type', 'types', 'product'],
+    'Loan Processor': ['processor', 'processors'],
+    'Loan Officer': ['officer', 'officers'],
+    'Loan Closer': ['closer', 'closers'],
+    'Loan Source': ['source', 'sources', 'channel'],
+    'Last Finished Milestone': ['milestone', 'milestones', 'stage', 'stages'],
+    'Error Type': ['error type', 'error types', 'kind of error'],
+}
+
+# Months a loan is counted in: its application, and for productivity the month it was
+# submitted and the month it was cleared to close
+MONTH_COLUMNS = {
+    'application': 'GFE Application Date',
+    'submitted': 'Milestone Date - Submittal',
+    'cleared': 'Milestone Date - Clear To Close',
+}
+NO_MONTH = np.iinfo(np.int64).min
+
+# Columns the measures are read from
+CYCLE_START, CYCLE_END = 'Milestone Date - Submittal', 'Milestone Date - Clear To Close'
+MEASURE_COLUMNS = [CYCLE_START, CYCLE_END, 'Application Status', 'Ageing (days)']
+
+# Months covered when a question about months names no window
+DEFAULT_MONTHS = 3
+# Least cosine similarity between a question and the examples of a query to answer it
+MIN_SCORE = 0.25
+# Groups listed in an answer
+TOP_GROUPS = 3
+# Grouped tables an engine keeps, per query kind, dimension, named values, months and selection
+CACHED_TABLES = 256
+
+STOP_WORDS = {'a', 'an', 'the', 'of', 'in', 'on', 'for', 'to', 'is', 'are', 'was', 'were', 'be', 'what', 'which', 'how', 'do', 'does', 'by', 'over', 'with', 'and', 'or', 'our', 'we', 'me', 'show', 'tell', 'having', 'has', 'have', 'there', 'i', 'it', 'this', 'that', 'from'}
+NUMBER_WORDS = {'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12}
+MONTHS_WINDOW = re.compile(r'\blast\s+(\d+|{})\s+months?\b'.format('|'.join(NUMBER_WORDS)))
+
+
+def tokenize(text):
+    tokens = []
+    for token in re.findall(r'[a-z0-9]+', text.lower()):
+        if token in STOP_WORDS:
+            continue
+        # Plural and singular share a token
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _contains(text, phrase):
+    return re.search(r'(?<![a-z0-9]){}(?![a-z0-9])'.format(re.escape(phrase)), text) is not None
+
+
+# Words naming a group dimension. The dimension is read from the question separately, so they
+# are left out of the match, which then only compares what is measured.
+DIMENSION_TOKENS = {token for dimension, phrases in DIMENSIONS.items() if dimension != 'Error Type' for phrase in phrases for token in tokenize(phrase)}
+
+
+def measure_tokens(text):
+    return [token for token in tokenize(text) if token not in DIMENSION_TOKENS]
+
+
+# TF-IDF vectors of the example phrasings, built once; a question is matched to the query
+# of its most similar example
+class QuestionIndex:
+    def __init__(self, queries = QUERIES):
+        documents = [(name, measure_tokens(example)) for name, query in queries.items() for example in query['examples']]
+        self.names = [name for name, _ in documents]
+        document_frequency = Counter(token for _, tokens in documents for token in set(tokens))
+        self.vocabulary = {token: position for position, token in enumerate(sorted(document_frequency))}
+        self.idf = np.array([math.log((1 + len(documents)) / (1 + document_frequency[token])) + 1 for token in sorted(document_frequency)])
+        self.vectors = np.vstack([self._vector(tokens) for _, tokens in documents])
+
+    def _vector(self, tokens):
+        vector = np.zeros(len(self.vocabulary))
+        for token, count in Counter(tokens).items():
+            position = self.vocabulary.get(token)
+            if position is not None:
+                vector[position] = count * self.idf[position]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    # Name and score of the best matching query
+    def match(self, question):
+        scores = self.vectors @ self._vector(measure_tokens(question))
+        best = int(np.argmax(scores))
+        return self.names[best], float(scores[best])
+
+
+# Answer to a question: the text shown and the aggregate table it was read from
+class Answer:
+    def __init__(self, query, score, text, table):
+        self.query = query
+        self.score = score
+        self.text = text
+        self.table = table
+
+
+def _month_label(month):
+    return pd.Timestamp(np.datetime64(int(month), 'M')).strftime("%b'%y")
+
+
+# Month numbers (months since 1970-01), NO_MONTH where there is no date
+def _months(dates):
+    months = dates.to_numpy(dtype = 'datetime64[M]')
+    return np.where(np.isnat(months), NO_MONTH, months.astype(np.int64))
+
+
+# Group sums of `weights` (row counts by default) over `keys`, one per group; negative keys
+# are left out
+def _sums(keys, groups, weights = None):
+    kept = keys >= 0
+    return np.bincount(keys[kept], weights = None if weights is None else weights[kept], minlength = groups)
+
+
+# First and last dated month of each `months` array, None when nothing is dated
+def _month_ranges(months):
+    month_range = {}
+    for name, row_months in months.items():
+        dated = row_months[row_months != NO_MONTH]
+        month_range[name] = (int(dated.min()), int(dated.max())) if len(dated) else None
+    return month_range
+
+
+# Per-row measures: whether the loan was cleared to close after submittal, its cycle days,
+# whether it is in error and its ageing days. A loan cleared before it was submitted has a
+# date wrong, so it counts as not cycled rather than with a negative cycle time.
+def _measures(df):
+    cycle_days = (df[CYCLE_END] - df[CYCLE_START]).dt.days.to_numpy()
+    cycled = cycle_days >= 0
+    return cycled, np.where(cycled, cycle_days, 0), (df['Application Status'] == 'Error').to_numpy(), df['Ageing (days)'].to_numpy(dtype = np.float64)
+
+
+# `values` grown to `size` rows with the rows at `rows` set to `new_values`
+def _set_rows(values, size, rows, new_values):
+    updated = np.empty(size, dtype = values.dtype)
+    updated[:len(values)] = values
+    updated[rows] = new_values
+    return updated
+
+
+# Columns of one dataset version behind every query, encoded once when the data loads: the
+# code of every dimension and the month numbers of every row. An answer narrows the rows to
+# the sidebar selection, the values and the months the question names, then groups what is
+# left with a few bincounts. The grouped tables are cached, so another phrasing of a question,
+# or another session asking over the same selection, reads them instead.
+class QuestionEngine:
+    def __init__(self, df, index = None):
+        self.index = index or QuestionIndex()
+        self.row_count = len(df)
+        self.codes = {}
+        self.labels = {}
+        for dimension in DIMENSIONS:
+            if dimension != 'month':
+                codes, uniques = pd.factorize(df[dimension], sort = True)
+                self.codes[dimension] = codes
+                self.labels[dimension] = np.asarray(uniques, dtype = object)
+        self.months = {name: _months(df[column]) for name, column in MONTH_COLUMNS.items()}
+        self.month_range = _month_ranges(self.months)
+        self.cycled, self.cycle_days, self.errors, self.ageing_days = _measures(df)
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+        # Values named in the example phrasings ('clear to close') describe a measure, not a group
+        examples = [example.lower() for query in QUERIES.values() for example in query['examples']]
+        self.values = {
+            value.lower(): (dimension, code)
+            for dimension, labels in self.labels.items()
+            for code, value in enumerate(labels)
+            if isinstance(value, str) and not any(_contains(example, value.lower()) for example in examples)
+        }
+
+    # New engine with the rows an ingested delta touched encoded again. A value a dimension has
+    # not seen yet would change the order of its labels, so the engine is built again instead.
+    # Labels no loan has any more stay until then; answers leave out groups without loans.
+    def apply_delta(self, df, delta):
+        columns = [dimension for dimension in self.labels] + list(MONTH_COLUMNS.values()) + MEASURE_COLUMNS
+        if len(delta.appended_rows) == 0 and not delta.columns.intersection(columns):
+            return self
+        rows = delta.rows
+        touched = df.iloc[rows]
+        codes = {}
+        for dimension, labels in self.labels.items():
+            codes[dimension] = pd.Index(labels).get_indexer(touched[dimension])
+            if ((codes[dimension] < 0) & touched[dimension].notna().to_numpy()).any():
+                return QuestionEngine(df, self.index)
+
+        size = len(df)
+        engine = copy.copy(self)
+        engine.row_count = size
+        engine.codes = {dimension: _set_rows(self.codes[dimension], size, rows, codes[dimension]) for dimension in self.codes}
+        engine.months = {name: _set_rows(self.months[name], size, rows, _months(touched[column])) for name, column in MONTH_COLUMNS.items()}
+        engine.month_range = _month_ranges(engine.months)
+        cycled, cycle_days, errors, ageing_days = _measures(touched)
+        engine.cycled = _set_rows(self.cycled, size, rows, cycled)
+        engine.cycle_days = _set_rows(self.cycle_days, size, rows, cycle_days)
+        engine.errors = _set_rows(self.errors, size, rows, errors)
+        engine.ageing_days = _set_rows(self.ageing_days, size, rows, ageing_days)
+        engine._tables = OrderedDict()
+        engine._lock = threading.Lock()
+        return engine
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_tables'] = OrderedDict()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _dimension(self, question, default):
+        text = ' {} '.format(' '.join(re.findall(r'[a-z0-9]+', question.lower())))
+        # Longest naming phrase first, so 'error type' wins over 'type'
+        phrases = sorted(((phrase, dimension) for dimension, phrases in DIMENSIONS.items() for phrase in phrases), key = lambda item: -len(item[0]))
+        for phrase, dimension in phrases:
+            if ' {} '.format(phrase) in text:
+                return dimension
+        return default
+
+    # Codes of the dimension values the question names, by dimension
+    def _named_values(self, question):
+        text = question.lower()
+        named = {}
+        for value, (dimension, code) in self.values.items():
+            if _contains(text, value):
+                named.setdefault(dimension, []).append(code)
+        return named
+
+    def _window(self, question):
+        window = MONTHS_WINDOW.search(question.lower())
+        if window is None:
+            return None
+        return NUMBER_WORDS.get(window.group(1)) or int(window.group(1))
+
+    # Answer to `question` over the rows at `rows` (positions; every loan by default).
+    # `rows_key` names the rows, e.g. the selection key of the sidebar; answers over rows
+    # without a key are worked out every time.
+    def answer(self, question, rows = None, rows_key = None):
+        query, score = self.index.match(question)
+        if score < MIN_SCORE:
+            return None
+        dimension = self._dimension(question, QUERIES[query]['dimension'])
+        if query == 'error_types':
+            dimension = 'Error Type'
+        named = self._named_values(question)
+
+        window_notes = []
+        months = self._window(question)
+        if months is not None and months < 1:
+            window_notes.append('The last {} months cover no month, so the answer is not narrowed to them.'.format(months))
+            months = None
+        if months is None and dimension == 'month':
+            months = DEFAULT_MONTHS
+
+        compute = lambda: self._grouped(query == 'productivity', dimension, named, rows, months)
+        if rows is not None and rows_key is None:
+            table, notes, months_covered = compute()
+        else:
+            key = (query == 'productivity', dimension, tuple((named_dimension, tuple(codes)) for named_dimension, codes in named.items()), months, rows_key if rows is not None else None)
+            table, notes, months_covered = self._cached(key, compute)
+        notes = notes + window_notes
+        if months_covered is not None and months_covered < months:
+            notes.append('The data covers {} of the last {} months.'.format(months_covered, months))
+        elif months is not None and dimension != 'month':
+            notes.append('Narrowed to the last {} months.'.format(months))
+        scope = 'Covers the whole pipeline.' if rows is None or len(rows) == self.row_count else 'Covers the {:,} loans selected in the sidebar.'.format(len(rows))
+        return Answer(query, score, ' '.join([self._text(query, dimension, table)] + notes + [scope]), self._table(query, dimension, table))
+
+    def _cached(self, key, compute):
+        with self._lock:
+            if key in self._tables:
+                self._tables.move_to_end(key)
+                return self._tables[key]
+        grouped = compute()
+        with self._lock:
+            self._tables[key] = grouped
+            while len(self._tables) > CACHED_TABLES:
+                self._tables.popitem(last = False)
+        return grouped
+
+    # Table of `rows` narrowed to the `named` values and grouped on `dimension`, the notes on
+    # the narrowing and the months covered. Tables are shared: nothing may modify them.
+    def _grouped(self, productivity, dimension, named, rows, months):
+        selected = np.arange(self.row_count) if rows is None else np.asarray(rows)
+        notes = []
+        for named_dimension, codes in named.items():
+            names = ' or '.join(str(self.labels[named_dimension][code]) for code in codes)
+            narrowed = selected[np.isin(self.codes[named_dimension][selected], codes)]
+            if len(narrowed) == 0 and len(selected) > 0:
+                notes.append('{} has no loans {}.'.format(names, 'in the pipeline' if rows is None else 'among the loans selected in the sidebar'))
+            else:
+                notes.append('Narrowed to {} {}.'.format(named_dimension.lower(), names))
+            selected = narrowed
+        table, months_covered = (self._productivity if productivity else self._loans)(dimension, selected, months)
+        return table, notes, months_covered
+
+    # Group key of each of `rows`, -1 for none; months are counted in `month_name` from `first`
+    def _keys(self, dimension, rows, month_name, first = 0):
+        if dimension != 'month':
+            return self.codes[dimension][rows]
+        months = self.months[month_name][rows]
+        return np.where(months != NO_MONTH, months - first, -1)
+
+    # Month numbers the `month_name` months of `rows` span
+    def _month_labels(self, rows, *month_names):
+        months = np.concatenate([self.months[month_name][rows] for month_name in month_names])
+        months = months[months != NO_MONTH]
+        return np.arange(months.min(), months.max() + 1) if len(months) else np.array([], dtype = np.int64)
+
+    # Those of `rows` dated in the last `months` months of `month_name` up to `latest` (all
+    # dated rows when `months` is None), and how many of these months the data covers
+    def _in_window(self, rows, month_name, months, latest = None):
+        row_months = self.months[month_name][rows]
+        month_range = self.month_range[month_name]
+        if month_range is None:
+            return rows[:0], 0
+        first, latest = month_range[0], month_range[1] if latest is None else latest
+        if months is None:
+            return rows[row_months != NO_MONTH], latest - first + 1
+        return rows[(row_months >= latest - months + 1) & (row_months <= latest)], min(months, latest - first + 1)
+
+    def _loans(self, dimension, rows, months):
+        covered = None
+        if months is not None or dimension == 'month':
+            rows, covered = self._in_window(rows, 'application', months)
+        labels = self._month_labels(rows, 'application') if dimension == 'month' else self.labels[dimension]
+        keys = self._keys(dimension, rows, 'application', labels[0] if len(labels) else 0)
+        table = pd.DataFrame({
+            'loans': _sums(keys, len(labels)),
+            'errors': _sums(keys, len(labels), self.errors[rows].astype(np.float64)),
+            'cycled': _sums(keys, len(labels), self.cycled[rows].astype(np.float64)),
+            'cycle_days_total': _sums(keys, len(labels), self.cycle_days[rows]),
+            'ageing_days_total': _sums(keys, len(labels), self.ageing_days[rows]),
+        }, index = labels)
+        table = table[table['loans'] > 0]
+        table['errors'] = table['errors'].astype(np.int64)
+        table['cycle_days'] = table['cycle_days_total'] / table['cycled'].where(table['cycled'] > 0)
+        table['ageing_days'] = table['ageing_days_total'] / table['loans']
+        table['error_rate'] = table['errors'] / table['loans']
+        return table, covered if months is not None else None
+
+    # Loans cleared to close per month against the loans submitted: each loan is counted in the
+    # month it was submitted and in the month it was cleared
+    def _productivity(self, dimension, rows, months):
+        # Both counted over the months up to the latest clearing
+        latest = self.month_range['cleared'][1] if self.month_range['cleared'] is not None else None
+        submitted, _ = self._in_window(rows, 'submitted', months, latest)
+        cleared, covered = self._in_window(rows, 'cleared', months, latest)
+        if dimension == 'month':
+            labels = np.union1d(self._month_labels(submitted, 'submitted'), self._month_labels(cleared, 'cleared'))
+            labels = np.arange(labels[0], labels[-1] + 1) if len(labels) else labels
+        else:
+            labels = self.labels[dimension]
+        first = labels[0] if dimension == 'month' and len(labels) else 0
+        table = pd.DataFrame({
+            'submitted': _sums(self._keys(dimension, submitted, 'submitted', first), len(labels)),
+            'cleared': _sums(self._keys(dimension, cleared, 'cleared', first), len(labels)),
+        }, index = labels)
+        table = table[(table['submitted'] > 0) | (table['cleared'] > 0)]
+        # A month row is one month; a group is averaged over the months covered
+        table['productivity'] = table['cleared'] / (1 if dimension == 'month' else max(covered, 1))
+        table['clearance_rate'] = table['cleared'] / table['submitted'].where(table['submitted'] > 0)
+        return table, covered if months is not None else None
+
+    def _text(self, query, dimension, table):
+        label = {'month': 'month'}.get(dimension, dimension.lower())
+        if table.empty:
+            return 'There are no loans to answer that from.'
+        if dimension == 'month':
+            if query == 'productivity':
+                return 'Loans cleared to close for {}.'.format(',  '.join(
+                    '{} - {:,}{}'.format(_month_label(period), int(row.cleared), '' if np.isnan(row.clearance_rate) else ' ({:.0%} of submittals)'.format(row.clearance_rate))
+                    for period, row in table.iterrows()))
+            column, template = {
+                'cycle_time': ('cycle_days', '{} - {:.1f} days'),
+                'volume': ('loans', '{} - {:,} loans'),
+                'error_rate': ('error_rate', '{} - {:.0%}'),
+                'ageing': ('ageing_days', '{} - {:.1f} days'),
+            }.get(query, ('loans', '{} - {:,} loans'))
+            title = {'cycle_time': 'Average cycle time', 'volume': 'Applications', 'error_rate': 'Error rate', 'ageing': 'Average ageing'}.get(query, 'Applications')
+            return '{} for {}.'.format(title, ',  '.join(template.format(_month_label(period), table[column].loc[period]) for period in table.index))
+
+        if query == 'cycle_time':
+            ranked = table['cycle_days'].dropna().sort_values(ascending = False)
+            if len(ranked) == 1:
+                return '{} loans are processed in {:.1f} days on average from submittal to clear to close.'.format(ranked.index[0], ranked.iloc[0])
+            return 'Longest cycle time (submittal to clear to close) by {}: {}.'.format(label, ', '.join('{} {:.1f} days'.format(group, days) for group, days in ranked.head(TOP_GROUPS).items()))
+        if query == 'error_rate':
+            ranked = table['error_rate'].sort_values(ascending = False)
+            return 'Highest error rate by {}: {}.'.format(label, ', '.join('{} {:.0%}'.format(group, rate) for group, rate in ranked.head(TOP_GROUPS).items()))
+        if query == 'error_types':
+            ranked = table['loans'].drop('No Error', errors = 'ignore').sort_values(ascending = False)
+            return 'Most frequent errors: {}.'.format(', '.join('{} ({:,} loans)'.format(group, count) for group, count in ranked.head(TOP_GROUPS).items()))
+        if query == 'ageing':
+            ranked = table['ageing_days'].sort_values(ascending = False)
+            return 'Oldest loans by {}: {}.'.format(label, ', '.join('{} {:.1f} days'.format(group, days) for group, days in ranked.head(TOP_GROUPS).items()))
+        if query == 'productivity':
+            ranked = table['productivity'].sort_values(ascending = False)
+            return 'Loans cleared to close per month by {}: {}.'.format(label, ', '.join('{} {:,.1f}'.format(group, count) for group, count in ranked.head(TOP_GROUPS).items()))
+        ranked = table['loans'].sort_values(ascending = False)
+        return '{:,} loans; most by {}: {}.'.format(int(table['loans'].sum()), label, ', '.join('{} ({:,})'.format(group, count) for group, count in ranked.head(TOP_GROUPS).items()))
+
+    def _table(self, query, dimension, table):
+        columns = {
+            'productivity': ['submitted', 'cleared', 'productivity', 'clearance_rate'],
+            'cycle_time': ['loans', 'cycle_days'],
+            'volume': ['loans'],
+            'error_rate': ['loans', 'errors', 'error_rate'],
+            'error_types': ['loans'],
+            'ageing': ['loans', 'ageing_days'],
+        }[query]
+        table = table[columns].copy()
+        table.index = [_month_label(period) for period in table.index] if dimension == 'month' else table.index.astype(str)
+        table.index.name = 'Month' if dimension == 'month' else dimension
+        return table.reset_index()
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+# Memory budget for cached filter results, overridable per deployment
+DEFAULT_BUDGET_MB = int(os.environ.get('LOAN_PIPELINE_RESULT_CACHE_MB', 256))
+
+# Rough fixed cost of an entry on top of its arrays (objects, dicts, key)
+ENTRY_OVERHEAD_BYTES = 4096
+
+
+# Canonical hash of the dataset version and the normalized sidebar selection
+def selection_key(version, selection):
+    payload = json.dumps([version, selection.key()], separators = (',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _nbytes(value):
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sum(_nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(item) for item in value)
+    if hasattr(value, '__dict__'):
+        return _nbytes(vars(value))
+    return sys.getsizeof(value)
+
+
+# Everything derived from one sidebar selection: row positions, metrics, advisor insights and milestone funnel.
+# The advisor depends on the document statuses of `status_date` too.
+class FilterResult:
+    def __init__(self, version, selection, rows, metrics, advisor_insights, funnel, status_date):
+        self.version = version
+        self.selection = selection
+        self.rows = rows
+        self.metrics = metrics
+        self.advisor_insights = advisor_insights
+        self.funnel = funnel
+        self.status_date = status_date
+
+    def nbytes(self):
+        return ENTRY_OVERHEAD_BYTES + _nbytes([self.rows, self.metrics, self.advisor_insights, self.funnel])
+
+
+# Thread-safe LRU cache bounded by an approximate memory budget, shared across sessions
+class ResultCache:
+    def __init__(self, max_bytes = DEFAULT_BUDGET_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    # Entry without touching the hit statistics or the LRU order
+    def peek(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry[0]
+
+    def put(self, key, value):
+        size = value.nbytes()
+        with self._lock:
+            if key in self._entries:
+                self.used_bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.used_bytes += size
+            while self.used_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last = False)
+                self.used_bytes -= evicted_size
+                self.evictions += 1
+
+    # Concurrent misses on the same key may both compute; the last result wins
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    # Move results no ingested row could enter or leave to the new dataset version and
+    # drop the rest. Without a delta (the archive was replaced) everything is dropped.
+    def carry_forward(self, old_version, new_version, delta = None, current_rows = None):
+        with self._lock:
+            entries, self._entries = self._entries, OrderedDict()
+            self.used_bytes = 0
+        if delta is None:
+            return
+        for value, _ in entries.values():
+            if value.version != old_version:
+                continue
+            if value.selection.matches(delta.previous).any() or value.selection.matches(current_rows).any():
+                continue
+            value.version = new_version
+            self.put(selection_key(new_version, value.selection), value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.used_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'used_bytes': self.used_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+# Document status values of the Exp* columns
+DOCUMENT_STATUSES = ['Closed', 'Expired', 'Expiring Soon', 'Not Expired', 'Pending']
+DOCUMENT_STATUS_DTYPE = pd.CategoricalDtype(DOCUMENT_STATUSES)
+
+# Date formats found in the pipeline ('Friday, July 3, 2020', '5/19/2020'), plus ISO dates
+# written by exports and ingested batches
+DATE_FORMATS = ['%A, %B %d, %Y', '%m/%d/%Y', 'ISO8601']
+# Placeholders the source uses for a missing date
+MISSING_DATES = ['', 'nan', 'NaT', 'None']
+
+CATEGORY_COLUMNS = [
+    'Loan Type', 'Loan Officer', 'Loan Processor', 'Loan Closer', 'Loan Source', 'Last Finished Milestone',
+    'Extracted Year (GFE Application Date)', 'Extracted Month (GFE Application Date)',
+    'Extracted Year (Borrower Intent to Continue Date)', 'Extracted Month (Borrower Intent to Continue Date)',
+    'Extracted Year (Milestone Date - Approval)', 'Extracted Month (Milestone Date - Approval)',
+    'Extracted Year (Milestone Date - Submittal)', 'Extracted Month (Milestone Date - Submittal)',
+    'Extracted Year (Milestone Date - Clear To Close)', 'Extracted Month (Milestone Date - Clear To Close)',
+    'Application Status', 'Error Type', 'All Documents Expiration Status', 'All Documents Received Status',
+]
+DOCUMENT_STATUS_COLUMNS = [
+    'ExpRate Lock', 'ExpAppraisal', 'ExpCredit_Exp', 'Exp_HOI', 'Exp_Title', 'Exp_VVOE', 'Exp_Income', 'Exp_Payoff',
+    'ExpRate Lock1', 'ExpAppraisal1', 'Exp_Title1', 'ExpCredit_Exp1', 'Exp_HOI1', 'Exp_VVOE1', 'Exp_Income1', 'Exp_Payoff1',
+]
+DATE_COLUMNS = [
+    'GFE Application Date', 'Borrower Intent to Continue Date',
+    'Milestone Date - Submittal', 'Milestone Date - Approval', 'Milestone Date - Clear To Close',
+    'Document Date Received - Appraisal', "Document Date Received - Homeowner's Insurance Declarations Page",
+    'Document Date Received - Title Report', 'Income doc date',
+]
+INTEGER_COLUMNS = {
+    'Progress': np.int8,
+    'Ageing (days)': np.int16,
+    'Expected Time to Complete (minutes)': np.int16,
+}
+STRING_COLUMNS = ['Loan Number']
+
+
+# Target dtype of every column of the loan pipeline frame
+def schema_dtypes():
+    dtypes = {column: np.dtype(object) for column in STRING_COLUMNS}
+    dtypes.update({column: 'category' for column in CATEGORY_COLUMNS})
+    dtypes.update({column: DOCUMENT_STATUS_DTYPE for column in DOCUMENT_STATUS_COLUMNS})
+    dtypes.update({column: 'datetime64[ns]' for column in DATE_COLUMNS})
+    dtypes.update({column: np.dtype(dtype) for column, dtype in INTEGER_COLUMNS.items()})
+    return dtypes
+
+
+class SchemaError(ValueError):
+    pass
+
+
+# Parse dates written in any of DATE_FORMATS; raises on values that match none
+def parse_dates(values, column = None):
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values.dtype):
+        return values
+    text = values.astype(object).where(values.notna(), None).map(lambda value: None if value is None else str(value).strip())
+    missing = text.isna() | text.isin(MISSING_DATES)
+    parsed = pd.Series(pd.NaT, index = values.index, dtype = 'datetime64[ns]')
+    for date_format in DATE_FORMATS:
+        pending = ~missing & parsed.isna()
+        if not pending.any():
+            break
+        parsed[pending] = pd.to_datetime(text[pending], format = date_format, errors = 'coerce')
+    unparsed = ~missing & parsed.isna()
+    if unparsed.any():
+        raise SchemaError('{} has {} unparseable dates, e.g. {!r}'.format(column or 'column', int(unparsed.sum()), text[unparsed].iloc[0]))
+    return parsed
+
+
+# Integers narrowed to the schema dtype; raises instead of wrapping out-of-range values
+def downcast_integers(values, column, dtype):
+    limits = np.iinfo(dtype)
+    if values.isna().any():
+        raise SchemaError('{} has missing values'.format(column))
+    if len(values) and (values.min() < limits.min or values.max() > limits.max):
+        raise SchemaError('{} does not fit {}'.format(column, np.dtype(dtype).name))
+    return values.astype(dtype)
+
+
+# Convert a raw pipeline frame to the compact schema. Columns outside the schema are kept.
+def apply_schema(df):
+    missing = [column for column in schema_dtypes() if column not in df.columns]
+    if missing:
+        raise SchemaError('Missing columns: {}'.format(', '.join(missing)))
+    df = df.copy()
+    for column in STRING_COLUMNS:
+        df[column] = df[column].astype(str)
+    for column in CATEGORY_COLUMNS:
+        df[column] = df[column].astype('category')
+    for column in DOCUMENT_STATUS_COLUMNS:
+        unknown = set(df[column].dropna().unique()).difference(DOCUMENT_STATUSES)
+        if unknown:
+            raise SchemaError('{} has unknown statuses: {}'.format(column, ', '.join(sorted(map(str, unknown)))))
+        df[column] = df[column].astype(DOCUMENT_STATUS_DTYPE)
+    for column in DATE_COLUMNS:
+        df[column] = parse_dates(df[column], column)
+    for column, dtype in INTEGER_COLUMNS.items():
+        df[column] = downcast_integers(df[column], column, dtype)
+    return df
+
+
+# Check a loaded frame against the schema; raises SchemaError listing every mismatch
+def validate_schema(df):
+    problems = ['{} is missing'.format(column) for column in schema_dtypes() if column not in df.columns]
+    present = lambda columns: [column for column in columns if column in df.columns]
+    for column in present(STRING_COLUMNS):
+        if df[column].dtype != object:
+            problems.append('{} is {}, expected strings'.format(column, df[column].dtype))
+    for column in present(CATEGORY_COLUMNS + DOCUMENT_STATUS_COLUMNS):
+        if not isinstance(df[column].dtype, pd.CategoricalDtype):
+            problems.append('{} is {}, expected category'.format(column, df[column].dtype))
+    for column in present(DOCUMENT_STATUS_COLUMNS):
+        if isinstance(df[column].dtype, pd.CategoricalDtype) and not set(DOCUMENT_STATUSES).issubset(df[column].cat.categories):
+            problems.append('{} does not hold the document statuses'.format(column))
+    for column in present(DATE_COLUMNS):
+        if not pd.api.types.is_datetime64_dtype(df[column].dtype):
+            problems.append('{} is {}, expected datetime64'.format(column, df[column].dtype))
+    for column, dtype in INTEGER_COLUMNS.items():
+        if column in df.columns and df[column].dtype != dtype:
+            problems.append('{} is {}, expected {}'.format(column, df[column].dtype, np.dtype(dtype).name))
+    if problems:
+        raise SchemaError('; '.join(problems))
+
+
+def memory_usage(df):
+    return int(df.memory_usage(index = True, deep = True).sum())
@@ -0,0 +1,186 @@
+import argparse
+import logging
+import os
+import pickle
+import shutil
+import threading
+import time
+from datetime import date
+
+import numpy as np
+
+from data_loader import read_manifest
+from dataset_store import DatasetStore
+from expiration import ExpirationIndex
+from filter_engine import FilterIndex
+from funnel import FunnelIndex
+from grid_pages import SORT_COLUMNS, SortIndex
+from metrics_cube import MetricsCube
+from option_catalog import OptionCatalog
+from question_engine import QuestionEngine
+
+# Shared serving mode for several Streamlit processes on one node: a publisher process
+# (python serving.py) keeps the dataset store up to date and writes each snapshot to shared
+# memory, and every worker attaches to the newest one instead of loading its own copy.
+# Setting LOAN_PIPELINE_SHARED_DIR, e.g. to /dev/shm/loan_pipeline, turns the mode on.
+SHARED_DIR = os.environ.get('LOAN_PIPELINE_SHARED_DIR')
+
+# One folder per published version holding every numeric array of the snapshot in one file,
+# and the pickled snapshot referring to them by offset
+ARRAYS_FILE = 'arrays.bin'
+SNAPSHOT_FILE = 'snapshot.pickle'
+CURRENT_FILE = 'current'
+
+# Versions kept after publishing; workers still reading an older one keep their mapping
+KEEP_VERSIONS = 2
+# Arrays smaller than this, and object arrays (strings), are pickled inline
+MIN_SHARED_BYTES = 4096
+ALIGNMENT = 64
+PUBLISH_INTERVAL_SECONDS = 5
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetNotPublished(LookupError):
+    pass
+
+
+def _exported_on(cache_dir):
+    manifest = read_manifest(cache_dir) or {}
+    return date.fromisoformat(manifest['exported_on']) if 'exported_on' in manifest else None
+
+
+# The dataset store with every artifact the dashboard reads
+def create_store(**kwargs):
+    store = DatasetStore(**kwargs)
+    store.register('filter_index', FilterIndex, FilterIndex.apply_delta)
+    store.register('metrics_cube', MetricsCube, MetricsCube.apply_delta)
+    store.register('sort_index', lambda frame: SortIndex(frame, SORT_COLUMNS), SortIndex.apply_delta)
+    store.register('funnel', FunnelIndex, FunnelIndex.apply_delta)
+    # Statuses are read as of the archive's export day, which ingested loans do not move
+    store.register('expiration', lambda frame: ExpirationIndex(frame, _exported_on(store.cache_dir)), ExpirationIndex.apply_delta)
+    store.register('question_engine', QuestionEngine, QuestionEngine.apply_delta)
+    store.derive('option_catalog', 'filter_index', OptionCatalog)
+    return store
+
+
+# Pickles a snapshot with its numeric arrays appended to one flat file
+class _SharingPickler(pickle.Pickler):
+    def __init__(self, pickle_file, arrays_file):
+        super().__init__(pickle_file, protocol = pickle.HIGHEST_PROTOCOL)
+        self.arrays_file = arrays_file
+
+    def persistent_id(self, obj):
+        if type(obj) is not np.ndarray or obj.dtype.hasobject or obj.nbytes < MIN_SHARED_BYTES:
+            return None
+        order = 'F' if obj.flags.f_contiguous and not obj.flags.c_contiguous else 'C'
+        offset = -self.arrays_file.tell() % ALIGNMENT + self.arrays_file.tell()
+        self.arrays_file.seek(offset)
+        self.arrays_file.write(np.asarray(obj, order = order).tobytes(order = order))
+        return (offset, obj.dtype.str, obj.shape, order)
+
+
+# Unpickles a snapshot with its arrays as read-only views of the memory mapped array file
+class _AttachingUnpickler(pickle.Unpickler):
+    def __init__(self, pickle_file, arrays):
+        super().__init__(pickle_file)
+        self.arrays = arrays
+
+    def persistent_load(self, pid):
+        offset, dtype, shape, order = pid
+        return np.ndarray(shape, dtype = np.dtype(dtype), buffer = self.arrays, offset = offset, order = order)
+
+
+def _versions(shared_dir):
+    names = [name for name in os.listdir(shared_dir) if os.path.exists(os.path.join(shared_dir, name, SNAPSHOT_FILE))]
+    return sorted(names, key = lambda name: os.path.getmtime(os.path.join(shared_dir, name)))
+
+
+def _write_current(shared_dir, name):
+    temp_path = os.path.join(shared_dir, '{}.{}.tmp'.format(CURRENT_FILE, os.getpid()))
+    with open(temp_path, 'w') as current_file:
+        current_file.write(name)
+    os.replace(temp_path, os.path.join(shared_dir, CURRENT_FILE))
+
+
+# Write a snapshot to the shared folder and point the workers at it
+def publish(snapshot, shared_dir = SHARED_DIR):
+    os.makedirs(shared_dir, exist_ok = True)
+    version_dir = os.path.join(shared_dir, snapshot.version)
+    if not os.path.exists(version_dir):
+        temp_dir = '{}.{}.tmp'.format(version_dir, os.getpid())
+        shutil.rmtree(temp_dir, ignore_errors = True)
+        os.makedirs(temp_dir)
+        with open(os.path.join(temp_dir, ARRAYS_FILE), 'wb') as arrays_file, open(os.path.join(temp_dir, SNAPSHOT_FILE), 'wb') as pickle_file:
+            _SharingPickler(pickle_file, arrays_file).dump(snapshot)
+        os.rename(temp_dir, version_dir)
+    _write_current(shared_dir, snapshot.version)
+    for name in _versions(shared_dir)[:-KEEP_VERSIONS]:
+        if name != snapshot.version:
+            shutil.rmtree(os.path.join(shared_dir, name), ignore_errors = True)
+    logger.info('Published dataset version %s to %s', snapshot.version, shared_dir)
+
+
+def attach(version_dir):
+    arrays_path = os.path.join(version_dir, ARRAYS_FILE)
+    arrays = np.memmap(arrays_path, dtype = np.uint8, mode = 'r') if os.path.getsize(arrays_path) else np.empty(0, dtype = np.uint8)
+    with open(os.path.join(version_dir, SNAPSHOT_FILE), 'rb') as pickle_file:
+        return _AttachingUnpickler(pickle_file, arrays).load()
+
+
+# Worker side of the shared mode, read like a DatasetStore: refresh() returns the newest
+# published snapshot, attached once per version and shared by every session of the process
+class SharedDatasetReader:
+    def __init__(self, shared_dir = SHARED_DIR):
+        self.shared_dir = shared_dir
+        self.listeners = []
+        self.snapshot = None
+        self._name = None
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def _current(self):
+        try:
+            with open(os.path.join(self.shared_dir, CURRENT_FILE)) as current_file:
+                return current_file.read().strip()
+        except FileNotFoundError:
+            raise DatasetNotPublished('No dataset has been published to {}; start the publisher with python serving.py'.format(self.shared_dir))
+
+    # Cheap when nothing changed: one read of the pointer file
+    def refresh(self):
+        with self._lock:
+            name = self._current()
+            if name != self._name:
+                try:
+                    snapshot = attach(os.path.join(self.shared_dir, name))
+                except FileNotFoundError:
+                    # Replaced while we read the pointer; the next one is complete
+                    name = self._current()
+                    snapshot = attach(os.path.join(self.shared_dir, name))
+                previous, self.snapshot, self._name = self.snapshot, snapshot, name
+                for callback in self.listeners:
+                    callback(previous, snapshot, None)
+            return self.snapshot
+
+
+# Keep the store up to date, ingesting dropped batches, and publish every new snapshot
+def run_publisher(shared_dir = SHARED_DIR, interval = PUBLISH_INTERVAL_SECONDS):
+    store = create_store()
+    store.add_listener(lambda previous, snapshot, delta: publish(snapshot, shared_dir))
+    while True:
+        try:
+            store.refresh()
+        except (OSError, ValueError) as error:
+            logger.warning('Could not refresh the dataset: %s', error)
+        time.sleep(interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Publish the loan pipeline dataset to shared memory for the dashboard workers')
+    parser.add_argument('--shared-dir', default = SHARED_DIR or '/dev/shm/loan_pipeline')
+    parser.add_argument('--interval', type = float, default = PUBLISH_INTERVAL_SECONDS)
+    args = parser.parse_args()
+    logging.basicConfig(level = logging.INFO, format = '%(asctime)s %(levelname)s %(message)s')
+    run_publisher(args.shared_dir, args.interval)
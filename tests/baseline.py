@@ -0,0 +1,84 @@
+from collections import Counter
+
+import numpy as np
+
+# The dashboard's computations as they were before the engines replaced them, row by row
+# where they were, for the engines to be checked against
+
+
+# Positions of the rows the sidebar's df.query kept
+def query_rows(df, selection):
+    selected_year, selected_month, loan_officer, loan_processor, loan_closer, loan_source, loan_type, last_finished_milestone = (list(value) for value in selection.values.values())
+    selected_min_progress = selection.selected_min_progress
+    selected_max_progress = selection.selected_max_progress
+    filtered_data = df.query('`Extracted Year (Milestone Date - Submittal)` in @selected_year and `Extracted Month (Milestone Date - Submittal)` in @selected_month and `Loan Officer` in @loan_officer and `Loan Processor` in @loan_processor and `Loan Closer` in @loan_closer and `Loan Source` in @loan_source and `Loan Type` in @loan_type and `Last Finished Milestone` in @last_finished_milestone and `Progress` >= @selected_min_progress and `Progress` <= @selected_max_progress')
+    return df.index.get_indexer(filtered_data.index)
+
+
+def key_metric_counts(filtered_data):
+    return {
+        'applications': int(filtered_data["GFE Application Date"].count()),
+        'approval_dates': int(filtered_data["Milestone Date - Approval"].count()),
+        'submittal_dates': int(filtered_data["Milestone Date - Submittal"].count()),
+        'clear_to_close_dates': int(filtered_data["Milestone Date - Clear To Close"].count()),
+        'milestones': {milestone: int(filtered_data["Last Finished Milestone"].eq(milestone).sum()) for milestone in ["Approval", "Clear to Close", "Completion", "Cond. Approval", "Doc Preparation"]},
+    }
+
+
+# The AI Advisor loops, with the index labels of each queue
+def advisor_queues(filtered_data):
+    suggestion_filter_df = filtered_data[(filtered_data["All Documents Received Status"] == "Yes") & (filtered_data["All Documents Expiration Status"] == "Not Expired") & (filtered_data["Progress"] >= 95)]
+
+    productivity_df = suggestion_filter_df[suggestion_filter_df["Expected Time to Complete (minutes)"] <= 10]
+    productivity_total_time_to_complete = int(productivity_df["Expected Time to Complete (minutes)"].sum())
+    productivity_applications_count_list = []
+    if productivity_total_time_to_complete < 100:
+        for i in range(len(productivity_df)):
+            productivity_applications_count_list.append(productivity_df.index[i])
+
+    efficiency_df = suggestion_filter_df[suggestion_filter_df["Expected Time to Complete (minutes)"] < 15]
+    efficiency_applications_count_list = []
+    efficiency_average_time_to_complete = None
+    if len(efficiency_df) > 0:
+        efficiency_average_time_to_complete = int(efficiency_df["Expected Time to Complete (minutes)"].mean())
+        if efficiency_average_time_to_complete <= 10:
+            for i in range(len(efficiency_df)):
+                efficiency_applications_count_list.append(efficiency_df.index[i])
+
+    accuracy_df = suggestion_filter_df[suggestion_filter_df["Error Type"] != "No Error"]
+    error_applications_count_list = []
+    error_type_list = []
+    error_type_unique_list = []
+    for i in range(len(accuracy_df)):
+        error_applications_count_list.append(accuracy_df.index[i])
+        error_type_list.append(accuracy_df.iloc[i, accuracy_df.columns.get_loc("Error Type")])
+        if accuracy_df.iloc[i, accuracy_df.columns.get_loc("Error Type")] not in error_type_unique_list:
+            error_type_unique_list.append(accuracy_df.iloc[i, accuracy_df.columns.get_loc("Error Type")])
+    most_frequent_error_type_list = Counter(error_type_list).most_common()
+    most_frequent_error_type_selected_list = []
+    if len(most_frequent_error_type_list) > 3:
+        for i in range(3):
+            if most_frequent_error_type_list[i][0] not in most_frequent_error_type_selected_list:
+                most_frequent_error_type_selected_list.append(most_frequent_error_type_list[i][0])
+
+    effectiveness_df = suggestion_filter_df[suggestion_filter_df["Ageing (days)"] < 2]
+    effectiveness_applications_count_list = []
+    for i in range(len(effectiveness_df)):
+        effectiveness_applications_count_list.append(effectiveness_df.index[i])
+
+    loan_processor_list = []
+    for i in range(len(suggestion_filter_df)):
+        if suggestion_filter_df.iloc[i, suggestion_filter_df.columns.get_loc("Loan Processor")] not in loan_processor_list:
+            loan_processor_list.append(suggestion_filter_df.iloc[i, suggestion_filter_df.columns.get_loc("Loan Processor")])
+
+    return {
+        'productivity_rows': np.array(productivity_applications_count_list, dtype = filtered_data.index.dtype),
+        'productivity_total_minutes': productivity_total_time_to_complete,
+        'efficiency_rows': np.array(efficiency_applications_count_list, dtype = filtered_data.index.dtype),
+        'efficiency_average_minutes': efficiency_average_time_to_complete,
+        'accuracy_rows': np.array(error_applications_count_list, dtype = filtered_data.index.dtype),
+        'error_types': most_frequent_error_type_selected_list if len(most_frequent_error_type_list) > 3 else error_type_unique_list,
+        'error_type_count': len(most_frequent_error_type_list),
+        'effectiveness_rows': np.array(effectiveness_applications_count_list, dtype = filtered_data.index.dtype),
+        'loan_processors': [name.split(' ', 1)[0] for name in loan_processor_list],
+    }
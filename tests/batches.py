@@ -0,0 +1,22 @@
+import numpy as np
+
+from benchmarks.synthetic_pipeline import generate_pipeline, to_source_format
+
+# First Loan Number of the appended loans, above every generated one
+NEW_LOAN_NUMBER = 90000000
+
+
+# Batch as the pipeline export drops it: `updated` loans of `frame` given every value of freshly
+# generated loans, and `appended` new loans. Staff names are the ones of `frame` when `seed` is
+# the seed it was generated with, new ones otherwise. Missing dates leave the stored ones.
+def loan_batch(frame, updated, appended, seed):
+    batch = to_source_format(generate_pipeline(updated + appended, seed))
+    rng = np.random.default_rng(seed)
+    known = rng.choice(frame['Loan Number'].astype(str).to_numpy(), size = updated, replace = False)
+    batch['Loan Number'] = np.concatenate([known, [str(NEW_LOAN_NUMBER + number) for number in range(appended)]])
+    return batch
+
+
+def write_batch(batch, path):
+    batch.to_csv(path, index = False)
+    return str(path)
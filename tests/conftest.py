@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from benchmarks.synthetic_pipeline import generate_pipeline
+from data_loader import DATA_ARCHIVE, load_dataset
+from filter_engine import FILTER_COLUMNS, RANGE_COLUMN, FilterSelection
+
+SYNTHETIC_ROWS = 20000
+
+
+# Pipeline frame with the schema the dashboard loads, from the synthetic generator
+@pytest.fixture(scope = 'session')
+def pipeline():
+    return generate_pipeline(SYNTHETIC_ROWS, seed = 7)
+
+
+# The archive shipped with the dashboard, converted into a temporary cache
+@pytest.fixture(scope = 'session')
+def shipped_pipeline(tmp_path_factory):
+    archive_path = os.path.join(ROOT, DATA_ARCHIVE)
+    if not os.path.exists(archive_path):
+        pytest.skip('{} is not available'.format(DATA_ARCHIVE))
+    return load_dataset(archive_path, str(tmp_path_factory.mktemp('cache'))).frame
+
+
+# Sidebar selections to check the engines on: everything, each processor as a fresh session
+# opens with it, random subsets of every filter and an empty one
+@pytest.fixture(scope = 'session')
+def selections(pipeline):
+    options = {field: sorted(pipeline[column].dropna().unique()) for field, column in FILTER_COLUMNS.items()}
+    low, high = int(pipeline[RANGE_COLUMN].min()), int(pipeline[RANGE_COLUMN].max())
+    selections = [FilterSelection(low, high, **options)]
+    selections += [FilterSelection(low, high, **dict(options, loan_processor = [processor])) for processor in options['loan_processor']]
+    rng = np.random.default_rng(11)
+    for _ in range(12):
+        values = {field: [value for value in values if rng.random() < 0.7] for field, values in options.items()}
+        bounds = sorted(rng.integers(low, high + 1, size = 2))
+        selections.append(FilterSelection(int(bounds[0]), int(bounds[1]), **values))
+    selections.append(FilterSelection(low, high, **dict(options, loan_type = [])))
+    return selections
@@ -0,0 +1,30 @@
+import numpy as np
+
+from advisor import compute_advisor_insights
+from baseline import advisor_queues, query_rows
+
+
+def test_insights_match_the_loops(pipeline, selections):
+    suggested = 0
+    for selection in selections:
+        filtered = pipeline.iloc[query_rows(pipeline, selection)]
+        insights = compute_advisor_insights(filtered)
+        expected = advisor_queues(filtered)
+        for name, value in expected.items():
+            if name.endswith('_rows'):
+                np.testing.assert_array_equal(getattr(insights, name), value, err_msg = name)
+            else:
+                assert getattr(insights, name) == value, name
+        assert len(insights.held_rows) == 0
+        suggested += insights.has_insights()
+    assert suggested > 0
+
+
+# The loans expired documents hold back are reported instead of suggested
+def test_expired_documents_hold_loans_back(pipeline):
+    documents_current = np.zeros(len(pipeline), dtype = bool)
+    insights = compute_advisor_insights(pipeline, documents_current)
+    ready = (pipeline['All Documents Received Status'] == 'Yes') & (pipeline['Progress'] >= 95)
+    assert not insights.has_insights()
+    np.testing.assert_array_equal(insights.held_rows, pipeline.index[ready.to_numpy()])
+    assert insights.loan_processors == [name.split(' ', 1)[0] for name in pipeline['Loan Processor'][ready].unique()]
@@ -0,0 +1,77 @@
+import os
+
+import numpy as np
+import pytest
+
+from advisor_queues import AdvisorScheduler, compute_filter_result, processor_selections
+from baseline import advisor_queues, key_metric_counts, query_rows
+from batches import loan_batch, write_batch
+from benchmarks.synthetic_pipeline import write_archive
+from result_cache import ResultCache, selection_key
+from serving import create_store
+
+
+@pytest.fixture
+def store(pipeline, tmp_path):
+    archive_path = str(tmp_path / 'pipeline.zip')
+    write_archive(pipeline, archive_path)
+    store = create_store(archive_path = archive_path, cache_dir = str(tmp_path / 'cache'), incoming_dir = str(tmp_path / 'incoming'))
+    store.refresh()
+    return store
+
+
+# What the page computed on every rerun: df.query, the header counts and the advisor loops
+# over the loans with the document statuses of the result's day. Loans ready but for their
+# documents are held back, and named when nothing can be suggested.
+def assert_matches_baseline(snapshot, selection, result):
+    rows = query_rows(snapshot.frame, selection)
+    np.testing.assert_array_equal(result.rows, rows)
+    filtered = snapshot['expiration'].overlay(snapshot.frame.iloc[rows], rows, result.status_date)
+    assert result.metrics.counts == key_metric_counts(filtered)
+    expected = advisor_queues(filtered)
+    held = filtered[(filtered["All Documents Received Status"] == "Yes") & (filtered["All Documents Expiration Status"] != "Not Expired") & (filtered["Progress"] >= 95)]
+    expected['held_rows'] = held.index.to_numpy()
+    if not expected['loan_processors']:
+        expected['loan_processors'] = [name.split(' ', 1)[0] for name in held["Loan Processor"].unique()]
+    for name, value in expected.items():
+        if name.endswith('_rows'):
+            np.testing.assert_array_equal(getattr(result.advisor_insights, name), value, err_msg = name)
+        else:
+            assert getattr(result.advisor_insights, name) == value, name
+
+
+def test_filter_results_match_baseline(store, selections):
+    for selection in selections:
+        assert_matches_baseline(store.snapshot, selection, compute_filter_result(store.snapshot, selection))
+
+
+# Each processor's queue is precomputed once per version; results a delta cannot change are
+# carried forward instead of being computed again
+def test_scheduler_precomputes_processor_queues(store, tmp_path):
+    result_cache = ResultCache()
+    scheduler = AdvisorScheduler(result_cache, workers = 2)
+
+    def carry_forward_results(previous, snapshot, delta):
+        if previous is not None:
+            result_cache.carry_forward(previous.version, snapshot.version, delta, snapshot.frame.iloc[delta.rows])
+
+    store.add_listener(carry_forward_results)
+    store.add_listener(scheduler)
+
+    for attempt in range(2):
+        snapshot = store.snapshot
+        scheduler.ensure_current(snapshot)
+        selections = list(processor_selections(snapshot['option_catalog']))
+        for selection in selections:
+            key = selection_key(snapshot.version, selection)
+            scheduler.wait(key)
+            assert_matches_baseline(snapshot, selection, result_cache.peek(key))
+        assert scheduler.stats()['failed'] == 0
+        if attempt == 0:
+            assert scheduler.stats()['completed'] == len(selections)
+            os.makedirs(store.incoming_dir)
+            write_batch(loan_batch(snapshot.frame, 3, 0, seed = 7), os.path.join(store.incoming_dir, 'batch.csv'))
+            store.refresh()
+            assert store.snapshot.version != snapshot.version
+            # Only the processors of the updated loans before or after the batch were queued again
+            assert 0 < scheduler.stats()['completed'] + scheduler.stats()['pending'] < len(selections)
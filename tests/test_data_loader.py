@@ -0,0 +1,54 @@
+import os
+
+from benchmarks.synthetic_pipeline import write_archive
+from data_loader import DATASET_FILE, FORMAT_VERSION, ensure_dataset, load_dataset, read_dataset, read_manifest
+
+
+def _paths(tmp_path):
+    return str(tmp_path / 'pipeline.zip'), str(tmp_path / 'cache')
+
+
+def _touch(path, seconds):
+    stat = os.stat(path)
+    os.utime(path, ns = (stat.st_atime_ns, stat.st_mtime_ns + seconds * 10 ** 9))
+
+
+# The converted file holds the archive's frame; numbers, dates and category codes are read-only
+# views of the memory mapped file
+def test_converted_dataset_is_read_without_copies(pipeline, tmp_path):
+    archive_path, cache_dir = _paths(tmp_path)
+    write_archive(pipeline, archive_path)
+    dataset = load_dataset(archive_path, cache_dir)
+    assert dataset.version == read_manifest(cache_dir)['version']
+    assert dataset.version.startswith('{}-'.format(FORMAT_VERSION))
+    assert dataset.frame.equals(pipeline)
+
+    frame = read_dataset(os.path.join(cache_dir, DATASET_FILE))
+    for column in ['Progress', 'Ageing (days)', 'GFE Application Date']:
+        assert not frame[column].to_numpy().flags.writeable
+    assert not frame['Loan Type'].cat.codes.to_numpy().flags.writeable
+    assert frame.equals(dataset.frame)
+
+
+# A touched archive with the same content keeps the conversion; a changed one is converted again
+def test_conversion_follows_the_archive(pipeline, tmp_path):
+    archive_path, cache_dir = _paths(tmp_path)
+    write_archive(pipeline, archive_path)
+    manifest = ensure_dataset(archive_path, cache_dir)
+    dataset_path = os.path.join(cache_dir, DATASET_FILE)
+    converted = os.stat(dataset_path).st_mtime_ns
+
+    assert ensure_dataset(archive_path, cache_dir) == manifest
+    _touch(archive_path, 10)
+    touched = ensure_dataset(archive_path, cache_dir)
+    assert touched['version'] == manifest['version']
+    assert touched['source_mtime_ns'] == os.stat(archive_path).st_mtime_ns != manifest['source_mtime_ns']
+    assert os.stat(dataset_path).st_mtime_ns == converted
+
+    changed = pipeline.iloc[:5000]
+    write_archive(changed, archive_path)
+    _touch(archive_path, 20)
+    rebuilt = ensure_dataset(archive_path, cache_dir)
+    assert rebuilt['version'] != manifest['version']
+    assert rebuilt['source_sha256'] != manifest['source_sha256']
+    assert read_dataset(dataset_path).equals(changed)
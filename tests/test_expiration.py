@@ -0,0 +1,102 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from expiration import ALERT_COLUMNS, DEFAULT_VALIDITY_DAYS, EXPIRING_SOON_DAYS, OVERALL_COLUMN, RECEIVED_DATES, STATUS_CODES, STATUS_COLUMNS, ExpirationIndex, archive_export_day
+from schema import DOCUMENT_STATUS_DTYPE
+
+EXPORT_DAY = date(2021, 6, 1)
+# Documents whose statuses the consistent frame derives from their received dates
+DERIVED = ['ExpAppraisal1', 'Exp_Title1']
+# Statuses of documents still open, worst first
+OPEN_STATUSES = ['Expired', 'Expiring Soon', 'Not Expired']
+RANKS = {status: rank for rank, status in enumerate(OPEN_STATUSES)}
+
+
+def _status(expires, day):
+    soon = pd.Timedelta(days = EXPIRING_SOON_DAYS)
+    return pd.Series(np.select([expires < day, expires < day + soon], ['Expired', 'Expiring Soon'], 'Not Expired'), index = expires.index)
+
+
+# Statuses as of `day` with pandas. A document's expiry day comes from its received date when
+# that agrees with the status stored on `exported_on`, and otherwise from the status alone:
+# Expired the day before, Expiring Soon within EXPIRING_SOON_DAYS, Not Expired never.
+def statuses_as_of(frame, exported_on, day):
+    statuses = frame[STATUS_COLUMNS].astype(object).fillna('Pending')
+    exported, day = pd.Timestamp(exported_on), pd.Timestamp(day)
+    soon, one_day = pd.Timedelta(days = EXPIRING_SOON_DAYS), pd.Timedelta(days = 1)
+    worse = {'Expired': False, 'Expiring Soon': False}
+    for column in ALERT_COLUMNS:
+        stored = statuses[column]
+        is_open = stored.isin(OPEN_STATUSES)
+        earliest = pd.to_datetime(stored.map({'Expiring Soon': exported, 'Not Expired': exported + soon}))
+        expires = pd.to_datetime(stored.map({'Expired': exported - one_day, 'Expiring Soon': exported + soon - one_day}))
+        if column in RECEIVED_DATES:
+            received = frame[RECEIVED_DATES[column]].dt.normalize() + pd.Timedelta(days = DEFAULT_VALIDITY_DAYS[column])
+            agrees = is_open & received.notna() & ~(received < earliest) & ~(received > expires)
+            expires = expires.where(~agrees, received)
+        computed = _status(expires, day)
+        got_worse = is_open & (computed.map(RANKS) < stored.map(RANKS))
+        for status in worse:
+            worse[status] = worse[status] | (got_worse & (computed == status))
+        statuses.loc[is_open, column] = computed[is_open]
+    # The overall status only worsens, and only for loans still open
+    open_loans = statuses[OVERALL_COLUMN].isin(OPEN_STATUSES)
+    statuses.loc[open_loans & worse['Expiring Soon'] & (statuses[OVERALL_COLUMN] != 'Expired'), OVERALL_COLUMN] = 'Expiring Soon'
+    statuses.loc[open_loans & worse['Expired'], OVERALL_COLUMN] = 'Expired'
+    return statuses
+
+
+def codes(statuses):
+    return statuses.apply(lambda column: column.map(STATUS_CODES)).to_numpy(dtype = np.int8)
+
+
+# The pipeline exported on EXPORT_DAY with Appraisal and Title statuses that follow from their
+# received dates, some loans closed or already expired overall and some without an overall status
+@pytest.fixture(scope = 'module')
+def consistent(pipeline):
+    frame = pipeline.copy()
+    overall = np.random.default_rng(5).choice(['Closed', 'Expired', 'Not Expired', None], size = len(frame), p = [0.1, 0.2, 0.65, 0.05])
+    frame[OVERALL_COLUMN] = pd.Categorical(overall, dtype = DOCUMENT_STATUS_DTYPE)
+    for column in DERIVED:
+        received = frame[RECEIVED_DATES[column]].dt.normalize() + pd.Timedelta(days = DEFAULT_VALIDITY_DAYS[column])
+        dated = received.notna() & frame[column].isin(OPEN_STATUSES)
+        frame[column] = frame[column].astype(object).where(~dated, _status(received, pd.Timestamp(EXPORT_DAY))).astype(frame[column].dtype)
+    return frame
+
+
+def test_export_day_is_the_latest_application(pipeline):
+    assert archive_export_day(pipeline) == pipeline['GFE Application Date'].max().date()
+    assert ExpirationIndex(pipeline).exported_on == archive_export_day(pipeline)
+
+
+# Nothing changes on the day the statuses were exported; a missing status counts as Pending
+def test_export_day_keeps_stored_statuses(pipeline, consistent):
+    for frame, exported_on in [(pipeline, None), (consistent, EXPORT_DAY)]:
+        index = ExpirationIndex(frame, exported_on)
+        np.testing.assert_array_equal(index.statuses(index.exported_on), codes(frame[STATUS_COLUMNS].astype(object).fillna('Pending')))
+
+
+@pytest.mark.parametrize('days', [3, 9, 10, 45, 400])
+def test_statuses_match_pandas(pipeline, consistent, days):
+    for frame, exported_on in [(pipeline, archive_export_day(pipeline)), (consistent, EXPORT_DAY)]:
+        day = exported_on + timedelta(days = days)
+        np.testing.assert_array_equal(ExpirationIndex(frame, exported_on).statuses(day), codes(statuses_as_of(frame, exported_on, day)))
+
+
+# Every document, dated or not, Expiring Soon on the export day has expired ten days later,
+# and only loans whose overall status was Not Expired stay current
+def test_expiring_soon_documents_expire(consistent):
+    index = ExpirationIndex(consistent, EXPORT_DAY)
+    statuses = index.statuses(EXPORT_DAY + timedelta(days = EXPIRING_SOON_DAYS))
+    for position, column in enumerate(ALERT_COLUMNS):
+        expiring_soon = (consistent[column] == 'Expiring Soon').to_numpy()
+        assert expiring_soon.any()
+        assert (statuses[expiring_soon, position] == STATUS_CODES['Expired']).all(), column
+        pending = (consistent[column] == 'Pending').to_numpy()
+        assert (statuses[pending, position] == STATUS_CODES['Pending']).all(), column
+    current = index.documents_current(np.arange(len(consistent)), EXPORT_DAY)
+    assert not current[consistent[OVERALL_COLUMN].isna().to_numpy()].any()
+    np.testing.assert_array_equal(current, (consistent[OVERALL_COLUMN] == 'Not Expired').to_numpy())
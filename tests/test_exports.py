@@ -0,0 +1,73 @@
+import os
+import stat
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import exports
+from exports import EXPORT_MODE, MAX_AGE_SECONDS, ExportJobs, ExportTooLarge, export, iter_frames
+
+COLUMNS = ['Loan Number', 'Loan Type', 'GFE Application Date']
+
+
+def test_export_matches_the_rows(pipeline, tmp_path):
+    rows = np.arange(0, len(pipeline), 7)
+    filename = export('loans', 'all', iter_frames(pipeline, rows, COLUMNS, chunk_rows = 1000), 'Parquet', directory = str(tmp_path))
+    exported = pd.read_parquet(tmp_path / filename)
+    expected = pipeline.iloc[rows][COLUMNS].reset_index(drop = True)
+    pd.testing.assert_frame_equal(exported, expected, check_categorical = False, check_dtype = False)
+
+
+def test_export_is_readable_by_others(pipeline, tmp_path):
+    umask = os.umask(0o077)
+    try:
+        filename = export('loans', 'mode', iter_frames(pipeline, np.arange(10), COLUMNS), 'CSV', directory = str(tmp_path))
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(os.stat(tmp_path / filename).st_mode) == EXPORT_MODE
+
+
+def test_replaced_and_expired_exports_are_removed(pipeline, tmp_path):
+    first = export('loans', 'first', iter_frames(pipeline, np.arange(10), COLUMNS), 'CSV', directory = str(tmp_path))
+    second = export('loans', 'second', iter_frames(pipeline, np.arange(20), COLUMNS), 'CSV', directory = str(tmp_path), replaces = first)
+    assert os.listdir(tmp_path) == [second]
+
+    expired = time.time() - MAX_AGE_SECONDS - 1
+    os.utime(tmp_path / second, (expired, expired))
+    other = export('grid', 'other', iter_frames(pipeline, np.arange(5), COLUMNS), 'CSV', directory = str(tmp_path))
+    assert os.listdir(tmp_path) == [other]
+
+
+def test_export_job_writes_in_the_background(pipeline, tmp_path):
+    rows = np.arange(0, len(pipeline), 3)
+    release = threading.Event()
+
+    def held(frames):
+        for frame in frames:
+            release.wait()
+            yield frame
+
+    jobs = ExportJobs(workers = 1)
+    job = jobs.submit('loans', 'held', held(iter_frames(pipeline, rows, COLUMNS, chunk_rows = 1000)), 'CSV', len(rows), directory = str(tmp_path))
+    assert not job.done()
+    # The same export asked for again joins the running job
+    assert jobs.submit('loans', 'held', iter([]), 'CSV', len(rows), directory = str(tmp_path)) is job
+
+    polls = []
+    release.set()
+    filename = job.wait(lambda: polls.append(job.written_rows))
+    assert job.written_rows == job.total_rows == len(rows)
+    assert jobs.jobs == {}
+    exported = pd.read_csv(tmp_path / filename, dtype = {'Loan Number': str})
+    assert exported['Loan Number'].tolist() == pipeline['Loan Number'].iloc[rows].tolist()
+
+
+def test_export_job_raises_too_large(pipeline, tmp_path, monkeypatch):
+    monkeypatch.setattr(exports, 'MAX_EXPORT_BYTES', 100)
+    job = ExportJobs(workers = 1).submit('loans', 'large', iter_frames(pipeline, np.arange(100), COLUMNS), 'CSV', 100, directory = str(tmp_path))
+    with pytest.raises(ExportTooLarge):
+        job.wait(lambda: None)
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,38 @@
+import plotly.graph_objects as go
+from streamlit.elements.plotly_chart import marshall
+from streamlit.proto.PlotlyChart_pb2 import PlotlyChart as PlotlyChartProto
+
+from figure_specs import FigureCache, donut_spec, funnel_spec, milestone_bar_spec
+
+SPECS = {
+    'donut': lambda: donut_spec("Milestone Date Approval", ["Milestone Date Approval", "Milestone Date Submittal"], [120, 80]),
+    'milestones': lambda: milestone_bar_spec(["Doc Preparation", "Cond. Approval", "Completion", "Clear to Close", "Approval"], [5, 4, 3, 2, 1], ['5', '4', '3', '2', '1']),
+    'funnel': lambda: funnel_spec(['Application', 'Submittal'], [10, 7]),
+}
+
+
+def _message(figure):
+    proto = PlotlyChartProto()
+    marshall(proto, figure, True, 'streamlit', 'streamlit')
+    return proto
+
+
+# A cached figure is validated once and sends the same chart as one built from its spec
+def test_cached_figures_send_the_same_chart():
+    figure_cache = FigureCache()
+    for key, build in SPECS.items():
+        figure = figure_cache.figure(key, build)
+        assert figure_cache.figure(key, build) is figure
+        assert _message(figure) == _message(go.Figure(build()))
+        assert _message(figure) == _message(figure)
+    assert figure_cache.stats()['misses'] == len(SPECS)
+    assert figure_cache.stats()['hits'] == len(SPECS)
+
+
+def test_least_recently_used_figure_is_dropped():
+    figure_cache = FigureCache(max_entries = 2)
+    for key, build in SPECS.items():
+        figure_cache.figure(key, build)
+    assert figure_cache.stats()['entries'] == 2
+    figure_cache.figure('donut', SPECS['donut'])
+    assert figure_cache.stats()['misses'] == len(SPECS) + 1
@@ -0,0 +1,26 @@
+import numpy as np
+
+from baseline import query_rows
+from filter_engine import FILTER_COLUMNS, FilterIndex
+
+
+def test_select_matches_query(pipeline, selections):
+    index = FilterIndex(pipeline)
+    for selection in selections:
+        expected = query_rows(pipeline, selection)
+        np.testing.assert_array_equal(index.select(selection), expected)
+        np.testing.assert_array_equal(np.flatnonzero(selection.matches(pipeline)), expected)
+
+
+# A value is reachable when selecting it alone, with every other filter as selected, keeps a row
+def test_reachable_values_keep_rows(pipeline, selections):
+    index = FilterIndex(pipeline)
+    for selection in selections[-4:]:
+        reachable = index.reachable(selection)
+        for field, column in FILTER_COLUMNS.items():
+            others = np.ones(len(pipeline), dtype = bool)
+            for other_field, other_column in FILTER_COLUMNS.items():
+                if other_field != field:
+                    others &= pipeline[other_column].isin(selection.values[other_field]).to_numpy()
+            others &= pipeline['Progress'].between(selection.selected_min_progress, selection.selected_max_progress).to_numpy()
+            assert reachable[field] == set(pipeline[column][others].dropna().unique())
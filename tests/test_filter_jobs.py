@@ -0,0 +1,123 @@
+import threading
+import time
+
+import filter_jobs
+import numpy as np
+import pytest
+
+from benchmarks.synthetic_pipeline import write_archive
+from advisor_queues import AdvisorScheduler, compute_filter_result, processor_selections
+from filter_jobs import FilterJobs
+from result_cache import ResultCache, selection_key
+from serving import create_store
+
+
+@pytest.fixture(scope = 'module')
+def snapshot(pipeline, tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp('filter_jobs')
+    archive_path = str(tmp_path / 'pipeline.zip')
+    write_archive(pipeline, archive_path)
+    store = create_store(archive_path = archive_path, cache_dir = str(tmp_path / 'cache'), incoming_dir = str(tmp_path / 'incoming'))
+    return store.refresh()
+
+
+def _key(snapshot, selection):
+    return selection_key(snapshot.version, selection)
+
+
+# Occupy the only worker until `gate` is set, so submitted jobs queue up behind it
+def _blocked_jobs(gate):
+    jobs = FilterJobs(ResultCache(), workers = 1)
+    jobs._executor.submit(gate.wait)
+    return jobs
+
+
+def test_wait_returns_the_selected_rows(snapshot, selections):
+    jobs = FilterJobs(ResultCache())
+    for selection in selections:
+        key = _key(snapshot, selection)
+        result = jobs.wait(snapshot, selection, key, lambda: None)
+        np.testing.assert_array_equal(result.rows, snapshot['filter_index'].select(selection))
+        assert jobs.result_cache.peek(key) is result
+    assert jobs.stats() == {'in_flight': 0, 'abandoned': 0}
+
+
+# A session moving to a new selection abandons the job of the previous one before it starts:
+# it is never computed or cached, and the new selection gets its own rows
+def test_superseded_job_never_becomes_the_result(snapshot, selections):
+    gate = threading.Event()
+    jobs = _blocked_jobs(gate)
+    superseded, current = selections[1], selections[-2]
+    superseded_job = jobs.submit(snapshot, superseded, _key(snapshot, superseded))
+    jobs.abandon(_key(snapshot, superseded))
+
+    result = jobs.wait(snapshot, current, _key(snapshot, current), gate.set)
+    np.testing.assert_array_equal(result.rows, snapshot['filter_index'].select(current))
+    assert superseded_job.cancelled()
+    assert jobs.result_cache.peek(_key(snapshot, superseded)) is None
+    assert jobs.result_cache.peek(_key(snapshot, current)) is result
+    assert jobs.stats() == {'in_flight': 0, 'abandoned': 1}
+
+
+# Another session still waiting on an abandoned job submits it again and gets its rows
+def test_abandoned_job_is_resubmitted_for_a_waiting_session(snapshot, selections):
+    gate = threading.Event()
+    jobs = _blocked_jobs(gate)
+    selection = selections[2]
+    key = _key(snapshot, selection)
+    results = []
+    waiting = threading.Thread(target = lambda: results.append(jobs.wait(snapshot, selection, key, lambda: None)))
+    waiting.start()
+    while jobs.stats()['in_flight'] == 0:
+        time.sleep(0.01)
+    jobs.abandon(key)
+    gate.set()
+    waiting.join(timeout = 30)
+
+    np.testing.assert_array_equal(results[0].rows, snapshot['filter_index'].select(selection))
+    assert jobs.stats() == {'in_flight': 0, 'abandoned': 1}
+
+
+# A job already running when abandoned finishes into the cache under its own key only
+def test_running_job_finishes_under_its_own_key(snapshot, selections, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def held(snapshot, selection):
+        started.set()
+        release.wait()
+        return compute_filter_result(snapshot, selection)
+    monkeypatch.setattr(filter_jobs, 'compute_filter_result', held)
+    jobs = FilterJobs(ResultCache(), workers = 2)
+    superseded, current = selections[3], selections[0]
+    job = jobs.submit(snapshot, superseded, _key(snapshot, superseded))
+    started.wait()
+    jobs.abandon(_key(snapshot, superseded))
+    monkeypatch.undo()
+
+    result = jobs.wait(snapshot, current, _key(snapshot, current), lambda: None)
+    np.testing.assert_array_equal(result.rows, snapshot['filter_index'].select(current))
+    assert jobs.result_cache.peek(_key(snapshot, superseded)) is None
+    release.set()
+    job.result(timeout = 30)
+    assert not job.cancelled()
+    np.testing.assert_array_equal(jobs.result_cache.peek(_key(snapshot, superseded)).rows, snapshot['filter_index'].select(superseded))
+    assert jobs.stats() == {'in_flight': 0, 'abandoned': 0}
+
+
+# An advisor queue finishing between the scheduler's wait and the filter job is read from the
+# cache, not computed again on the session's behalf
+def test_result_finished_after_the_scheduler_wait_is_not_recomputed(snapshot, monkeypatch):
+    result_cache = ResultCache()
+    scheduler = AdvisorScheduler(result_cache, workers = 1)
+    scheduler.schedule(snapshot)
+    selection = next(processor_selections(snapshot['option_catalog']))
+    key = _key(snapshot, selection)
+    precomputed = scheduler.pending[key].result(timeout = 60)
+    assert scheduler.wait(key) is None
+
+    def recomputed(snapshot, selection):
+        raise AssertionError('computed again')
+    monkeypatch.setattr(filter_jobs, 'compute_filter_result', recomputed)
+    jobs = FilterJobs(result_cache)
+    assert jobs.wait(snapshot, selection, key, lambda: None) is precomputed
+    assert jobs.stats() == {'in_flight': 0, 'abandoned': 0}
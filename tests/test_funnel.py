@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from baseline import query_rows
+from batches import loan_batch, write_batch
+from funnel import FUNNEL_STAGES, FunnelIndex
+from ingestion import KeyIndex, apply_delta, read_batch
+
+
+# Funnel of the filtered frame with pandas: loans dated at each stage, loans dated at a stage
+# and the next one, and the whole days between the two dates
+def funnel_of(filtered):
+    dates = [filtered[column].dt.normalize() for column in FUNNEL_STAGES.values()]
+    counts = [int(stage.notna().sum()) for stage in dates]
+    converted, mean_cycle_days, median_cycle_days = [], [], []
+    for stage, next_stage in zip(dates, dates[1:]):
+        days = (next_stage - stage).dt.days.dropna()
+        converted.append(len(days))
+        mean_cycle_days.append(float(days.mean()) if len(days) else None)
+        median_cycle_days.append(float(days.median()) if len(days) else None)
+    return counts, converted, mean_cycle_days, median_cycle_days
+
+
+def assert_matches_pandas(summary, filtered):
+    counts, converted, mean_cycle_days, median_cycle_days = funnel_of(filtered)
+    assert summary.counts == counts
+    assert summary.converted == converted
+    assert summary.conversion_rates == [next_count / count if count else None for next_count, count in zip(converted, counts)]
+    assert summary.mean_cycle_days == pytest.approx(mean_cycle_days)
+    assert summary.median_cycle_days == median_cycle_days
+
+
+def test_summary_matches_pandas(pipeline, selections):
+    funnel = FunnelIndex(pipeline)
+    for selection in selections:
+        rows = query_rows(pipeline, selection)
+        assert_matches_pandas(funnel.summary(rows), pipeline.iloc[rows])
+
+
+def test_summary_after_delta_matches_pandas(pipeline, selections, tmp_path):
+    funnel = FunnelIndex(pipeline)
+    batch = read_batch(write_batch(loan_batch(pipeline, 60, 25, seed = 8), tmp_path / 'batch.csv'))
+    frame, delta = apply_delta(pipeline, batch, KeyIndex(pipeline))
+    updated = funnel.apply_delta(frame, delta)
+    for selection in selections:
+        rows = query_rows(frame, selection)
+        assert_matches_pandas(updated.summary(rows), frame.iloc[rows])
+    assert_matches_pandas(updated.summary(np.arange(len(frame))), frame)
+    assert_matches_pandas(funnel.summary(np.arange(len(pipeline))), pipeline)
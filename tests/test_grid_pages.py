@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from baseline import query_rows
+from grid_pages import SORT_COLUMNS, SortIndex
+from ingestion import Delta
+
+PAGE_SIZE = 50
+
+
+@pytest.fixture(scope = 'session')
+def sort_index(pipeline):
+    return SortIndex(pipeline, SORT_COLUMNS)
+
+
+def _values(frame, column, rows):
+    return frame[column].iloc[rows].reset_index(drop = True)
+
+
+# Pages follow pandas' sort of the selected rows, missing values last ascending and first descending
+@pytest.mark.parametrize('column', ['Loan Number', 'Ageing (days)', 'Progress', 'ExpAppraisal1', 'Borrower Intent to Continue Date'])
+@pytest.mark.parametrize('ascending', [True, False])
+def test_pages_match_sort_values(pipeline, selections, sort_index, column, ascending):
+    for selection in selections[:8]:
+        rows = query_rows(pipeline, selection)
+        expected = pipeline.iloc[rows][column].sort_values(ascending = ascending, kind = 'stable', na_position = 'last' if ascending else 'first')
+        page_count = max(1, -(-len(rows) // PAGE_SIZE))
+        for page in sorted({1, (page_count + 1) // 2, page_count}):
+            grid_page = sort_index.page(rows, column, ascending, page, PAGE_SIZE)
+            assert grid_page.total_rows == len(rows)
+            assert grid_page.page_count == page_count
+            start = (page - 1) * PAGE_SIZE
+            pd.testing.assert_series_equal(_values(pipeline, column, grid_page.rows), expected.iloc[start:start + PAGE_SIZE].reset_index(drop = True))
+        if ascending:
+            # Ties keep the frame order
+            np.testing.assert_array_equal(sort_index.page(rows, column, page_size = len(rows) or 1).rows, pipeline.index.get_indexer(expected.index))
+
+
+def test_pages_on_keys_match_sort_values(pipeline, selections, sort_index):
+    keys = np.random.default_rng(3).integers(0, 4, len(pipeline)).astype(np.int8)
+    for selection in selections[:8]:
+        rows = query_rows(pipeline, selection)
+        expected = rows[np.argsort(keys[rows], kind = 'stable')]
+        grid_page = sort_index.page(rows, None, True, 2, PAGE_SIZE, keys = keys)
+        np.testing.assert_array_equal(grid_page.rows, expected[PAGE_SIZE:2 * PAGE_SIZE])
+        grid_page = sort_index.page(rows, None, False, 1, PAGE_SIZE, keys = keys)
+        np.testing.assert_array_equal(keys[grid_page.rows], np.sort(keys[rows])[::-1][:PAGE_SIZE])
+
+
+def test_out_of_range_page_is_clamped(pipeline, sort_index):
+    rows = np.arange(120)
+    assert sort_index.page(rows, 'Loan Number', page = 9, page_size = PAGE_SIZE).page == 3
+    assert sort_index.page(rows[:0], 'Loan Number', page = 0, page_size = PAGE_SIZE).rows.size == 0
+
+
+# Touched rows merged into the ranks land where a fresh sort puts them, including rows moved
+# to or from a missing value and appended rows without a value
+@pytest.mark.parametrize('column', ['Loan Number', 'Ageing (days)', 'ExpAppraisal1', 'Borrower Intent to Continue Date'])
+def test_merged_ranks_match_a_fresh_sort(pipeline, column):
+    rng = np.random.default_rng(5)
+    head = pipeline.iloc[:2000]
+    updated = np.sort(rng.choice(len(head), size = 20, replace = False))
+    appended = head.iloc[rng.choice(len(head), size = 6)]
+    frame = pd.concat([head, appended], ignore_index = True)
+    values = frame[column].copy()
+    # Copies of stored values make ties, with the earlier row ranking first
+    values.iloc[updated] = head[column].iloc[rng.choice(len(head), size = len(updated))].to_numpy()
+    values.iloc[updated[:4]] = None
+    values.iloc[len(head) + np.arange(3)] = None
+    frame[column] = values
+
+    index = SortIndex(head, [column])
+    rows = np.concatenate([updated, len(head) + np.arange(len(appended))])
+    merged = index.apply_delta(frame, Delta(updated, rows[len(updated):], {column}, head.iloc[updated]))
+    fresh = SortIndex(frame, [column])
+    np.testing.assert_array_equal(merged.ranks[column], fresh.ranks[column])
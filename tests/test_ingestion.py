@@ -0,0 +1,206 @@
+import os
+
+import dataset_store
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from baseline import key_metric_counts, query_rows
+from batches import NEW_LOAN_NUMBER, loan_batch, write_batch
+from benchmarks.synthetic_pipeline import generate_pipeline, write_archive
+from data_loader import DELTA_DIR, dataset_version, read_manifest
+from expiration import ExpirationIndex, archive_export_day
+from filter_engine import FilterIndex
+from funnel import FunnelIndex
+from grid_pages import SORT_COLUMNS, SortIndex
+from ingestion import FAILED_DIR, KEY_COLUMN, KeyIndex, apply_delta, read_batch
+from metrics_cube import MetricsCube
+from option_catalog import OptionCatalog
+from question_engine import QuestionEngine
+from serving import create_store
+
+UPDATED = 40
+APPENDED = 25
+# Loans appended with a few columns only (the integer ones cannot be empty), numbered after
+# the fully described ones
+SPARSE_COLUMNS = [KEY_COLUMN, 'Loan Type', 'Progress', 'Loan Processor', 'Expected Time to Complete (minutes)', 'Ageing (days)']
+SPARSE_APPENDED = 10
+QUESTIONS = ['loans per processor', 'cycle time by loan type', 'error rate by closer', 'productivity per month over last 12 months', 'average ageing by milestone']
+
+
+# The batch's loans in the dataset dtypes, as the generator made them before writing the CSV
+def _batch_loans(pipeline, seed):
+    loans = generate_pipeline(UPDATED + APPENDED, seed)
+    loans[KEY_COLUMN] = loan_batch(pipeline, UPDATED, APPENDED, seed)[KEY_COLUMN].to_numpy()
+    # The source format has no Income doc date
+    loans['Income doc date'] = pd.NaT
+    return loans
+
+
+# Rows the batch touches, upserted with plain pandas: present values overwrite the stored ones
+# and new loans go at the end
+def _upserted(frame, loans):
+    positions = pd.Index(frame[KEY_COLUMN]).get_indexer(loans[KEY_COLUMN])
+    known = positions >= 0
+    expected = frame.iloc[positions[known]].astype(object)
+    for column in loans.columns.drop(KEY_COLUMN):
+        values = loans[column][known].astype(object)
+        present = values.notna().to_numpy()
+        expected.iloc[present, expected.columns.get_loc(column)] = values[present].to_numpy()
+    appended = loans[~known].astype(object)
+    appended.index = pd.RangeIndex(len(frame), len(frame) + len(appended))
+    return pd.concat([expected, appended])
+
+
+@pytest.mark.parametrize('seed', [7, 8])
+def test_apply_delta_matches_pandas_upsert(pipeline, tmp_path, seed):
+    loans = _batch_loans(pipeline, seed)
+    batch = read_batch(write_batch(loan_batch(pipeline, UPDATED, APPENDED, seed), tmp_path / 'batch.csv'))
+    key_index = KeyIndex(pipeline)
+    frame, delta = apply_delta(pipeline, batch, key_index)
+
+    expected = _upserted(pipeline, loans)
+    pd.testing.assert_frame_equal(frame.loc[expected.index].astype(object), expected)
+    untouched = np.setdiff1d(np.arange(len(pipeline)), expected.index)
+    # New staff names only add categories
+    assert frame.iloc[untouched].equals(pipeline.iloc[untouched].astype(frame.dtypes.to_dict()))
+    for column in pipeline.columns:
+        assert frame[column].dtype.kind == pipeline[column].dtype.kind
+
+    updated = pd.Index(pipeline[KEY_COLUMN]).get_indexer(loans[KEY_COLUMN][:UPDATED])
+    np.testing.assert_array_equal(delta.updated_rows, np.sort(updated))
+    np.testing.assert_array_equal(delta.appended_rows, np.arange(len(pipeline), len(pipeline) + APPENDED))
+    pd.testing.assert_frame_equal(delta.previous, pipeline.iloc[np.sort(updated)])
+    # The key index takes in the appended loans only once the delta is kept
+    assert key_index.lookup([str(NEW_LOAN_NUMBER)])[0] is None
+    key_index.add(delta)
+    assert key_index.lookup([str(NEW_LOAN_NUMBER)])[0].tolist() == [len(pipeline)]
+
+
+# Appended loans only change the columns they bring a value for
+def test_sparse_append_changes_its_columns(pipeline, tmp_path):
+    batch = _sparse_batch(pipeline)
+    frame, delta = apply_delta(pipeline, read_batch(write_batch(batch, tmp_path / 'batch.csv')), KeyIndex(pipeline))
+    assert delta.columns == set(SPARSE_COLUMNS)
+    assert frame.iloc[len(pipeline):].drop(columns = SPARSE_COLUMNS).isna().all().all()
+
+
+def _sparse_batch(frame):
+    batch = loan_batch(frame, 0, SPARSE_APPENDED, 9)[SPARSE_COLUMNS]
+    batch[KEY_COLUMN] = [str(NEW_LOAN_NUMBER + APPENDED + number) for number in range(SPARSE_APPENDED)]
+    return batch
+
+
+def _paths(pipeline, tmp_path):
+    archive_path = str(tmp_path / 'pipeline.zip')
+    write_archive(pipeline, archive_path)
+    return {'archive_path': archive_path, 'cache_dir': str(tmp_path / 'cache'), 'incoming_dir': str(tmp_path / 'incoming')}
+
+
+def _drop_batches(frame, paths, start = 0):
+    os.makedirs(paths['incoming_dir'], exist_ok = True)
+    batches = [loan_batch(frame, UPDATED, 0, 7), loan_batch(frame, UPDATED, APPENDED, 8), _sparse_batch(frame)]
+    for number, batch in enumerate(batches, start):
+        write_batch(batch, os.path.join(paths['incoming_dir'], 'batch{}.csv'.format(number)))
+
+
+# Every artifact the store keeps up to date through a delta equals the one built on the new frame
+def test_delta_matches_rebuild(pipeline, selections, tmp_path):
+    paths = _paths(pipeline, tmp_path)
+    store = create_store(**paths)
+    store.refresh()
+    _drop_batches(store.snapshot.frame, paths)
+    store.refresh()
+    snapshot = store.snapshot
+    frame = snapshot.frame
+    assert len(frame) == len(pipeline) + APPENDED + SPARSE_APPENDED
+
+    filter_index = FilterIndex(frame)
+    metrics_cube = MetricsCube(frame)
+    funnel = FunnelIndex(frame)
+    for selection in selections:
+        rows = query_rows(frame, selection)
+        np.testing.assert_array_equal(snapshot['filter_index'].select(selection), rows)
+        assert snapshot['filter_index'].reachable(selection) == filter_index.reachable(selection)
+        assert snapshot['metrics_cube'].counts(selection) == metrics_cube.counts(selection) == key_metric_counts(frame.iloc[rows])
+        assert vars(snapshot['funnel'].summary(rows)) == vars(funnel.summary(rows))
+
+    sort_index = SortIndex(frame, SORT_COLUMNS)
+    for column in SORT_COLUMNS:
+        np.testing.assert_array_equal(snapshot['sort_index'].ranks[column], sort_index.ranks[column])
+
+    # Ingested loans do not move the archive's export day
+    assert snapshot['expiration'].exported_on == archive_export_day(pipeline)
+    expiration = ExpirationIndex(frame, archive_export_day(pipeline))
+    for day in ['2021-06-01', '2022-01-15']:
+        np.testing.assert_array_equal(snapshot['expiration'].statuses(day), expiration.statuses(day))
+
+    option_catalog = OptionCatalog(filter_index, frame)
+    assert snapshot['option_catalog'].options == option_catalog.options
+    assert snapshot['option_catalog'].counts == option_catalog.counts
+    assert (snapshot['option_catalog'].min_progress, snapshot['option_catalog'].max_progress) == (option_catalog.min_progress, option_catalog.max_progress)
+
+    question_engine = QuestionEngine(frame)
+    for question in QUESTIONS:
+        answer, expected = snapshot['question_engine'].answer(question), question_engine.answer(question)
+        assert answer.text == expected.text
+        pd.testing.assert_frame_equal(answer.table, expected.table)
+
+    # A process starting later replays the recorded deltas onto the same frame
+    replayed = create_store(**paths)
+    replayed.refresh()
+    assert replayed.snapshot.version == snapshot.version
+    assert replayed.snapshot.frame.equals(frame)
+
+
+# Folding the log into the dataset file leaves the frame and the version as they were
+def test_compacted_log_loads_the_same_frame(pipeline, tmp_path):
+    paths = _paths(pipeline, tmp_path)
+    store = create_store(compact_after = 2, **paths)
+    store.refresh()
+    _drop_batches(store.snapshot.frame, paths)
+    store.refresh()
+    manifest = read_manifest(paths['cache_dir'])
+    assert (manifest['compacted'], manifest['deltas']) == (2, ['000003.arrow'])
+    assert os.listdir(os.path.join(paths['cache_dir'], DELTA_DIR)) == ['000003.arrow']
+
+    started = create_store(**paths)
+    started.refresh()
+    assert started.snapshot.version == store.snapshot.version
+    assert started.snapshot.frame.equals(store.snapshot.frame)
+
+    # A process that applied fewer deltas than were compacted reloads
+    behind = create_store(**paths)
+    behind.refresh()
+    _drop_batches(behind.snapshot.frame, paths, start = 3)
+    store.refresh()
+    manifest = read_manifest(paths['cache_dir'])
+    assert (manifest['compacted'], manifest['deltas']) == (6, [])
+    behind.refresh()
+    assert behind.snapshot.version == store.snapshot.version == dataset_version(manifest, 6)
+    assert behind.snapshot.frame.equals(store.snapshot.frame)
+
+
+# A batch that fails to reach the log leaves the live dataset and its key index as they were
+def test_failed_write_leaves_the_key_index(pipeline, tmp_path, monkeypatch):
+    paths = _paths(pipeline, tmp_path)
+    store = create_store(**paths)
+    store.refresh()
+    before = store.snapshot
+
+    def fail(batch, cache_dir):
+        raise pa.ArrowInvalid('cannot write the batch')
+    monkeypatch.setattr(dataset_store, 'write_delta', fail)
+    _drop_batches(store.snapshot.frame, paths)
+    store.refresh()
+    assert store.snapshot is before
+    assert store._key_index.lookup([str(NEW_LOAN_NUMBER)]) == [None]
+    assert len(os.listdir(os.path.join(paths['incoming_dir'], FAILED_DIR))) == 3
+
+    # Dropped again, the new loans are appended once
+    monkeypatch.undo()
+    _drop_batches(store.snapshot.frame, paths)
+    store.refresh()
+    assert len(store.snapshot.frame) == len(pipeline) + APPENDED + SPARSE_APPENDED
+    assert store._key_index.lookup([str(NEW_LOAN_NUMBER)])[0].tolist() == [len(pipeline)]
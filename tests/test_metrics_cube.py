@@ -0,0 +1,29 @@
+import pytest
+
+from baseline import key_metric_counts, query_rows
+from batches import loan_batch, write_batch
+from ingestion import KeyIndex, apply_delta, read_batch
+from metrics_cube import MetricsCube
+
+
+def test_counts_match_filtered_frame(pipeline, selections):
+    cube = MetricsCube(pipeline)
+    for selection in selections:
+        assert cube.counts(selection) == key_metric_counts(pipeline.iloc[query_rows(pipeline, selection)])
+
+
+# Seed 7 updates loans with the staff and values the cube already has, so the cells are patched;
+# seed 8 brings new staff names, so the cube is rebuilt
+@pytest.mark.parametrize('seed, appended', [(7, 0), (8, 25)])
+def test_counts_after_delta_match_filtered_frame(pipeline, selections, tmp_path, seed, appended):
+    cube = MetricsCube(pipeline)
+    batch = read_batch(write_batch(loan_batch(pipeline, 60, appended, seed), tmp_path / 'batch.csv'))
+    frame, delta = apply_delta(pipeline, batch, KeyIndex(pipeline))
+    patched = (cube._row_codes(frame.iloc[delta.rows]) >= 0).all()
+    assert patched == (seed == 7)
+
+    updated = cube.apply_delta(frame, delta)
+    for selection in selections:
+        assert updated.counts(selection) == key_metric_counts(frame.iloc[query_rows(frame, selection)])
+    # The previous version keeps answering for sessions still reading it
+    assert cube.counts(selections[0]) == key_metric_counts(pipeline)
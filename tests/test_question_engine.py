@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from question_engine import QuestionEngine
+
+
+@pytest.fixture(scope = 'module')
+def engine(pipeline):
+    return QuestionEngine(pipeline)
+
+
+def _months(dates):
+    return dates.dt.to_period('M')
+
+
+def test_loans_per_group_is_volume(engine, pipeline):
+    answer = engine.answer('loans per closer')
+    assert answer.query == 'volume'
+    expected = pipeline['Loan Closer'].value_counts()
+    table = answer.table.set_index('Loan Closer')['loans']
+    assert table.to_dict() == {name: count for name, count in expected.items() if count > 0}
+
+
+def test_named_value_narrows_any_dimension(engine, pipeline):
+    processor = pipeline['Loan Processor'].iloc[0]
+    answer = engine.answer('error rate of {} by loan type'.format(processor))
+    assert answer.query == 'error_rate'
+    assert 'Narrowed to loan processor {}'.format(processor) in answer.text
+    loans = pipeline[pipeline['Loan Processor'] == processor]
+    expected = (loans['Application Status'] == 'Error').groupby(loans['Loan Type'], observed = True).mean()
+    table = answer.table.set_index('Loan Type')['error_rate']
+    pd.testing.assert_series_equal(table.sort_index(), expected.rename('error_rate').rename_axis('Loan Type').sort_index(), check_index_type = False, check_categorical = False)
+
+
+def test_month_window_applies_to_every_dimension(engine, pipeline):
+    answer = engine.answer('ageing per processor over last 4 months')
+    months = _months(pipeline['GFE Application Date'])
+    loans = pipeline[months > months.max() - 4]
+    expected = loans.groupby('Loan Processor', observed = True)['Ageing (days)'].mean()
+    table = answer.table.set_index('Loan Processor')['ageing_days']
+    assert np.allclose(table.sort_index().to_numpy(), expected.sort_index().to_numpy())
+    assert 'last 4 months' in answer.text
+
+
+def test_answer_covers_the_sidebar_selection(engine, pipeline):
+    rows = np.flatnonzero((pipeline['Loan Type'] == pipeline['Loan Type'].iloc[0]).to_numpy())
+    answer = engine.answer('how many loans are in the pipeline', rows)
+    assert answer.table['loans'].sum() == len(rows)
+    assert 'Covers the {:,} loans selected in the sidebar.'.format(len(rows)) in answer.text
+    assert 'Covers the whole pipeline.' in engine.answer('how many loans are in the pipeline').text
+
+
+def test_unmatched_value_is_reported(engine, pipeline):
+    processor = pipeline['Loan Processor'].iloc[0]
+    rows = np.flatnonzero((pipeline['Loan Processor'] != processor).to_numpy())
+    answer = engine.answer('productivity of {}'.format(processor), rows)
+    assert answer.table.empty
+    assert '{} has no loans among the loans selected in the sidebar.'.format(processor) in answer.text
+
+
+def test_productivity_counts_clearings_and_submittals_per_month(engine, pipeline):
+    answer = engine.answer('productivity per month over last 6 months')
+    cleared = _months(pipeline['Milestone Date - Clear To Close'])
+    submitted = _months(pipeline['Milestone Date - Submittal'])
+    latest = cleared.max()
+    table = answer.table.set_index('Month')
+    for month in pd.period_range(latest - 5, latest, freq = 'M'):
+        label = month.strftime("%b'%y")
+        assert table.loc[label, 'cleared'] == (cleared == month).sum()
+        assert table.loc[label, 'submitted'] == (submitted == month).sum()
+
+
+# Loans cleared to close each month has to tell months apart on the real pipeline
+def test_productivity_varies_on_the_shipped_data(shipped_pipeline):
+    answer = QuestionEngine(shipped_pipeline).answer('productivity per month over last 12 months')
+    assert answer.table['productivity'].nunique() > 1
+    assert answer.table['clearance_rate'].std() > 0.01
+
+
+# A loan cleared to close before its submittal has a wrong date; it is left out of the cycle
+# time instead of pulling the average down
+def test_negative_cycle_times_are_left_out(pipeline):
+    frame = pipeline.copy()
+    cycled = frame['Milestone Date - Clear To Close'].notna() & frame['Milestone Date - Submittal'].notna()
+    wrong = np.flatnonzero(cycled.to_numpy())[:200]
+    frame.iloc[wrong, frame.columns.get_loc('Milestone Date - Clear To Close')] = frame['Milestone Date - Submittal'].iloc[wrong] - pd.Timedelta(days = 30)
+    answer = QuestionEngine(frame).answer('cycle time by loan type')
+
+    days = (frame['Milestone Date - Clear To Close'] - frame['Milestone Date - Submittal']).dt.days
+    expected = days[days >= 0].groupby(frame['Loan Type'], observed = True).mean()
+    table = answer.table.set_index('Loan Type')['cycle_days']
+    assert np.allclose(table.sort_index().to_numpy(), expected.sort_index().to_numpy())
+    assert (table > 0).all()
+
+
+# Phrasings of one query over the same keyed selection share a grouped table
+def test_grouped_tables_are_cached_per_selection(pipeline):
+    engine = QuestionEngine(pipeline)
+    rows = np.flatnonzero((pipeline['Loan Type'] == pipeline['Loan Type'].iloc[0]).to_numpy())
+    first = engine.answer('loans per processor', rows, 'selection')
+    calls = []
+    loans = engine._loans
+    engine._loans = lambda *args: calls.append(args) or loans(*args)
+    again = engine.answer('number of loans each processor handles', rows, 'selection')
+    assert calls == []
+    pd.testing.assert_frame_equal(again.table, first.table)
+
+    # A table of other rows, or of rows without a key, is worked out
+    other = engine.answer('loans per processor', rows[:100], 'other selection')
+    assert other.table['loans'].sum() == 100
+    engine.answer('loans per processor', rows)
+    assert len(calls) == 2
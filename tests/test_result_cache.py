@@ -0,0 +1,55 @@
+import numpy as np
+
+from baseline import key_metric_counts, query_rows
+from batches import loan_batch, write_batch
+from ingestion import KeyIndex, apply_delta, read_batch
+from result_cache import FilterResult, ResultCache, selection_key
+
+
+def _result(frame, selection, version):
+    rows = query_rows(frame, selection)
+    return FilterResult(version, selection, rows, key_metric_counts(frame.iloc[rows]), None, None, None)
+
+
+def _cached(frame, selections, version):
+    cache = ResultCache()
+    for selection in selections:
+        cache.put(selection_key(version, selection), _result(frame, selection, version))
+    return cache
+
+
+# Results no updated loan enters or leaves move to the new version unchanged and still hold
+def test_carried_results_match_the_new_version(pipeline, selections, tmp_path):
+    batch = read_batch(write_batch(loan_batch(pipeline, 30, 0, seed = 7), tmp_path / 'batch.csv'))
+    frame, delta = apply_delta(pipeline, batch, KeyIndex(pipeline))
+    cache = _cached(pipeline, selections, 'old')
+    cache.carry_forward('old', 'new', delta, frame.iloc[delta.rows])
+
+    carried = 0
+    for selection in selections:
+        assert cache.peek(selection_key('old', selection)) is None
+        result = cache.peek(selection_key('new', selection))
+        touched = selection.matches(delta.previous).any() or selection.matches(frame.iloc[delta.rows]).any()
+        assert (result is None) == touched
+        if result is not None:
+            carried += 1
+            expected = _result(frame, selection, 'new')
+            np.testing.assert_array_equal(result.rows, expected.rows)
+            assert result.metrics == expected.metrics
+    assert 0 < carried < len(selections)
+
+
+def test_reload_drops_every_result(pipeline, selections):
+    cache = _cached(pipeline, selections, 'old')
+    cache.carry_forward('old', 'new')
+    assert cache.stats()['entries'] == 0
+
+
+def test_budget_evicts_least_recently_used(pipeline, selections):
+    result = _result(pipeline, selections[0], 'v')
+    cache = ResultCache(max_bytes = 3 * result.nbytes())
+    for selection in selections[:4]:
+        cache.put(selection_key('v', selection), result)
+    assert cache.peek(selection_key('v', selections[0])) is None
+    assert all(cache.peek(selection_key('v', selection)) is not None for selection in selections[1:4])
+    assert cache.stats()['evictions'] == 1
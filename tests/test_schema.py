@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic_pipeline import to_source_format
+from schema import DOCUMENT_STATUS_DTYPE, SchemaError, apply_schema, downcast_integers, parse_dates, schema_dtypes, validate_schema
+
+
+@pytest.fixture(scope = 'module')
+def source(pipeline):
+    return to_source_format(pipeline.iloc[:2000])
+
+
+# The source's strings, long and short dates and int64 columns come out in the schema dtypes,
+# holding the values the generator started from
+def test_apply_schema_maps_every_dtype(pipeline, source):
+    frame = apply_schema(source)
+    validate_schema(frame)
+    for column, dtype in schema_dtypes().items():
+        if dtype == 'category':
+            assert isinstance(frame[column].dtype, pd.CategoricalDtype)
+        else:
+            assert frame[column].dtype == dtype
+    assert frame['ExpAppraisal'].dtype == DOCUMENT_STATUS_DTYPE
+    expected = pipeline.iloc[:2000]
+    assert frame.astype(object).equals(expected.astype(object))
+
+
+def test_integers_are_downcast(source):
+    frame = apply_schema(source)
+    assert source['Progress'].dtype == np.int64
+    assert (frame['Progress'].dtype, frame['Ageing (days)'].dtype) == (np.int8, np.int16)
+    assert frame['Progress'].memory_usage(index = False) * 8 == source['Progress'].memory_usage(index = False)
+
+
+@pytest.mark.parametrize('values, message', [([1, 200], 'Progress does not fit int8'), ([1.0, np.nan], 'Progress has missing values')])
+def test_downcast_refuses_what_does_not_fit(values, message):
+    with pytest.raises(SchemaError, match = message):
+        downcast_integers(pd.Series(values), 'Progress', np.int8)
+
+
+def test_dates_parse_in_every_format():
+    dates = parse_dates(pd.Series(['Friday, July 3, 2020', '5/19/2020', '2021-04-15', 'NaT', None]), 'Milestone Date - Submittal')
+    expected = pd.Series(pd.to_datetime(['2020-07-03', '2020-05-19', '2021-04-15', None, None]))
+    pd.testing.assert_series_equal(dates, expected)
+    with pytest.raises(SchemaError, match = "Milestone Date - Submittal has 1 unparseable dates, e.g. '19.05.2020'"):
+        parse_dates(pd.Series(['5/19/2020', '19.05.2020']), 'Milestone Date - Submittal')
+
+
+def test_apply_schema_refuses_unknown_statuses_and_missing_columns(source):
+    unknown = source.assign(ExpAppraisal = source['ExpAppraisal'].where(source.index != 3, 'Lost'))
+    with pytest.raises(SchemaError, match = 'ExpAppraisal has unknown statuses: Lost'):
+        apply_schema(unknown)
+    with pytest.raises(SchemaError, match = 'Missing columns: Progress'):
+        apply_schema(source.drop(columns = 'Progress'))
+
+
+# Every mismatch is listed in one error
+def test_validate_schema_lists_missing_columns_and_wrong_dtypes(source):
+    frame = apply_schema(source)
+    broken = frame.drop(columns = 'Loan Closer').assign(**{
+        'Progress': frame['Progress'].astype(np.int64),
+        'Loan Type': frame['Loan Type'].astype(object),
+        'GFE Application Date': frame['GFE Application Date'].dt.strftime('%m/%d/%Y'),
+    })
+    with pytest.raises(SchemaError) as error:
+        validate_schema(broken)
+    assert str(error.value).split('; ') == [
+        'Loan Closer is missing',
+        'Loan Type is object, expected category',
+        'GFE Application Date is object, expected datetime64',
+        'Progress is int64, expected int8',
+    ]
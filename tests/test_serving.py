@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from batches import NEW_LOAN_NUMBER, loan_batch, write_batch
+from benchmarks.synthetic_pipeline import write_archive
+from grid_pages import SORT_COLUMNS
+from serving import CURRENT_FILE, KEEP_VERSIONS, SharedDatasetReader, create_store, publish
+
+QUESTIONS = ['loans per processor', 'cycle time by loan type', 'productivity per month over last 12 months']
+
+
+@pytest.fixture
+def store(pipeline, tmp_path):
+    archive_path = str(tmp_path / 'pipeline.zip')
+    write_archive(pipeline, archive_path)
+    store = create_store(archive_path = archive_path, cache_dir = str(tmp_path / 'cache'), incoming_dir = str(tmp_path / 'incoming'))
+    store.add_listener(lambda previous, snapshot, delta: publish(snapshot, str(tmp_path / 'shared')))
+    store.refresh()
+    return store
+
+
+def _ingest(store, seed):
+    os.makedirs(store.incoming_dir, exist_ok = True)
+    write_batch(loan_batch(store.snapshot.frame, 40, 5, seed), os.path.join(store.incoming_dir, 'batch{}.csv'.format(seed)))
+    store.refresh()
+
+
+# A worker attaches to the frame and every artifact as published, with the numeric arrays
+# read-only views of the shared file
+def test_attached_snapshot_matches_the_published_one(store, selections, tmp_path):
+    published = store.snapshot
+    attached = SharedDatasetReader(str(tmp_path / 'shared')).refresh()
+    assert attached.version == published.version
+    assert attached.frame.equals(published.frame)
+    assert not attached.frame['Progress'].to_numpy().flags.writeable
+
+    for selection in selections:
+        rows = published['filter_index'].select(selection)
+        np.testing.assert_array_equal(attached['filter_index'].select(selection), rows)
+        assert attached['filter_index'].reachable(selection) == published['filter_index'].reachable(selection)
+        assert attached['metrics_cube'].counts(selection) == published['metrics_cube'].counts(selection)
+        assert vars(attached['funnel'].summary(rows)) == vars(published['funnel'].summary(rows))
+    for column in SORT_COLUMNS:
+        np.testing.assert_array_equal(attached['sort_index'].ranks[column], published['sort_index'].ranks[column])
+        assert not attached['sort_index'].ranks[column].flags.writeable
+    for day in ['2021-06-01', '2022-01-15']:
+        np.testing.assert_array_equal(attached['expiration'].statuses(day), published['expiration'].statuses(day))
+    assert attached['option_catalog'].options == published['option_catalog'].options
+    for question in QUESTIONS:
+        answer, expected = attached['question_engine'].answer(question), published['question_engine'].answer(question)
+        assert answer.text == expected.text
+        pd.testing.assert_frame_equal(answer.table, expected.table)
+
+
+# After an ingest a worker moves to the new version on its next refresh, while sessions still
+# holding the previous one keep reading it after its folder is removed
+def test_worker_picks_up_the_version_after_an_ingest(store, tmp_path):
+    shared_dir = str(tmp_path / 'shared')
+    reader = SharedDatasetReader(shared_dir)
+    notified = []
+    reader.add_listener(lambda previous, snapshot, delta: notified.append((previous, snapshot)))
+    stale = reader.refresh()
+    assert reader.refresh() is stale and len(notified) == 1
+    stale_frame = stale.frame.copy()
+    stale_ranks = stale['sort_index'].ranks['Progress'].copy()
+
+    for seed in [7, 8, 9]:
+        _ingest(store, seed)
+    with open(os.path.join(shared_dir, CURRENT_FILE)) as current_file:
+        assert current_file.read() == store.snapshot.version
+    assert not os.path.exists(os.path.join(shared_dir, stale.version))
+    assert len(os.listdir(shared_dir)) == KEEP_VERSIONS + 1
+
+    current = reader.refresh()
+    assert current.version == store.snapshot.version != stale.version
+    assert current.frame.equals(store.snapshot.frame)
+    assert str(NEW_LOAN_NUMBER) in set(current.frame['Loan Number'])
+    assert notified[-1] == (stale, current)
+    assert stale.frame.equals(stale_frame)
+    np.testing.assert_array_equal(stale['sort_index'].ranks['Progress'], stale_ranks)
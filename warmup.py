@@ -0,0 +1,108 @@
+import time
+
+# Process start, before any of the heavy imports below
+STARTED = time.perf_counter()
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import sys
+import threading
+from datetime import datetime, timezone
+
+import app_resources
+from advisor_queues import processor_selections
+from app_resources import get_advisor_scheduler, get_dataset_store
+from data_loader import CACHE_DIR
+from instrumentation import max_rss_bytes
+from result_cache import selection_key
+from serving import DatasetNotPublished
+
+IMPORTED = time.perf_counter()
+
+# Entry point of the dashboard: python warmup.py [streamlit run options] starts the server and
+# meanwhile imports the page's modules, loads the dataset and precomputes the processor queues
+# in the server process, so the first session after a deploy finds them ready. A plain
+# streamlit run of loan_pipeline.py leaves all of it to the first session (and logs so).
+# python warmup.py --check only warms up, prints the report and exits.
+APP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'loan_pipeline.py')
+
+# Modules the page imports besides the ones above, imported here so the first session finds them loaded
+PAGE_MODULES = ['st_aggrid', 'numerize.numerize']
+
+# Every warm-up appends its timings here, one JSON object per line, to follow cold starts as the data grows
+STARTUP_REPORT = os.environ.get('LOAN_PIPELINE_STARTUP_REPORT', os.path.join(CACHE_DIR, 'startup.jsonl'))
+
+logger = logging.getLogger(__name__)
+
+
+def _append_report(report, report_path):
+    directory = os.path.dirname(report_path)
+    if directory:
+        os.makedirs(directory, exist_ok = True)
+    with open(report_path, 'a') as report_file:
+        report_file.write(json.dumps(report) + '\n')
+
+
+# Create the shared resources the page reads and time each stage, from process start
+def warm_up(report_path = STARTUP_REPORT):
+    stages = {'import': IMPORTED - STARTED}
+
+    started = time.perf_counter()
+    for module in PAGE_MODULES:
+        importlib.import_module(module)
+    stages['page_modules'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    snapshot = get_dataset_store().refresh()
+    stages['load_dataset'] = time.perf_counter() - started
+
+    # Processor default selections are what fresh sessions open with
+    started = time.perf_counter()
+    advisor_scheduler = get_advisor_scheduler()
+    advisor_scheduler.ensure_current(snapshot)
+    for selection in processor_selections(snapshot['option_catalog']):
+        advisor_scheduler.wait(selection_key(snapshot.version, selection))
+    stages['advisor_queues'] = time.perf_counter() - started
+
+    report = {
+        'finished_at': datetime.now(timezone.utc).isoformat(timespec = 'seconds'),
+        'version': snapshot.version,
+        'rows': len(snapshot.frame),
+        'stages': stages,
+        'total_seconds': time.perf_counter() - STARTED,
+        'max_rss_bytes': max_rss_bytes(),
+    }
+    if report_path:
+        _append_report(report, report_path)
+    logger.info('Warmed up %s loans in %.1f s (%s)', report['rows'], report['total_seconds'], ', '.join('{} {:.1f} s'.format(stage, seconds) for stage, seconds in stages.items()))
+    return report
+
+
+def _warm_up_in_background(report_path):
+    try:
+        warm_up(report_path)
+    except DatasetNotPublished as error:
+        logger.warning('Skipped the warm-up: %s', error)
+    except Exception:
+        logger.exception('Warm-up failed; the first session loads the dataset instead')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Start the loan pipeline dashboard with its dataset and processor queues preloaded')
+    parser.add_argument('--check', action = 'store_true', help = 'warm up, print the startup report and exit without starting the server')
+    parser.add_argument('--report', default = STARTUP_REPORT, help = 'file the startup report is appended to')
+    args, streamlit_args = parser.parse_known_args()
+    logging.basicConfig(level = logging.INFO, format = '%(asctime)s %(levelname)s %(message)s')
+    if args.check:
+        print(json.dumps(warm_up(args.report), indent = 2))
+        sys.exit(0)
+
+    from streamlit.web import cli
+
+    app_resources.started_by_warmup = True
+    threading.Thread(target = _warm_up_in_background, args = (args.report,), name = 'warm-up', daemon = True).start()
+    sys.argv = ['streamlit', 'run', APP_SCRIPT] + streamlit_args
+    sys.exit(cli.main())